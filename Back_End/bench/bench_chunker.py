@@ -0,0 +1,163 @@
+"""
+Benchmark flask_app.chunker against the original chunk_text.
+
+    python -m bench.bench_chunker --megabytes 1 4 --fuzz 2000
+
+First checks on randomized inputs that compatibility mode reproduces the
+legacy chunk boundaries exactly, then times both on multi-megabyte texts.
+"""
+import argparse
+import random
+import re
+import time
+
+from flask_app.chunker import iter_chunks
+
+WORDS = (
+    "the customer account billing invoice refund policy shipping order warranty "
+    "support ticket escalation renewal subscription contract onboarding a of to "
+    "integration dashboard report analytics export password security login"
+).split()
+PUNCTUATION = ["", "", "", "", ",", ".", ".", "!", "?", "...", ".)"]
+WHITESPACE = [" ", " ", " ", "  ", "\n", "\n\n", "\t", " ", " \n \n "]
+
+
+def legacy_chunk_text(text, chunk_size=500, overlap=100):
+    """The chunk_text implementation chunker.iter_chunks replaced (logging removed)."""
+    text = re.sub(r'\s+', ' ', text)
+    text = text.strip()
+    if not text:
+        return []
+    sentences = re.split(r'(?<=[.!?])\s+', text)
+    chunks = []
+    current_chunk = []
+    current_word_count = 0
+    for sentence in sentences:
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        sentence_words = sentence.split()
+        sentence_word_count = len(sentence_words)
+        if current_word_count + sentence_word_count > chunk_size and current_chunk:
+            chunk_text = ' '.join(current_chunk)
+            if len(chunk_text.strip()) > 50:
+                chunks.append(chunk_text.strip())
+            overlap_words = []
+            if overlap > 0:
+                for sent in reversed(current_chunk):
+                    sent_words = sent.split()
+                    if len(overlap_words) + len(sent_words) <= overlap:
+                        overlap_words = sent_words + overlap_words
+                    else:
+                        break
+            current_chunk = overlap_words + [sentence]
+            current_word_count = len(overlap_words) + sentence_word_count
+        else:
+            current_chunk.append(sentence)
+            current_word_count += sentence_word_count
+    if current_chunk:
+        chunk_text = ' '.join(current_chunk)
+        if len(chunk_text.strip()) > 50:
+            chunks.append(chunk_text.strip())
+    if len(chunks) < 2:
+        paragraphs = text.split('\n\n')
+        chunks = []
+        current_chunk = []
+        current_word_count = 0
+        for paragraph in paragraphs:
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            para_words = paragraph.split()
+            para_word_count = len(para_words)
+            if current_word_count + para_word_count > chunk_size and current_chunk:
+                chunk_text = ' '.join(current_chunk)
+                if len(chunk_text.strip()) > 50:
+                    chunks.append(chunk_text.strip())
+                overlap_words = []
+                if overlap > 0:
+                    for para in reversed(current_chunk):
+                        para_words = para.split()
+                        if len(overlap_words) + len(para_words) <= overlap:
+                            overlap_words = para_words + overlap_words
+                        else:
+                            break
+                current_chunk = overlap_words + [paragraph]
+                current_word_count = len(overlap_words) + para_word_count
+            else:
+                current_chunk.append(paragraph)
+                current_word_count += para_word_count
+        if current_chunk:
+            chunk_text = ' '.join(current_chunk)
+            if len(chunk_text.strip()) > 50:
+                chunks.append(chunk_text.strip())
+    return chunks
+
+
+def random_text(rng, words, max_sentence=40):
+    parts = []
+    remaining = words
+    while remaining > 0:
+        length = min(remaining, rng.randint(1, max_sentence))
+        remaining -= length
+        sentence = []
+        for i in range(length):
+            word = rng.choice(WORDS)
+            if i == length - 1:
+                word += rng.choice(PUNCTUATION)
+            sentence.append(word)
+        parts.append(" ".join(sentence))
+        parts.append(rng.choice(WHITESPACE))
+    return "".join(parts)
+
+
+def pieces_of(text, rng):
+    """Split text at random points, as a streaming source would deliver it."""
+    cuts = sorted(rng.sample(range(len(text) + 1), min(len(text), 5)))
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+
+def check_compat(rounds, seed):
+    rng = random.Random(seed)
+    for round_ in range(rounds):
+        text = random_text(rng, rng.randint(0, 1500), max_sentence=rng.choice([5, 40, 300]))
+        chunk_size = rng.choice([20, 50, 100, 500])
+        overlap = rng.choice([0, 5, 10, chunk_size // 5, chunk_size])
+        expected = legacy_chunk_text(text, chunk_size, overlap)
+        for source in (text, pieces_of(text, rng)):
+            chunks = list(iter_chunks(source, chunk_size, overlap, compat=True))
+            got = [chunk["text"] for chunk in chunks]
+            assert got == expected, f"round {round_}: boundaries differ (size={chunk_size}, overlap={overlap})"
+            for chunk in chunks:
+                original = text[chunk["start"]:chunk["end"]]
+                assert " ".join(original.split()) == chunk["text"], f"round {round_}: offsets do not match text"
+    print(f"compat: {rounds} randomized inputs match the legacy chunker")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--megabytes", type=float, nargs="+", default=[1, 4])
+    parser.add_argument("--fuzz", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    check_compat(args.fuzz, args.seed)
+
+    rng = random.Random(args.seed)
+    print(f"{'MB':>5} {'impl':<10} {'seconds':>9} {'MB/s':>8} {'chunks':>7}")
+    for megabytes in args.megabytes:
+        text = random_text(rng, int(megabytes * 1024 * 1024 / 7))
+        size = len(text) / (1024 * 1024)
+        for label, run in (
+            ("legacy", lambda: legacy_chunk_text(text)),
+            ("compat", lambda: list(iter_chunks(text, compat=True))),
+            ("default", lambda: list(iter_chunks(text))),
+        ):
+            start = time.perf_counter()
+            chunks = run()
+            elapsed = time.perf_counter() - start
+            print(f"{size:>5.1f} {label:<10} {elapsed:>9.3f} {size / elapsed:>8.2f} {len(chunks):>7}")
+
+
+if __name__ == "__main__":
+    main()
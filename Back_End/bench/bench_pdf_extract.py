@@ -0,0 +1,128 @@
+"""
+Benchmark PDF text extraction on synthetic multi-hundred-page PDFs.
+
+    python -m bench.bench_pdf_extract --pages 200 500 --workers 4
+
+Compares the old serial extractor (string concatenation over every page)
+with flask_app.pdf_extract, serially and on the process pool, and reports
+total time plus time until the first page is available to the chunker.
+"""
+import argparse
+import os
+import random
+import re
+import tempfile
+import time
+
+import PyPDF2
+
+from flask_app.pdf_extract import extract_pdf_text, iter_pdf_pages
+
+WORDS = (
+    "customer account billing invoice refund policy shipping order warranty "
+    "support ticket escalation renewal subscription contract onboarding "
+    "integration dashboard report analytics export password security login"
+).split()
+
+
+def make_synthetic_pdf(path, pages, lines_per_page=45, seed=0):
+    """Write a minimal valid PDF with `pages` pages of pseudo-random text lines."""
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for page in range(pages):
+        lines = [f"Page {page + 1}."] + [
+            " ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(lines_per_page)
+        ]
+        ops = ["BT", "/F1 10 Tf", "12 TL", "50 770 Td"]
+        ops.extend(f"({line}) '" for line in lines)
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        page_refs.append(len(objects))
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def legacy_extract_text_from_pdf(file_stream):
+    """The extractor this module replaced, kept here as the baseline."""
+    reader = PyPDF2.PdfReader(file_stream)
+    text = ""
+    for page in reader.pages:
+        page_text = page.extract_text() or ""
+        page_text = re.sub(r'\s+', ' ', page_text)
+        page_text = page_text.strip()
+        if page_text:
+            text += page_text + "\n\n"
+    return text.strip()
+
+
+def time_first_page(path, workers):
+    start = time.perf_counter()
+    pages = iter_pdf_pages(path, workers=workers)
+    next(pages)
+    elapsed = time.perf_counter() - start
+    pages.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[200, 500])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    # Warm the pool so process start-up is not charged to the first run
+    with tempfile.TemporaryDirectory() as tmp:
+        warm = os.path.join(tmp, "warm.pdf")
+        make_synthetic_pdf(warm, 100)
+        extract_pdf_text(warm, workers=args.workers)
+
+        print(f"{'pages':>6} {'impl':<16} {'total s':>9} {'first page s':>13} {'pages/s':>9}")
+        for pages in args.pages:
+            path = os.path.join(tmp, f"synthetic_{pages}.pdf")
+            make_synthetic_pdf(path, pages)
+
+            with open(path, "rb") as f:
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    f.seek(0)
+                    baseline = legacy_extract_text_from_pdf(f)
+                legacy_time = (time.perf_counter() - start) / args.repeat
+            print(f"{pages:>6} {'legacy':<16} {legacy_time:>9.3f} {'-':>13} {pages / legacy_time:>9.1f}")
+
+            for label, workers in (("serial", 1), (f"pool x{args.workers}", args.workers)):
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    text, page_offsets = extract_pdf_text(path, workers=workers)
+                total = (time.perf_counter() - start) / args.repeat
+                assert text == baseline, f"{label} output differs from the legacy extractor"
+                assert len(page_offsets) == pages
+                first = time_first_page(path, workers)
+                print(f"{pages:>6} {label:<16} {total:>9.3f} {first:>13.3f} {pages / total:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Local stand-in for the OpenAI embeddings and chat completions APIs, for
+exercising the upload and chat pipelines offline.
+
+    python bench/fake_openai.py --port 8765
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake flask --app "flask_app.app:create_app()" run
+
+Embeddings are deterministic hashed bag-of-words vectors, so texts sharing
+words are close in cosine space and semantic search still behaves sensibly.
+Chat completions return a canned answer, streamed word by word when
+`stream` is set.
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+
+from flask import Flask, Response, request, jsonify
+
+DIMENSIONS = 1536
+
+app = Flask(__name__)
+app.config.update(
+    LATENCY_MS=0,
+    COMPLETION_LATENCY_MS=None,
+    FAIL_RATE=0.0,
+    RATE_LIMIT_RATE=0.0,
+    MAX_INPUTS=2048,
+)
+
+_stats_lock = threading.Lock()
+stats = {"embedding_requests": 0, "embedding_inputs": 0, "chat_requests": 0, "rate_limited": 0}
+
+
+def fake_embedding(text, dimensions=DIMENSIONS):
+    vector = [0.0] * dimensions
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.sha256(word.encode("utf-8")).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dimensions
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def _error(message, status, error_type, headers=None):
+    return jsonify({"error": {"message": message, "type": error_type, "code": None}}), status, headers or {}
+
+
+def _simulated_failure():
+    """Return an error response for a simulated failure, or None to serve the request."""
+    if app.config["RATE_LIMIT_RATE"] and random.random() < app.config["RATE_LIMIT_RATE"]:
+        with _stats_lock:
+            stats["rate_limited"] += 1
+        return _error("Rate limit reached.", 429, "rate_limit_error", {"retry-after": "0.1"})
+    if app.config["FAIL_RATE"] and random.random() < app.config["FAIL_RATE"]:
+        return _error("Simulated server error.", 500, "server_error")
+    return None
+
+
+@app.route("/v1/embeddings", methods=["POST"])
+def create_embeddings():
+    data = request.get_json(force=True)
+    inputs = data.get("input")
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    if not inputs or any(not isinstance(text, str) or not text for text in inputs):
+        return _error("'input' must be a non-empty string or list of non-empty strings.", 400, "invalid_request_error")
+    if len(inputs) > app.config["MAX_INPUTS"]:
+        return _error(f"Too many inputs: {len(inputs)} > {app.config['MAX_INPUTS']}.", 400, "invalid_request_error")
+
+    if app.config["LATENCY_MS"]:
+        time.sleep(app.config["LATENCY_MS"] / 1000.0)
+    failure = _simulated_failure()
+    if failure:
+        return failure
+
+    with _stats_lock:
+        stats["embedding_requests"] += 1
+        stats["embedding_inputs"] += len(inputs)
+
+    dimensions = int(data.get("dimensions") or DIMENSIONS)
+    tokens = sum(len(text) // 4 for text in inputs)
+    return jsonify({
+        "object": "list",
+        "model": data.get("model", "text-embedding-3-small"),
+        "data": [
+            {"object": "embedding", "index": idx, "embedding": fake_embedding(text, dimensions)}
+            for idx, text in enumerate(inputs)
+        ],
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    })
+
+
+def fake_answer(messages):
+    prompt = " ".join(str(message.get("content", "")) for message in messages)
+    words = re.findall(r"\w+", prompt)
+    return f"This is a simulated answer based on a prompt of {len(words)} words. " + " ".join(words[-20:])
+
+
+def _completion_chunk(completion_id, model, delta, finish_reason=None):
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+@app.route("/v1/chat/completions", methods=["POST"])
+def create_chat_completion():
+    data = request.get_json(force=True)
+    messages = data.get("messages") or []
+    model = data.get("model", "gpt-4o-mini")
+    failure = _simulated_failure()
+    if failure:
+        return failure
+    with _stats_lock:
+        stats["chat_requests"] += 1
+
+    answer = fake_answer(messages)
+    completion_id = f"chatcmpl-fake-{random.getrandbits(32):08x}"
+    prompt_tokens = sum(len(str(message.get("content", ""))) // 4 for message in messages)
+    completion_latency = app.config["COMPLETION_LATENCY_MS"]
+    latency = (app.config["LATENCY_MS"] if completion_latency is None else completion_latency) / 1000.0
+
+    if data.get("stream"):
+        words = answer.split(" ")
+
+        def generate():
+            yield f"data: {json.dumps(_completion_chunk(completion_id, model, {'role': 'assistant', 'content': ''}))}\n\n"
+            for idx, word in enumerate(words):
+                # Spread the configured latency over the streamed tokens
+                if latency:
+                    time.sleep(latency / len(words))
+                text = word if idx == 0 else " " + word
+                yield f"data: {json.dumps(_completion_chunk(completion_id, model, {'content': text}))}\n\n"
+            yield f"data: {json.dumps(_completion_chunk(completion_id, model, {}, 'stop'))}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return Response(generate(), mimetype="text/event-stream")
+
+    if latency:
+        time.sleep(latency)
+    return jsonify({
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": answer},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(answer) // 4,
+            "total_tokens": prompt_tokens + len(answer) // 4,
+        },
+    })
+
+
+@app.route("/stats", methods=["GET"])
+def get_stats():
+    with _stats_lock:
+        return jsonify(dict(stats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=int, default=0, help="Delay added to every request.")
+    parser.add_argument("--completion-latency-ms", type=int, default=None,
+                        help="Delay for chat completions (defaults to --latency-ms).")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with HTTP 429 and a Retry-After header.")
+    args = parser.parse_args()
+    app.config.update(LATENCY_MS=args.latency_ms, COMPLETION_LATENCY_MS=args.completion_latency_ms,
+                      FAIL_RATE=args.fail_rate, RATE_LIMIT_RATE=args.rate_limit_rate)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+"""
+End-to-end load test for the Flask app, fully offline.
+
+    python -m bench.loadtest --users 8 --concurrency 16 --duration 30
+    python -m bench.loadtest --mongo-url mongodb://localhost:27017/loadtest --completion-latency-ms 800
+
+Boots three processes: bench/fake_openai.py (deterministic embeddings,
+configurable completion latency), the app itself on mongomock (or a real
+mongod with --mongo-url) with a throwaway upload directory, and this
+driver. The driver registers users and uploads one document each at the
+given concurrency, waits for ingestion, then spends --duration seconds
+sending a weighted mix of /chat, /documents and /api/convert_to_podcast
+requests. It reports per-endpoint p50/p95/p99 latency and requests/sec,
+plus the hits on each cache tier, and fails if a tier's store errored.
+
+Text-to-speech is replaced by a stand-in (--tts-latency-ms), like the
+model API, so the numbers measure this app rather than Google's.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "What is the refund policy?",
+    "How long does shipping take?",
+    "Which products are covered by the warranty?",
+    "How do I reset my password?",
+    "What are the support hours?",
+    "How can I cancel my subscription?",
+    "Where can I download my invoices?",
+    "Who do I contact for escalations?",
+]
+TOPICS = (
+    "refund policy allows returns within thirty days of delivery",
+    "shipping is free for orders over fifty dollars and takes three to five days",
+    "the warranty covers batteries and screens for two years",
+    "passwords can be reset from the login page using the emailed code",
+    "support is available from nine to five on weekdays",
+    "subscriptions can be cancelled at any time from the billing dashboard",
+    "invoices are available for download under account settings",
+    "escalations are handled by the customer success manager",
+)
+FILLER = "customer account billing order ticket report integration export analytics security onboarding".split()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def synthetic_document(words, seed):
+    rng = random.Random(seed)
+    sentences = []
+    count = 0
+    while count < words:
+        if rng.random() < 0.2:
+            sentence = rng.choice(TOPICS)
+        else:
+            sentence = " ".join(rng.choice(FILLER) for _ in range(rng.randint(8, 20)))
+        sentences.append(sentence.capitalize() + ".")
+        count += len(sentence.split())
+    return " ".join(sentences)
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint, seconds, status):
+        with self._lock:
+            self.samples[endpoint].append(seconds)
+            if status is None or status >= 400:
+                self.errors[endpoint][str(status)] += 1
+
+    def timed(self, endpoint, call):
+        start = time.perf_counter()
+        try:
+            response = call()
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, None
+        self.record(endpoint, time.perf_counter() - start, status)
+        return response
+
+    def report(self, wall_seconds):
+        rows = {}
+        for endpoint, values in sorted(self.samples.items()):
+            values = sorted(values)
+            rows[endpoint] = {
+                "requests": len(values),
+                "errors": dict(self.errors[endpoint]),
+                "rps": len(values) / wall_seconds if wall_seconds else 0.0,
+                "mean_ms": 1000 * sum(values) / len(values),
+                "p50_ms": 1000 * percentile(values, 50),
+                "p95_ms": 1000 * percentile(values, 95),
+                "p99_ms": 1000 * percentile(values, 99),
+            }
+        return rows
+
+
+def print_report(title, rows):
+    print(f"\n{title}")
+    print(f"{'endpoint':<22} {'reqs':>6} {'errors':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, row in rows.items():
+        errors = sum(row["errors"].values())
+        print(f"{endpoint:<22} {row['requests']:>6} {errors:>7} {row['rps']:>8.1f} "
+              f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+        if row["errors"]:
+            print(f"{'':<22} status counts: {row['errors']}")
+
+
+def print_cache_report(caches):
+    """Show which cache tiers the run exercised, from the app's /api/cache_stats."""
+    embedding, answer = caches["embedding_cache"], caches["answer_cache"]
+    print("\ncache tiers")
+    print(f"embedding cache, memory: {embedding['memory_hits']} hits, {embedding['memory_entries']} entries "
+          f"({embedding['memory_bytes'] / 1024:.0f} KB)")
+    print(f"embedding cache, mongo:  {embedding['store_hits']} hits, {embedding['store_writes']} writes, "
+          f"{embedding['store_errors']} errors")
+    print(f"embedding cache misses:  {embedding['misses']}")
+    print(f"answer cache:            {answer['exact_hits']} exact hits, {answer['similar_hits']} similar hits, "
+          f"{answer['misses']} misses")
+
+
+# --- app process -------------------------------------------------------------
+
+class MemoryGridFSBucket:
+    """In-memory GridFSBucket for mongomock runs (mongomock's GridFS needs pymongo 3)."""
+
+    def __init__(self, files):
+        self.files = files
+        self.data = {}
+        self._lock = threading.Lock()
+
+    def upload_from_stream(self, filename, source, metadata=None):
+        from bson import ObjectId
+        data = source if isinstance(source, bytes) else source.read()
+        file_id = ObjectId()
+        with self._lock:
+            self.data[file_id] = data
+        self.files.insert_one({"_id": file_id, "filename": filename, "length": len(data),
+                               "uploadDate": time.time(), "metadata": metadata or {}})
+        return file_id
+
+    def open_download_stream(self, file_id):
+        import gridfs
+        entry = self.files.find_one({"_id": file_id})
+        if entry is None or file_id not in self.data:
+            raise gridfs.errors.NoFile(file_id)
+        stream = io.BytesIO(self.data[file_id])
+        stream.length = entry["length"]
+        stream.upload_date = None
+        stream.metadata = entry["metadata"]
+        return stream
+
+    def delete(self, file_id):
+        with self._lock:
+            self.data.pop(file_id, None)
+        self.files.delete_one({"_id": file_id})
+
+
+def patch_mongomock_bulk_updates():
+    """pymongo 4.11+ passes `sort` to bulk updates, which mongomock 4.3 rejects; none of the app's bulk updates sort."""
+    from mongomock.collection import BulkOperationBuilder
+    add_update = BulkOperationBuilder.add_update
+
+    def add_update_without_sort(self, *args, sort=None, **kwargs):
+        return add_update(self, *args, **kwargs)
+
+    BulkOperationBuilder.add_update = add_update_without_sort
+
+
+class StandInTTS:
+    """gTTS stand-in: returns MP3-sized bytes after a configurable delay."""
+
+    latency = 0.0
+
+    def __init__(self, text, lang="en"):
+        self.text = text
+
+    def write_to_fp(self, fp):
+        time.sleep(self.latency)
+        # Roughly 1 KB of 32 kbps audio per spoken word
+        fp.write(b"ID3" + os.urandom(16) * (len(self.text.split()) * 64))
+
+
+def serve(args):
+    sys.path.insert(0, BACKEND_DIR)
+    use_mongomock = not os.getenv("MONGODB_URL")
+    if use_mongomock:
+        import mongomock
+        import mongomock.gridfs
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+        # Lets GridFSBucket accept a mongomock database; its I/O is replaced below
+        mongomock.gridfs.enable_gridfs_integration()
+        # Otherwise every embedding cache write to Mongo fails and only the in-process tier is measured
+        patch_mongomock_bulk_updates()
+    from werkzeug.serving import make_server
+    from flask_app import app as appmod
+
+    if use_mongomock:
+        appmod.blob_store.bucket = MemoryGridFSBucket(appmod.blob_store.files)
+        # mongomock has no ismaster command, so the app's startup ping fails and
+        # skips ensure_indexes; run it here so the indexes the app relies on exist
+        print("mongomock: startup ping is unsupported, ensuring indexes from the harness", flush=True)
+        appmod.ensure_indexes(appmod.db)
+    StandInTTS.latency = args.tts_latency_ms / 1000.0
+    appmod.gTTS = StandInTTS
+    server = make_server("127.0.0.1", args.port, appmod.create_app(), threaded=True)
+    print(f"app listening on {args.port} (mongo: {'mongomock' if use_mongomock else os.getenv('MONGODB_URL')})", flush=True)
+    server.serve_forever()
+
+
+# --- driver -------------------------------------------------------------------
+
+def wait_until_up(url, process, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} process exited with code {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def setup_user(base, index, args, recorder):
+    session = requests.Session()
+    name = f"load{index}_{random.getrandbits(24):06x}"
+    response = recorder.timed("/register", lambda: session.post(
+        f"{base}/register", json={"username": name, "email": f"{name}@example.com", "password": "load-test-pw"}))
+    if response is None or response.status_code >= 400:
+        return None
+    session.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+    text = synthetic_document(args.doc_words, seed=index).encode("utf-8")
+    upload_start = time.perf_counter()
+    response = recorder.timed("/upload", lambda: session.post(
+        f"{base}/upload",
+        files={"file": (f"manual_{index}.txt", text, "text/plain")},
+        data={"type": "doc", "name": f"manual_{index}.txt"}))
+    if response is None or response.status_code >= 400:
+        return None
+    doc = response.json()
+    job_id = doc.get("job_id")
+    deadline = time.time() + args.ingest_timeout
+    while job_id and time.time() < deadline:
+        job = session.get(f"{base}/jobs/{job_id}").json()
+        if job.get("status") in ("succeeded", "failed"):
+            recorder.record("ingest (end-to-end)", time.perf_counter() - upload_start,
+                            200 if job["status"] == "succeeded" else 500)
+            if job["status"] != "succeeded":
+                return None
+            break
+        time.sleep(0.2)
+    return session, doc["_id"]
+
+
+def load_worker(base, users, mix, deadline, recorder, seed):
+    rng = random.Random(seed)
+    endpoints, weights = zip(*mix.items())
+    while time.time() < deadline:
+        session, doc_id = rng.choice(users)
+        endpoint = rng.choices(endpoints, weights)[0]
+        if endpoint == "chat":
+            question = rng.choice(QUESTIONS)
+            recorder.timed("/chat", lambda: session.post(f"{base}/chat", json={"doc_id": doc_id, "question": question}))
+        elif endpoint == "chat_stream":
+            question = rng.choice(QUESTIONS)
+            recorder.timed("/chat/stream", lambda: session.post(
+                f"{base}/chat/stream", json={"doc_id": doc_id, "question": question}))
+        elif endpoint == "documents":
+            recorder.timed("/documents", lambda: session.get(f"{base}/documents"))
+        elif endpoint == "podcast":
+            recorder.timed("/api/convert_to_podcast", lambda: session.post(
+                f"{base}/api/convert_to_podcast", json={"doc_id": doc_id}))
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("chat", "chat_stream", "documents", "podcast"):
+            raise argparse.ArgumentTypeError(f"unknown endpoint in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def drive(args):
+    workdir = tempfile.mkdtemp(prefix="loadtest_")
+    processes = []
+    try:
+        openai_url = args.openai_url
+        if not openai_url:
+            port = free_port()
+            command = [sys.executable, os.path.join(BACKEND_DIR, "bench", "fake_openai.py"), "--port", str(port),
+                       "--latency-ms", str(args.embedding_latency_ms),
+                       "--completion-latency-ms", str(args.completion_latency_ms)]
+            processes.append(subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            wait_until_up(f"http://127.0.0.1:{port}/stats", processes[-1])
+            openai_url = f"http://127.0.0.1:{port}/v1"
+
+        app_port = free_port()
+        env = dict(os.environ, OPENAI_BASE_URL=openai_url, OPENAI_API_KEY="fake", CHROMA_MODE="persistent",
+                   CHROMA_PATH=os.path.join(workdir, "chroma"),
+                   UPLOAD_DIR=os.path.join(workdir, "uploads"))
+        if args.mongo_url:
+            env["MONGODB_URL"] = args.mongo_url
+        else:
+            env.pop("MONGODB_URL", None)
+        log = open(os.path.join(workdir, "app.log"), "w")
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "bench.loadtest", "--serve", "--port", str(app_port),
+             "--tts-latency-ms", str(args.tts_latency_ms)],
+            cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT))
+        base = f"http://127.0.0.1:{app_port}"
+        wait_until_up(f"{base}/documents", processes[-1])
+        print(f"app log: {log.name}")
+        # Surface startup problems and harness workarounds instead of leaving them in the log
+        with open(log.name) as startup:
+            for line in startup:
+                if line.startswith(("[ERROR]", "mongomock:")):
+                    print(f"  app startup: {line.rstrip()}")
+
+        setup = Recorder()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            users = [user for user in pool.map(lambda i: setup_user(base, i, args, setup), range(args.users)) if user]
+        setup_rows = setup.report(time.perf_counter() - start)
+        print_report(f"setup: {args.users} users, one {args.doc_words}-word document each", setup_rows)
+        if not users:
+            raise RuntimeError("No user finished setup; see the app log")
+
+        load = Recorder()
+        start = time.perf_counter()
+        deadline = time.time() + args.duration
+        threads = [
+            threading.Thread(target=load_worker, args=(base, users, args.mix, deadline, load, args.seed + i))
+            for i in range(args.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+        rows = load.report(wall)
+        total = sum(row["requests"] for row in rows.values())
+        print_report(f"load: {args.concurrency} concurrent clients for {wall:.1f}s, {total / wall:.1f} req/s overall", rows)
+
+        caches = users[0][0].get(f"{base}/api/cache_stats").json()
+        print_cache_report(caches)
+
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"setup": setup_rows, "load": rows, "caches": caches, "wall_seconds": wall}, f, indent=2)
+        # A cache tier that failed silently would make the numbers above misleading
+        if caches["embedding_cache"]["store_errors"]:
+            raise RuntimeError(f"The embedding cache's Mongo tier failed {caches['embedding_cache']['store_errors']} "
+                               f"times, so these results ran without it; see {log.name}")
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of mixed load after setup.")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("chat=70,documents=25,podcast=5"),
+                        help="Weighted endpoint mix: chat, chat_stream, documents, podcast.")
+    parser.add_argument("--doc-words", type=int, default=3000)
+    parser.add_argument("--ingest-timeout", type=float, default=300.0)
+    parser.add_argument("--embedding-latency-ms", type=int, default=20)
+    parser.add_argument("--completion-latency-ms", type=int, default=300)
+    parser.add_argument("--tts-latency-ms", type=int, default=200)
+    parser.add_argument("--openai-url", help="Use an already running OpenAI-compatible server instead of the fake.")
+    parser.add_argument("--mongo-url", help="Use a real MongoDB (e.g. a local mongod) instead of mongomock.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args)
+    else:
+        drive(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import unicodedata
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from .embedding_cache import pack_embedding
+from .metrics import ANSWER_CACHE_LOOKUPS
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_TTL_HOURS = int(os.getenv("ANSWER_CACHE_TTL_HOURS", "168"))
+# Near-duplicate matching on question embeddings; set the threshold above 1 to disable it
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_CANDIDATES = int(os.getenv("ANSWER_CACHE_CANDIDATES", "100"))
+
+
+def normalize_question(question):
+    question = unicodedata.normalize("NFKC", question).lower()
+    question = re.sub(r"[^\w\s]", " ", question)
+    return re.sub(r"\s+", " ", question).strip()
+
+
+def question_key(question):
+    return hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+
+
+LOOKUP_RESULTS = {"exact_hits": "exact_hit", "similar_hits": "similar_hit", "misses": "miss"}
+
+
+class AnswerCache:
+    """
+    Per-document cache of answers, matched on the normalized question text or,
+    failing that, on question embeddings whose cosine similarity to a cached
+    question is above ANSWER_CACHE_SIMILARITY. Entries record the embedding
+    model, and only embeddings from the same model are compared.
+    Lookups are also counted in the answer_cache_lookups Prometheus metric.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._lock = threading.Lock()
+        self.counters = {"exact_hits": 0, "similar_hits": 0, "misses": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+        ANSWER_CACHE_LOOKUPS.labels(LOOKUP_RESULTS[name]).inc()
+
+    def _fresh(self):
+        return {"$gte": datetime.utcnow() - timedelta(hours=ANSWER_CACHE_TTL_HOURS)}
+
+    def lookup_exact(self, doc_id, question):
+        if not ANSWER_CACHE_ENABLED:
+            return None
+        try:
+            entry = self.collection.find_one(
+                {"doc_id": doc_id, "question_key": question_key(question), "created_at": self._fresh()},
+                {"answer": 1}
+            )
+        except Exception as e:
+            logging.error(f"Answer cache lookup failed: {e}")
+            return None
+        if entry:
+            self._count("exact_hits")
+            return entry["answer"]
+        return None
+
+    def lookup_similar(self, doc_id, question_embedding, model):
+        """Call after lookup_exact missed; counts a miss if nothing close enough is cached."""
+        if not ANSWER_CACHE_ENABLED or question_embedding is None or ANSWER_CACHE_SIMILARITY > 1:
+            self._count("misses")
+            return None
+        try:
+            candidates = list(
+                self.collection.find(
+                    {"doc_id": doc_id, "model": model, "created_at": self._fresh()},
+                    {"answer": 1, "embedding": 1}
+                ).sort("created_at", -1).limit(ANSWER_CACHE_CANDIDATES)
+            )
+        except Exception as e:
+            logging.error(f"Answer cache lookup failed: {e}")
+            candidates = []
+        query = np.asarray(question_embedding, dtype=np.float32)
+        # Guards against entries whose embedding does not match the model's dimension
+        candidates = [entry for entry in candidates if entry.get("embedding") and len(entry["embedding"]) == query.nbytes]
+        if candidates:
+            matrix = np.stack([np.frombuffer(bytes(entry["embedding"]), dtype=np.float32) for entry in candidates])
+            norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+            similarities = matrix @ query / np.where(norms == 0, 1.0, norms)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= ANSWER_CACHE_SIMILARITY:
+                self._count("similar_hits")
+                return candidates[best]["answer"]
+        self._count("misses")
+        return None
+
+    def store(self, doc_id, user_id, question, answer, question_embedding=None, model=None):
+        if not ANSWER_CACHE_ENABLED:
+            return
+        try:
+            self.collection.update_one(
+                {"doc_id": doc_id, "question_key": question_key(question)},
+                {"$set": {
+                    "user_id": user_id,
+                    "question": question,
+                    "answer": answer,
+                    "embedding": pack_embedding(question_embedding) if question_embedding else None,
+                    "model": model if question_embedding else None,
+                    "created_at": datetime.utcnow(),
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            logging.error(f"Answer cache write failed: {e}")
+
+    def invalidate(self, doc_id=None, user_id=None):
+        query = {}
+        if doc_id is not None:
+            query["doc_id"] = doc_id
+        if user_id is not None:
+            query["user_id"] = user_id
+        if query:
+            self.collection.delete_many(query)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats["exact_hits"] + stats["similar_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["similar_hits"]) / lookups if lookups else 0.0
+        return stats
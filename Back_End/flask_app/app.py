@@ -1,22 +1,40 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context, g
 from flask_cors import CORS
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
 from bson import ObjectId
+from bson.errors import InvalidId
 from dotenv import load_dotenv
 import os
 from .schemas import UserCreate, Token, DocumentCreate, ChatMessage
-from .utils import hash_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, pwd_context
+from .utils import create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from .passwords import password_hasher, PasswordServiceBusy
+from .auth import TokenVerifier
+from .schema import ensure_indexes, MONGODB_DB
+from .llm import llm
+from .embeddings import embed_texts, index_chunks, update_chunks, set_embedding_cache
+from .embedding_cache import EmbeddingCache
+from .embedding_providers import get_embedding_provider
+from .jobs import JobQueue, JobError, serialize_job
+from .retriever import hybrid_search, index_chunk_terms
+from .context import build_context_prompt
+from .answer_cache import AnswerCache
+from .blobstore import BlobStore
+from .metrics import start_chat_trace, finish_chat_trace, set_strategy, stage, render_metrics
+from .chunker import iter_chunks, iter_sentences
+from .pdf_extract import iter_pdf_text, extract_pdf_text_from_stream, pages_for_span
+from .summarize import map_reduce_summary, SUMMARY_MIN_WORDS, SUMMARY_REFRESH_RATIO
+from .quotas import get_quotas, remaining
+from .vectorstore import VectorStore
+from .crawler import Crawler
+from .memory import ConversationMemory, format_history, is_follow_up
 from pydantic import ValidationError
 from datetime import timedelta, datetime
 from jose import jwt, JWTError
 from werkzeug.utils import secure_filename
-import openai
-import PyPDF2
-import requests
+from werkzeug.wsgi import wrap_file
 import json
 from docx import Document
-import chromadb
-from chromadb.config import Settings
 import logging
 import re
 import certifi
@@ -25,7 +43,6 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import random
 import string
-from bs4 import BeautifulSoup
 from gtts import gTTS
 import io
 from google.cloud import texttospeech
@@ -33,21 +50,26 @@ import tempfile
 import pyttsx3
 import wave
 import contextlib
+import hashlib
+import time
+import threading
+import shutil
+import zipfile
 import soundfile as sf
 # Remove pydub import and all AudioSegment usage for Python 3.13 compatibility
 
 load_dotenv()
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
 app = Flask(__name__)
 CORS(app)
 
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
-client = MongoClient(MONGODB_URL, tlsCAFile=certifi.where())
-db = client["customer_bot_db"]
+# connect=False: the client connects on first use, so processes that only import this module
+# (e.g. spawned password/PDF workers re-importing __main__) never open connections
+client = MongoClient(MONGODB_URL, tlsCAFile=certifi.where(), connect=False)
+db = client[MONGODB_DB]
 
 # Email configuration
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
@@ -55,16 +77,38 @@ SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
 SMTP_USERNAME = os.getenv("SMTP_USERNAME", "")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
 
-try:
-    # The ismaster command is cheap and does not require auth.
-    client.admin.command('ismaster')
-    print("[INFO] Database connected successfully.")
-except Exception as e:
-    print(f"[ERROR] Database connection failed: {e}")
+# Bearer tokens are verified once per request (see authenticate_request) with cached claims
+token_verifier = TokenVerifier(SECRET_KEY, ALGORITHM, db.revoked_tokens)
+
+# Chunk vectors live in a persistent Chroma store, one collection per user
+vector_store = VectorStore()
+# Re-index processed documents whose vectors are missing (e.g. a lost Chroma volume) on startup
+VECTOR_CONSISTENCY_CHECK = os.getenv("VECTOR_CONSISTENCY_CHECK", "true").lower() == "true"
+
+embedding_cache = EmbeddingCache(db.embedding_cache)
+set_embedding_cache(embedding_cache)
+answer_cache = AnswerCache(db.answer_cache)
 
-# Initialize ChromaDB client and collection
-chroma_client = chromadb.Client(Settings(persist_directory=os.path.join(os.path.dirname(__file__), '../chroma_db')))
-doc_collection = chroma_client.get_or_create_collection("documents")
+# Document text and podcast audio live in GridFS; document records only hold references
+blob_store = BlobStore(db)
+# Podcast audio is served in byte ranges with revalidation via ETag
+PODCAST_STREAM_CHUNK_SIZE = 64 * 1024
+PODCAST_CACHE_MAX_AGE = int(os.getenv("PODCAST_CACHE_MAX_AGE", "86400"))
+# Projection for reads that do not need legacy inline content or audio
+DOC_LIGHT_PROJECTION = {'content': 0, 'podcast_audio': 0, 'page_offsets': 0}
+
+# Raw uploads are kept on disk until their ingestion job succeeds
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(__file__), '../uploads'))
+ingest_queue = JobQueue(db.ingest_jobs)
+# URL documents are fetched through a pooled crawler that revalidates cached pages on refresh
+url_crawler = Crawler(cache=db.url_cache)
+# Bulk uploads infer the document type from the extension; zip archives are expanded
+BULK_UPLOAD_TYPES = {'.pdf': 'pdf', '.docx': 'docx', '.doc': 'doc', '.txt': 'doc', '.md': 'doc'}
+BULK_MAX_ARCHIVE_BYTES = int(os.getenv("BULK_MAX_ARCHIVE_BYTES", str(500 * 1024 * 1024)))
+# Chat history is returned in pages of messages; clients may pick any of these fields
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "50"))
+CHAT_HISTORY_MAX_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_MAX_PAGE_SIZE", "200"))
+CHAT_HISTORY_FIELDS = {'question', 'answer', 'timestamp', 'doc_id'}
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -94,30 +138,29 @@ def send_email(to_email, subject, body):
         logging.error(f"Email sending failed: {e}")
         return False
 
+def summary_messages(content):
+    return [
+        {"role": "system", "content": "You are a helpful assistant. Summarize the following document."},
+        {"role": "user", "content": content}
+    ]
+
 def scan_with_gpt(content: str) -> str:
-    print("=== PROMPT SENT TO MODEL ===")
-    print(content)
-    response = openai.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant. Summarize the following document."},
-            {"role": "user", "content": content}
-        ],
-        max_tokens=1024
-    )
-    return response.choices[0].message.content
+    return llm.chat(summary_messages(content), max_tokens=1024)
+
+async def ascan_with_gpt(content: str) -> str:
+    """asyncio counterpart of scan_with_gpt."""
+    return await llm.achat(summary_messages(content), max_tokens=1024)
+
+def stream_with_gpt(content: str):
+    """Like scan_with_gpt, but yields the completion text as it is generated."""
+    return llm.chat_stream(summary_messages(content), max_tokens=1024)
+
+# Recent turns plus a rolling summary per (user, document), fed back into chat prompts
+conversation_memory = ConversationMemory(db.chats, db.chat_memory, complete=scan_with_gpt)
 
 def extract_text_from_pdf(file_stream):
-    reader = PyPDF2.PdfReader(file_stream)
-    text = ""
-    for page in reader.pages:
-        page_text = page.extract_text() or ""
-        # Clean up the extracted text
-        page_text = re.sub(r'\s+', ' ', page_text)  # Remove extra whitespace
-        page_text = page_text.strip()
-        if page_text:
-            text += page_text + "\n\n"
-    return text.strip()
+    text, _ = extract_pdf_text_from_stream(file_stream)
+    return text
 
 def extract_text_from_docx(file_stream):
     doc = Document(file_stream)
@@ -127,26 +170,9 @@ def extract_text_from_docx(file_stream):
             text_parts.append(para.text.strip())
     return '\n\n'.join(text_parts)
 
-def extract_text_from_url(url):
-    try:
-        resp = requests.get(url, timeout=30)
-        if resp.headers.get('content-type', '').startswith('application/pdf'):
-            from io import BytesIO
-            return extract_text_from_pdf(BytesIO(resp.content))
-        else:
-            # For HTML content, try to extract meaningful text
-            soup = BeautifulSoup(resp.content, 'html.parser')
-            # Remove script and style elements
-            for script in soup(["script", "style"]):
-                script.decompose()
-            text = soup.get_text()
-            # Clean up the text
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = ' '.join(chunk for chunk in chunks if chunk)
-            return text[:10000]  # Increased limit for large documents
-    except Exception as e:
-        return f"Could not fetch or extract content from URL: {str(e)}"
+def extract_text_from_url(url, crawl=False):
+    """Return (text, page_offsets) for a URL document; raises CrawlError if it cannot be fetched."""
+    return url_crawler.extract(url, crawl=crawl)
 
 def save_processed_content_to_file(content, filename):
     folder = os.path.join(os.path.dirname(__file__), '../embeddings')
@@ -156,186 +182,90 @@ def save_processed_content_to_file(content, filename):
         f.write(content)
 
 def embed_text(text):
-    try:
-        response = openai.embeddings.create(
-            input=[text],
-            model="text-embedding-3-small"
-        )
-        return response.data[0].embedding
-    except Exception as e:
-        logging.error(f"Embedding error: {e}")
-        return None
+    return embed_texts([text])[0]
 
 def chunk_text(text, chunk_size=500, overlap=100):
     """
-    Improved chunking strategy for large documents.
-    - Larger chunk size (500 words) for better context
-    - Smaller overlap (100 words) to reduce redundancy
-    - Better text cleaning and processing
-    - Improved sentence boundary detection
+    Split text into overlapping chunks of whole sentences (chunk_size and
+    overlap in words). Kept boundary-compatible with the original chunker so
+    existing documents re-chunk identically; see chunker.iter_chunks.
     """
-    # Clean the text first
-    text = re.sub(r'\s+', ' ', text)  # Remove extra whitespace
-    text = text.strip()
-    
-    if not text:
-        return []
-    
-    # Split into sentences first for better boundaries
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    
-    chunks = []
-    current_chunk = []
-    current_word_count = 0
-    
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if not sentence:
-            continue
-            
-        sentence_words = sentence.split()
-        sentence_word_count = len(sentence_words)
-        
-        # If adding this sentence would exceed chunk size
-        if current_word_count + sentence_word_count > chunk_size and current_chunk:
-            # Save current chunk
-            chunk_text = ' '.join(current_chunk)
-            if len(chunk_text.strip()) > 50:  # Only add chunks with meaningful content
-                chunks.append(chunk_text.strip())
-            
-            # Start new chunk with overlap
-            overlap_words = []
-            if overlap > 0:
-                # Take last few sentences for overlap
-                for sent in reversed(current_chunk):
-                    sent_words = sent.split()
-                    if len(overlap_words) + len(sent_words) <= overlap:
-                        overlap_words = sent_words + overlap_words
-                    else:
-                        break
-            
-            current_chunk = overlap_words + [sentence]
-            current_word_count = len(overlap_words) + sentence_word_count
-        else:
-            # Add sentence to current chunk
-            current_chunk.append(sentence)
-            current_word_count += sentence_word_count
-    
-    # Add the last chunk if it exists
-    if current_chunk:
-        chunk_text = ' '.join(current_chunk)
-        if len(chunk_text.strip()) > 50:
-            chunks.append(chunk_text.strip())
-    
-    # If we have too few chunks, try paragraph-based chunking
-    if len(chunks) < 2:
-        paragraphs = text.split('\n\n')
-        chunks = []
-        current_chunk = []
-        current_word_count = 0
-        
-        for paragraph in paragraphs:
-            paragraph = paragraph.strip()
-            if not paragraph:
-                continue
-                
-            para_words = paragraph.split()
-            para_word_count = len(para_words)
-            
-            if current_word_count + para_word_count > chunk_size and current_chunk:
-                chunk_text = ' '.join(current_chunk)
-                if len(chunk_text.strip()) > 50:
-                    chunks.append(chunk_text.strip())
-                
-                # Start new chunk with overlap
-                overlap_words = []
-                if overlap > 0:
-                    for para in reversed(current_chunk):
-                        para_words = para.split()
-                        if len(overlap_words) + len(para_words) <= overlap:
-                            overlap_words = para_words + overlap_words
-                        else:
-                            break
-                
-                current_chunk = overlap_words + [paragraph]
-                current_word_count = len(overlap_words) + para_word_count
-            else:
-                current_chunk.append(paragraph)
-                current_word_count += para_word_count
-        
-        # Add the last chunk
-        if current_chunk:
-            chunk_text = ' '.join(current_chunk)
-            if len(chunk_text.strip()) > 50:
-                chunks.append(chunk_text.strip())
-    
+    chunks = [chunk['text'] for chunk in iter_chunks(text, chunk_size, overlap, compat=True)]
+
     logging.info(f"Created {len(chunks)} chunks for document upload. Total words: {len(text.split())}")
     if chunks:
         logging.info(f"First chunk preview: {chunks[0][:200]}...")
     
     return chunks
 
-def process_large_document(content, max_chunks=30):
+def chunk_document(pieces, page_offsets=None, max_chunks=0):
     """
-    Process large documents with intelligent chunking and summarization.
-    More conservative approach for very large documents.
+    Chunk a document's text for indexing. `pieces` is the text, or an
+    iterable of text pieces such as the PDF page stream from
+    extract_document_text; chunking then runs while later pages are still
+    being extracted. Returns (content, chunks, chunk_metadata): the joined
+    text and its chunks, tagged with the pages they span when page offsets
+    are known. Raises JobError if the document needs more than `max_chunks`
+    chunks (0 = no limit).
     """
-    # If content is extremely large, create a summary first
-    if len(content.split()) > 20000:  # More than 20k words
-        logging.info("Document is extremely large, creating comprehensive summary first...")
-        try:
-            summary_prompt = f"""
-            Please provide a comprehensive summary of the following document, 
-            preserving all important information, key points, and details that 
-            would be needed to answer questions about the content. 
-            Focus on factual information, procedures, definitions, and important concepts.
-            Make the summary detailed but concise.
-            
-            Document content:
-            {content[:20000]}  # Use first 20k words for summary
-            """
-            
-            summary = scan_with_gpt(summary_prompt)
-            logging.info(f"Created summary of {len(summary)} characters")
-            
-            # Use the summary for chunking with larger chunks
-            chunks = chunk_text(summary, chunk_size=1000, overlap=200)
-        except Exception as e:
-            logging.error(f"Summary creation failed: {e}")
-            # Fallback to original content with smaller chunks
-            chunks = chunk_text(content, chunk_size=300, overlap=50)
-    elif len(content.split()) > 10000:  # More than 10k words
-        logging.info("Document is very large, creating summary first...")
-        try:
-            summary_prompt = f"""
-            Please provide a comprehensive summary of the following document, 
-            preserving all important information, key points, and details that 
-            would be needed to answer questions about the content. 
-            Focus on factual information, procedures, definitions, and important concepts.
-            
-            Document content:
-            {content[:15000]}  # Use first 15k words for summary
-            """
-            
-            summary = scan_with_gpt(summary_prompt)
-            logging.info(f"Created summary of {len(summary)} characters")
-            
-            # Use the summary for chunking
-            chunks = chunk_text(summary, chunk_size=800, overlap=150)
-        except Exception as e:
-            logging.error(f"Summary creation failed: {e}")
-            # Fallback to original content
-            chunks = chunk_text(content, chunk_size=500, overlap=100)
-    else:
-        # For smaller documents, use regular chunking
-        chunks = chunk_text(content, chunk_size=500, overlap=100)
-    
-    # Limit the number of chunks to prevent overwhelming the system
-    if len(chunks) > max_chunks:
-        logging.info(f"Limiting chunks from {len(chunks)} to {max_chunks}")
-        chunks = chunks[:max_chunks]
-    
-    return chunks
+    if isinstance(pieces, str):
+        pieces = (pieces,)
+    parts = []
+
+    def collect():
+        for piece in pieces:
+            parts.append(piece)
+            yield piece
+
+    chunks = []
+    chunk_metadata = []
+    for chunk in iter_chunks(collect(), chunk_size=500, overlap=100, compat=True):
+        chunks.append(chunk['text'])
+        metadata = {'kind': 'content'}
+        pages = pages_for_span(page_offsets, chunk['start'], chunk['end'])
+        if pages:
+            metadata.update(page_start=pages[0], page_end=pages[-1])
+        chunk_metadata.append(metadata)
+    content = ''.join(parts)
+    logging.info(f"Created {len(chunks)} chunks for document upload. Total words: {len(content.split())}")
+    if max_chunks and len(chunks) > max_chunks:
+        raise JobError(f'This document is too large: it needs {len(chunks)} chunks and your limit is {max_chunks}.')
+    return content, chunks, chunk_metadata
+
+def add_summary_chunks(content, chunks, chunk_metadata, summary=None):
+    """
+    For very large documents, append chunks of a map-reduce summary to
+    `chunks` so overview questions still find a good match. A stored
+    `summary` is reused instead of summarizing again. Returns the summary
+    ('' for documents too small to need one).
+    """
+    if len(content.split()) <= SUMMARY_MIN_WORDS:
+        return ''
+    if summary is None:
+        logging.info("Document is very large, creating map-reduce summary...")
+        summary = map_reduce_summary(content, ascan_with_gpt)
+        logging.info(f"Created summary of {len(summary)} characters")
+    for text in chunk_text(summary, chunk_size=800, overlap=150) if summary else []:
+        chunks.append(text)
+        chunk_metadata.append({'kind': 'summary'})
+    return summary
+
+def reusable_summary(doc, content):
+    """
+    Return (summary, stale_sentences) for re-ingesting `doc` with new
+    `content`: its stored summary while the sentences changed since that
+    summary was written stay within SUMMARY_REFRESH_RATIO of the document,
+    else (None, 0) to summarize again. Sentences rather than chunks are
+    compared, since one edit can shift every later chunk boundary.
+    """
+    if not doc.get('summary'):
+        return None, 0
+    old_sentences = {sentence for sentence, _, _ in iter_sentences(load_document_content(doc))}
+    sentences = [sentence for sentence, _, _ in iter_sentences(content)]
+    stale_sentences = doc.get('summary_stale_sentences', 0) + sum(1 for sentence in sentences if sentence not in old_sentences)
+    if stale_sentences > len(sentences) * SUMMARY_REFRESH_RATIO:
+        return None, 0
+    return doc['summary'], stale_sentences
 
 # def transcribe_audio(file_stream):
 #     """
@@ -348,53 +278,6 @@ def process_large_document(content, max_chunks=30):
 #     )
 #     return response.text
 
-def estimate_tokens(text):
-    """
-    Rough estimation of tokens (1 token ≈ 4 characters for English text)
-    This is a conservative estimate to stay within limits
-    """
-    return len(text) // 4
-
-def truncate_content_for_model(content, max_tokens=100000):
-    """
-    Truncate content to fit within model's token limit
-    Preserves the most important parts (beginning and end)
-    """
-    estimated_tokens = estimate_tokens(content)
-    
-    if estimated_tokens <= max_tokens:
-        return content
-    
-    # Calculate how much to keep from beginning and end
-    chars_per_token = 4
-    max_chars = max_tokens * chars_per_token
-    
-    # Keep 60% from beginning, 40% from end
-    beginning_chars = int(max_chars * 0.6)
-    end_chars = int(max_chars * 0.4)
-    
-    beginning = content[:beginning_chars]
-    end = content[-end_chars:] if len(content) > beginning_chars else ""
-    
-    # Find a good break point near the middle
-    middle_start = beginning_chars - 1000
-    middle_end = beginning_chars + 1000
-    
-    # Look for paragraph breaks or sentence breaks
-    break_point = beginning.rfind('\n\n')
-    if break_point == -1:
-        break_point = beginning.rfind('. ')
-    if break_point == -1:
-        break_point = beginning.rfind(' ')
-    
-    if break_point > middle_start and break_point < middle_end:
-        beginning = content[:break_point]
-    
-    truncated_content = beginning + "\n\n[Content truncated due to length. Showing most relevant sections.]\n\n" + end
-    
-    logging.info(f"Content truncated from {estimated_tokens} tokens to approximately {estimate_tokens(truncated_content)} tokens")
-    return truncated_content
-
 @app.route("/register", methods=["POST"])
 def register():
     try:
@@ -403,20 +286,24 @@ def register():
     except ValidationError as e:
         return jsonify({"detail": e.errors()}), 422
 
-    if db.users.find_one({"email": user.email}) or db.users.find_one({"username": user.username}):
+    if db.users.find_one({"$or": [{"email": user.email}, {"username": user.username}]}, {"_id": 1}):
         return jsonify({"detail": "Email or username already registered"}), 400
 
-    hashed_pw = hash_password(user.password)
+    hashed_pw = password_hasher.hash(user.password)
     user_dict = {
         "username": user.username,
         "email": user.email,
         "hashed_password": hashed_pw,
     }
-    result = db.users.insert_one(user_dict)
+    try:
+        result = db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration (unique indexes on email/username)
+        return jsonify({"detail": "Email or username already registered"}), 400
     user_id = str(result.inserted_id)
 
     access_token = create_access_token(
-        data={"sub": user_id},
+        data={"sub": user_id, "username": user.username},
         expires_delta=timedelta(hours=24)
     )
     return jsonify({
@@ -433,11 +320,17 @@ def login():
     if not email or not password:
         return jsonify({"detail": "Email and password are required."}), 400
     user = db.users.find_one({"email": email})
-    if not user or not pwd_context.verify(password, user.get("hashed_password", "")):
+    if not user:
+        return jsonify({"detail": "Invalid email or password."}), 401
+    verified, new_hash = password_hasher.verify_and_update(password, user.get("hashed_password", ""))
+    if not verified:
         return jsonify({"detail": "Invalid email or password."}), 401
+    if new_hash:
+        # Stored hash used older settings (e.g. fewer BCRYPT_ROUNDS)
+        db.users.update_one({"_id": user["_id"]}, {"$set": {"hashed_password": new_hash}})
     user_id = str(user["_id"])
     access_token = create_access_token(
-        data={"sub": user_id},
+        data={"sub": user_id, "username": user["username"]},
         expires_delta=timedelta(hours=24)
     )
     return jsonify({
@@ -506,15 +399,11 @@ def verify_otp():
     if not email or not otp:
         return jsonify({"detail": "Email and OTP are required."}), 400
     
-    # Check if OTP exists and is valid
-    reset_data = db.password_resets.find_one({"email": email})
+    # Expired OTPs are removed by the TTL index on expires_at; the filter covers the
+    # window before Mongo's TTL monitor runs
+    reset_data = db.password_resets.find_one({"email": email, "expires_at": {"$gt": datetime.utcnow()}})
     if not reset_data:
-        return jsonify({"detail": "Invalid OTP or email."}), 400
-    
-    # Check if OTP is expired
-    if datetime.utcnow() > reset_data["expires_at"]:
-        db.password_resets.delete_one({"email": email})
-        return jsonify({"detail": "OTP has expired. Please request a new one."}), 400
+        return jsonify({"detail": "Invalid or expired OTP. Please request a new one."}), 400
     
     # Check if OTP matches
     if reset_data["otp"] != otp:
@@ -558,7 +447,7 @@ def reset_password():
             return jsonify({"detail": "User not found."}), 404
         
         # Hash the new password
-        hashed_password = hash_password(new_password)
+        hashed_password = password_hasher.hash(new_password)
         
         # Update user's password
         db.users.update_one(
@@ -584,14 +473,10 @@ def delete_user():
     
     try:
         # Delete user's documents and related data
-        user_docs = list(db.documents.find({"user_id": user_id}))
+        user_docs = list(db.documents.find({"user_id": user_id}, DOC_LIGHT_PROJECTION))
         for doc in user_docs:
-            doc_id = str(doc["_id"])
-            # Delete document embeddings from ChromaDB
-            try:
-                doc_collection.delete(where={"doc_id": doc_id, "user_id": user_id})
-            except Exception:
-                pass
+            remove_raw_upload(doc)
+            remove_document_blobs(doc)
             # Delete embedding files
             if doc.get('name'):
                 embedding_path = os.path.join(os.path.dirname(__file__), '../embeddings', secure_filename(doc['name']) + '.txt')
@@ -602,24 +487,376 @@ def delete_user():
                     pass
         
         # Delete all user data
+        vector_store.delete_user(user_id)
         db.documents.delete_many({"user_id": user_id})
         db.chats.delete_many({"user_id": user_id})
+        conversation_memory.forget(user_id)
+        db.chunk_terms.delete_many({"user_id": user_id})
+        answer_cache.invalidate(user_id=user_id)
+        db.ingest_jobs.delete_many({"user_id": user_id})
         db.users.delete_one({"_id": ObjectId(user_id)})
         
         return jsonify({"message": "User account and all associated data deleted successfully."}), 200
     except Exception as e:
         return jsonify({"detail": f"Error deleting user: {str(e)}"}), 500
 
-def get_current_user_id():
+@app.before_request
+def authenticate_request():
+    """Verify the bearer token once per request; handlers read the claims from g.user."""
+    g.user = None
     auth_header = request.headers.get('Authorization')
     if not auth_header or not auth_header.startswith('Bearer '):
-        return None
-    token = auth_header.split(' ')[1]
+        return
+    started_ns = time.time_ns()
+    started = time.perf_counter()
+    claims = token_verifier.verify(auth_header.split(' ')[1])
+    # Password reset tokens carry a `type` and must not authenticate API calls
+    if claims and not claims.get('type'):
+        g.user = claims
+    g.auth_timing = (started_ns, time.perf_counter() - started)
+
+def get_current_user_id():
+    user = g.get('user')
+    return user.get('sub') if user else None
+
+def get_current_username(user_id):
+    """Username from the token claims, falling back to Mongo for tokens issued without it."""
+    user = g.get('user') or {}
+    if user.get('username'):
+        return user['username']
+    record = db.users.find_one({'_id': ObjectId(user_id)}, {'username': 1})
+    return record.get('username', 'User') if record else 'User'
+
+def start_request_trace(endpoint):
+    """Start the chat trace, including the token verification done before the view ran."""
+    trace = start_chat_trace(endpoint)
+    if g.get('auth_timing'):
+        trace.record('auth', *g.auth_timing)
+    return trace
+
+@app.route("/logout", methods=["POST"])
+def logout():
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({"detail": "Authentication required."}), 401
+    token_verifier.revoke(request.headers['Authorization'].split(' ')[1], g.user)
+    return jsonify({"message": "Logged out successfully."}), 200
+
+def save_raw_upload(file, filename):
+    """Persist an uploaded file so ingestion workers can process it later."""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    raw_file = f"{ObjectId()}_{filename}"
+    file.save(os.path.join(UPLOAD_DIR, raw_file))
+    return raw_file
+
+def save_raw_stream(stream, filename):
+    """Like save_raw_upload, for file-like objects such as zip archive members."""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    raw_file = f"{ObjectId()}_{filename}"
+    with open(os.path.join(UPLOAD_DIR, raw_file), 'wb') as f:
+        shutil.copyfileobj(stream, f)
+    return raw_file
+
+def iter_bulk_entries(files, stack):
+    """
+    Yield (name, open_stream) for every document in a bulk upload, expanding
+    zip archives. Archives are kept open on `stack` until the caller is done.
+    """
+    for file in files:
+        if not file or not file.filename:
+            continue
+        if not file.filename.lower().endswith('.zip'):
+            yield file.filename, lambda file=file: file.stream
+            continue
+        archive = stack.enter_context(zipfile.ZipFile(file.stream))
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+            and not os.path.basename(info.filename).startswith('.')
+        ]
+        if sum(info.file_size for info in members) > BULK_MAX_ARCHIVE_BYTES:
+            raise ValueError(f"{file.filename} expands to more than {BULK_MAX_ARCHIVE_BYTES} bytes")
+        for info in members:
+            yield info.filename, lambda info=info, archive=archive: archive.open(info)
+
+def queue_document(doc, payload):
+    """Insert a document record and queue its ingestion; returns (doc_id, job_id)."""
+    doc.update({
+        'uploaded_at': datetime.utcnow().isoformat() + 'Z',
+        'processed': False,
+        'status': 'queued',
+        'progress': 0,
+    })
+    result = db.documents.insert_one(doc)
+    doc_id_str = str(result.inserted_id)
+    job_id = ingest_queue.enqueue('ingest', payload, user_id=doc['user_id'], doc_id=doc_id_str)
+    db.documents.update_one({'_id': result.inserted_id}, {'$set': {'job_id': job_id}})
+    return doc_id_str, job_id
+
+def remove_raw_upload(doc):
+    if doc and doc.get('raw_file'):
+        try:
+            os.remove(os.path.join(UPLOAD_DIR, doc['raw_file']))
+        except OSError:
+            pass
+
+def load_document_content(doc):
+    """Return a document's extracted text from blob storage (or the legacy inline field)."""
+    if doc.get('content_blob_id'):
+        return blob_store.read_text(doc['content_blob_id'])
+    if 'content' in doc:
+        return doc['content'] or ''
+    legacy = db.documents.find_one({'_id': doc['_id']}, {'content': 1})
+    return (legacy or {}).get('content', '')
+
+def remove_document_blobs(doc):
+    if doc:
+        blob_store.delete(doc.get('content_blob_id'))
+        blob_store.delete(doc.get('podcast_blob_id'))
+
+def extract_document_text(payload):
+    """
+    Return (content, page_offsets); page_offsets is only available for
+    uploaded PDFs. For PDFs, content is a stream of page texts that fills
+    page_offsets as it is consumed (see chunk_document).
+    """
+    if payload['source'] == 'url':
+        return extract_text_from_url(payload['url'], crawl=payload.get('crawl', False))
+    filename = payload.get('filename') or ''
+    path = os.path.join(UPLOAD_DIR, payload['raw_file'])
+    if payload['type'] == 'pdf':
+        page_offsets = []
+        return iter_pdf_text(path, page_offsets), page_offsets
+    with open(path, 'rb') as f:
+        if payload['type'] == 'docx' or filename.lower().endswith('.docx'):
+            return extract_text_from_docx(f), None
+        else:
+            return f.read().decode('utf-8', errors='ignore'), None
+
+def run_ingest_job(job, report):
+    """Ingestion pipeline: extraction -> chunking -> embedding -> indexing."""
+    payload = job['payload']
+    user_id = job['user_id']
+    doc_id_str = job['doc_id']
+    doc_filter = {'_id': ObjectId(doc_id_str), 'user_id': user_id}
+
+    def set_stage(stage, progress):
+        report(stage, progress)
+        db.documents.update_one(doc_filter, {'$set': {'status': stage, 'progress': int(progress)}})
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload.get('sub')
-    except JWTError:
-        return None
+        set_stage('extracting', 5)
+        pieces, page_offsets = extract_document_text(payload)
+        quotas = get_quotas(db.users, user_id)
+        # Extraction and chunking run together: chunks are cut as pages arrive
+        content, chunks, chunk_metadata = chunk_document(pieces, page_offsets, quotas['max_document_chunks'])
+        if not content or len(content.strip()) < 50:
+            raise JobError('Could not extract meaningful content from the document. Please ensure it contains readable text.')
+        logging.info(f"Extracted {len(content)} characters from document {doc_id_str}")
+
+        set_stage('chunking', 20)
+        summary = add_summary_chunks(content, chunks, chunk_metadata)
+        if not chunks:
+            raise JobError('Could not process the document content. Please try a different file.')
+
+        set_stage('embedding', 30)
+        successful_embeddings = index_chunks(
+            vector_store.collection(user_id), doc_id_str, user_id, payload['name'], chunks,
+            on_progress=lambda done, total: set_stage('embedding', 30 + 65 * done / total),
+            chunk_metadata=chunk_metadata
+        )
+        logging.info(f"Successfully stored {successful_embeddings}/{len(chunks)} chunks in ChromaDB for doc_id {doc_id_str}")
+        if successful_embeddings == 0:
+            raise JobError('Failed to process document embeddings. Please try again.')
+
+        set_stage('indexing', 95)
+        bm25_stats = index_chunk_terms(db.chunk_terms, doc_id_str, user_id, chunks)
+        # Store the original content for chat context and podcasts
+        content_ref = blob_store.put_text(content, filename=f"{doc_id_str}.txt")
+        result = db.documents.update_one(doc_filter, {'$set': {
+            'content_blob_id': content_ref['blob_id'],
+            'content_size': content_ref['size'],
+            'content_sha256': content_ref['sha256'],
+            'processed': True,
+            'status': 'ready',
+            'progress': 100,
+            'chunk_count': successful_embeddings,
+            'bm25': bm25_stats,
+            'page_offsets': page_offsets,
+            'summary': summary,
+            'summary_stale_sentences': 0,
+        }, '$unset': {'raw_file': ''}})
+        if result.matched_count == 0:
+            # The document was deleted while it was being processed
+            vector_store.delete_document(user_id, doc_id_str)
+            db.chunk_terms.delete_many({"doc_id": doc_id_str})
+            blob_store.delete(content_ref['blob_id'])
+            raise JobError('Document was deleted during processing.')
+        # The text is in blob storage now; raw uploads are only kept after a failure, for retries
+        remove_raw_upload(payload)
+    except Exception as e:
+        db.documents.update_one(doc_filter, {'$set': {'status': 'failed', 'error': str(e)}})
+        raise
+
+    return {'chunks_stored': successful_embeddings, 'chunks_total': len(chunks)}
+
+def run_reingest_job(job, report):
+    """Re-ingest updated content for an existing document, re-embedding only changed chunks."""
+    payload = job['payload']
+    user_id = job['user_id']
+    doc_id_str = job['doc_id']
+    doc_filter = {'_id': ObjectId(doc_id_str), 'user_id': user_id}
+    doc = db.documents.find_one(doc_filter, DOC_LIGHT_PROJECTION)
+    if not doc:
+        raise JobError('Document no longer exists.')
+
+    def set_stage(stage, progress):
+        report(stage, progress)
+        db.documents.update_one(doc_filter, {'$set': {'status': stage, 'progress': int(progress)}})
+
+    try:
+        set_stage('extracting', 5)
+        pieces, page_offsets = extract_document_text(payload)
+        quotas = get_quotas(db.users, user_id)
+        content, chunks, chunk_metadata = chunk_document(pieces, page_offsets, quotas['max_document_chunks'])
+        if not content or len(content.strip()) < 50:
+            raise JobError('Could not extract meaningful content from the document. Please ensure it contains readable text.')
+        source_fields = {'type': payload['type']}
+        if payload['source'] == 'url':
+            source_fields.update(url=payload['url'], crawl=payload.get('crawl', False))
+
+        if hashlib.sha256(content.encode('utf-8')).hexdigest() == doc.get('content_sha256'):
+            logging.info(f"Content of doc_id {doc_id_str} is unchanged; nothing to re-index")
+            db.documents.update_one(doc_filter, {
+                '$set': {**source_fields, 'status': 'ready', 'progress': 100},
+                '$unset': {'raw_file': ''}
+            })
+            remove_raw_upload(payload)
+            remove_raw_upload(doc)
+            return {'changed': False}
+
+        set_stage('chunking', 20)
+        # A small edit keeps the stored summary, so its chunks are not re-embedded either
+        summary, stale_sentences = reusable_summary(doc, content)
+        summary = add_summary_chunks(content, chunks, chunk_metadata, summary)
+        if not chunks:
+            raise JobError('Could not process the document content. Please try a different file.')
+
+        set_stage('embedding', 30)
+        counts = update_chunks(
+            vector_store.collection(user_id), doc_id_str, user_id, doc.get('name'), chunks,
+            on_progress=lambda done, total: set_stage('embedding', 30 + 65 * done / total),
+            chunk_metadata=chunk_metadata
+        )
+        logging.info(f"Re-ingested doc_id {doc_id_str}: {counts}")
+        chunk_count = counts['unchanged'] + counts['moved'] + counts['embedded']
+        if chunk_count == 0:
+            raise JobError('Failed to process document embeddings. Please try again.')
+
+        set_stage('indexing', 95)
+        db.chunk_terms.delete_many({'doc_id': doc_id_str})
+        bm25_stats = index_chunk_terms(db.chunk_terms, doc_id_str, user_id, chunks)
+        content_ref = blob_store.put_text(content, filename=f"{doc_id_str}.txt")
+        result = db.documents.update_one(doc_filter, {
+            '$set': {
+                **source_fields,
+                'content_blob_id': content_ref['blob_id'],
+                'content_size': content_ref['size'],
+                'content_sha256': content_ref['sha256'],
+                'status': 'ready',
+                'progress': 100,
+                'chunk_count': chunk_count,
+                'bm25': bm25_stats,
+                'page_offsets': page_offsets,
+                'summary': summary,
+                'summary_stale_sentences': stale_sentences,
+                'updated_at': datetime.utcnow().isoformat() + 'Z',
+            },
+            '$unset': {'error': '', 'content': '', 'raw_file': ''}
+        })
+        if result.matched_count == 0:
+            vector_store.delete_document(user_id, doc_id_str)
+            db.chunk_terms.delete_many({"doc_id": doc_id_str})
+            blob_store.delete(content_ref['blob_id'])
+            remove_raw_upload(payload)
+            raise JobError('Document was deleted during processing.')
+        blob_store.delete(doc.get('content_blob_id'))
+        remove_raw_upload(payload)
+        remove_raw_upload(doc)
+        # Cached answers were generated from the old content
+        answer_cache.invalidate(doc_id=doc_id_str)
+    except Exception as e:
+        failed = {'status': 'failed', 'error': str(e)}
+        if payload.get('raw_file'):
+            # Kept for a retry and referenced by the document, so deleting the document removes it
+            failed['raw_file'] = payload['raw_file']
+            if doc.get('raw_file') != payload['raw_file']:
+                remove_raw_upload(doc)
+        db.documents.update_one(doc_filter, {'$set': failed})
+        raise
+
+    return {'changed': True, **counts}
+
+def run_reindex_job(job, report):
+    """
+    Rebuild a processed document's vectors and BM25 index from its stored
+    text and stored summary; nothing is summarized again, so the index
+    matches what ingestion produced.
+    """
+    user_id = job['user_id']
+    doc_id_str = job['doc_id']
+    doc_filter = {'_id': ObjectId(doc_id_str), 'user_id': user_id}
+    doc = db.documents.find_one(doc_filter, {'podcast_audio': 0})
+    if not doc:
+        raise JobError('Document no longer exists.')
+
+    report('chunking', 10)
+    content = load_document_content(doc)
+    quotas = get_quotas(db.users, user_id)
+    content, chunks, chunk_metadata = chunk_document(content, doc.get('page_offsets'), quotas['max_document_chunks'])
+    # Documents ingested before summaries were stored are re-indexed without summary chunks
+    add_summary_chunks(content, chunks, chunk_metadata, doc.get('summary') or '')
+    if not chunks:
+        raise JobError('Document has no content to re-index.')
+
+    report('embedding', 30)
+    counts = update_chunks(
+        vector_store.collection(user_id), doc_id_str, user_id, doc.get('name'), chunks,
+        on_progress=lambda done, total: report('embedding', 30 + 65 * done / total),
+        chunk_metadata=chunk_metadata
+    )
+    stored = counts['unchanged'] + counts['moved'] + counts['embedded']
+    if stored == 0:
+        raise JobError('Failed to re-index document embeddings.')
+
+    report('indexing', 95)
+    db.chunk_terms.delete_many({'doc_id': doc_id_str})
+    bm25_stats = index_chunk_terms(db.chunk_terms, doc_id_str, user_id, chunks)
+    if db.documents.update_one(doc_filter, {'$set': {'chunk_count': stored, 'bm25': bm25_stats}}).matched_count == 0:
+        vector_store.delete_document(user_id, doc_id_str)
+        db.chunk_terms.delete_many({'doc_id': doc_id_str})
+        raise JobError('Document was deleted during re-indexing.')
+    logging.info(f"Re-indexed doc_id {doc_id_str}: {counts}")
+    return {'chunks_stored': stored, 'chunks_total': len(chunks), **counts}
+
+def reindex_missing_vectors():
+    """Queue a re-index for every processed document that has no vectors in the store."""
+    queued = 0
+    for doc in db.documents.find({'processed': True}, {'_id': 1, 'user_id': 1}):
+        doc_id_str = str(doc['_id'])
+        try:
+            if vector_store.has_document(doc['user_id'], doc_id_str):
+                continue
+        except Exception as e:
+            logging.error(f"Vector consistency check failed for doc_id {doc_id_str}: {e}")
+            continue
+        # Documents being (re-)ingested get their vectors from that job
+        if ingest_queue.has_pending(['ingest', 'reingest', 'reindex'], doc_id_str):
+            continue
+        ingest_queue.enqueue('reindex', {}, user_id=doc['user_id'], doc_id=doc_id_str)
+        queued += 1
+    if queued:
+        logging.warning(f"Queued re-indexing for {queued} documents missing vectors")
 
 @app.route('/upload', methods=['POST'])
 def upload_document():
@@ -627,10 +864,10 @@ def upload_document():
     if not user_id:
         return jsonify({'detail': 'Authentication required.'}), 401
 
-    # Validation: limit to 3 documents per user
-    user_doc_count = db.documents.count_documents({'user_id': user_id})
-    if user_doc_count >= 3:
-        return jsonify({'detail': 'You can only upload a maximum of 3 documents.'}), 400
+    # Validation: per-plan document limit
+    quotas = get_quotas(db.users, user_id)
+    if remaining(quotas, 'max_documents', db.documents.count_documents({'user_id': user_id})) == 0:
+        return jsonify({'detail': f"You can only upload a maximum of {quotas['max_documents']} documents."}), 400
 
     if request.content_type and request.content_type.startswith('multipart/form-data'):
         file = request.files.get('file')
@@ -639,139 +876,176 @@ def upload_document():
         if not file or not doc_type or doc_type not in ['pdf', 'doc', 'docx']:
             return jsonify({'detail': 'File and valid type (pdf/doc/docx) are required.'}), 400
         filename = secure_filename(file.filename)
-        
-        # Extract text from file
-        if doc_type == 'pdf':
-            file.seek(0)
-            file_content = extract_text_from_pdf(file)
-        elif doc_type == 'docx' or (file.filename and file.filename.lower().endswith('.docx')):
-            file.seek(0)
-            file_content = extract_text_from_docx(file)
-        else:
-            file_content = file.read().decode('utf-8', errors='ignore')
-        
-        # Check if content is extracted successfully
-        if not file_content or len(file_content.strip()) < 50:
-            return jsonify({'detail': 'Could not extract meaningful content from the file. Please ensure the file contains readable text.'}), 400
-        
-        logging.info(f"Extracted {len(file_content)} characters from document")
-        
-        # Use improved document processing for large files
-        chunks = process_large_document(file_content)
-        
-        if not chunks:
-            return jsonify({'detail': 'Could not process the document content. Please try a different file.'}), 400
-        
-        # Store the original content for chat context
+        raw_file = save_raw_upload(file, filename)
         doc = {
             'user_id': user_id,
             'name': name,
             'type': doc_type,
-            'content': file_content,  # Store original content
-            'uploaded_at': datetime.utcnow().isoformat() + 'Z',
-            'processed': True
+            'raw_file': raw_file,
         }
-        result = db.documents.insert_one(doc)
-        doc['_id'] = str(result.inserted_id)
-        doc_id_str = doc['_id']
-        
-        # Store embeddings for each chunk
-        successful_embeddings = 0
-        for idx, chunk in enumerate(chunks):
-            chunk_id = f"{doc_id_str}_chunk_{idx}"
-            embedding = embed_text(chunk)
-            if embedding:
-                try:
-                    doc_collection.add(
-                        ids=[chunk_id],
-                        embeddings=[embedding],
-                        documents=[chunk],
-                        metadatas=[{"doc_id": doc_id_str, "user_id": user_id, "name": name, "chunk_index": idx}]
-                    )
-                    successful_embeddings += 1
-                except Exception as e:
-                    logging.error(f"Failed to add chunk {idx} to ChromaDB: {e}")
-        
-        logging.info(f"Successfully stored {successful_embeddings}/{len(chunks)} chunks in ChromaDB for doc_id {doc_id_str}")
-        
-        if successful_embeddings == 0:
-            return jsonify({'detail': 'Failed to process document embeddings. Please try again.'}), 500
-        
-        return jsonify({
-            "message": f"Document processed successfully: {name} ({successful_embeddings} chunks stored)",
-            **doc
-        }), 201
+        payload = {'source': 'file', 'raw_file': raw_file, 'filename': filename, 'type': doc_type, 'name': name}
     else:
         try:
             data = request.json
-            doc = DocumentCreate(**data)
+            doc_create = DocumentCreate(**data)
         except ValidationError as e:
             return jsonify({'detail': e.errors()}), 422
         except Exception:
             return jsonify({'detail': 'Invalid request.'}), 400
-        doc_dict = doc.dict()
-        doc_dict['user_id'] = user_id
-        doc_dict['uploaded_at'] = datetime.utcnow().isoformat() + 'Z'
-        doc_dict['processed'] = True
-        if doc_dict.get('url') is not None:
-            doc_dict['url'] = str(doc_dict['url'])
-            # Extract and process content from URL
-            url_content = extract_text_from_url(doc_dict['url'])
-            if not url_content or len(url_content.strip()) < 50:
-                return jsonify({'detail': 'Could not extract meaningful content from the URL.'}), 400
-            
-            # Use improved document processing
-            chunks = process_large_document(url_content)
-            if not chunks:
-                return jsonify({'detail': 'Could not process the URL content.'}), 400
-            
-            doc_dict['content'] = url_content  # Store original content
-        else:
+        if doc_create.url is None:
             return jsonify({'detail': 'URL is required for URL uploads.'}), 400
-        
-        result = db.documents.insert_one(doc_dict)
-        doc_dict['_id'] = str(result.inserted_id)
-        doc_id_str = doc_dict['_id']
-        
-        # Store embeddings for each chunk
-        successful_embeddings = 0
-        for idx, chunk in enumerate(chunks):
-            chunk_id = f"{doc_id_str}_chunk_{idx}"
-            embedding = embed_text(chunk)
-            if embedding:
-                try:
-                    doc_collection.add(
-                        ids=[chunk_id],
-                        embeddings=[embedding],
-                        documents=[chunk],
-                        metadatas=[{"doc_id": doc_id_str, "user_id": user_id, "name": doc_dict['name'], "chunk_index": idx}]
-                    )
-                    successful_embeddings += 1
-                except Exception as e:
-                    logging.error(f"Failed to add chunk {idx} to ChromaDB: {e}")
-        
-        logging.info(f"Successfully stored {successful_embeddings}/{len(chunks)} chunks in ChromaDB for doc_id {doc_id_str}")
-        
-        if successful_embeddings == 0:
-            return jsonify({'detail': 'Failed to process document embeddings. Please try again.'}), 500
-        
-        return jsonify({
-            "message": f"URL processed successfully: {doc_dict['name']} ({successful_embeddings} chunks stored)",
-            **doc_dict
-        }), 201
+        doc = doc_create.dict(exclude={'content'})
+        doc['user_id'] = user_id
+        doc['url'] = str(doc['url'])
+        payload = {'source': 'url', 'url': doc['url'], 'type': doc['type'], 'name': doc['name'], 'crawl': doc['crawl']}
+
+    doc_id_str, job_id = queue_document(doc, payload)
+
+    doc['_id'] = doc_id_str
+    doc['job_id'] = job_id
+    doc.pop('raw_file', None)
+    return jsonify({
+        "message": f"Document queued for processing: {doc['name']}",
+        **doc
+    }), 202
+
+@app.route('/upload/bulk', methods=['POST'])
+def upload_documents_bulk():
+    """
+    Queue many documents at once: multipart `files` fields, any of which may
+    be a zip archive. Each file becomes its own ingestion job, so the worker
+    pool processes them concurrently. Returns per-file results.
+    """
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'detail': 'Authentication required.'}), 401
+    if not (request.content_type and request.content_type.startswith('multipart/form-data')):
+        return jsonify({'detail': 'Bulk uploads must be multipart/form-data with one or more files.'}), 400
+
+    quotas = get_quotas(db.users, user_id)
+    with contextlib.ExitStack() as stack:
+        try:
+            entries = list(iter_bulk_entries(request.files.getlist('files'), stack))
+        except (zipfile.BadZipFile, ValueError) as e:
+            return jsonify({'detail': f'Invalid archive: {e}'}), 400
+        if not entries:
+            return jsonify({'detail': 'No files uploaded.'}), 400
+        if quotas['max_bulk_files'] and len(entries) > quotas['max_bulk_files']:
+            return jsonify({'detail': f"A bulk upload may contain at most {quotas['max_bulk_files']} files on the {quotas['plan']} plan."}), 400
+
+        slots = remaining(quotas, 'max_documents', db.documents.count_documents({'user_id': user_id}))
+        batch_id = str(ObjectId())
+        results = []
+        for name, open_stream in entries:
+            filename = secure_filename(os.path.basename(name))
+            doc_type = BULK_UPLOAD_TYPES.get(os.path.splitext(filename)[1].lower())
+            if not doc_type:
+                results.append({'filename': name, 'status': 'rejected', 'detail': 'Unsupported file type.'})
+                continue
+            if slots == 0:
+                results.append({'filename': name, 'status': 'rejected',
+                                'detail': f"Document limit of {quotas['max_documents']} reached."})
+                continue
+            raw_file = save_raw_stream(open_stream(), filename)
+            doc = {'user_id': user_id, 'name': name, 'type': doc_type, 'raw_file': raw_file, 'batch_id': batch_id}
+            payload = {'source': 'file', 'raw_file': raw_file, 'filename': filename, 'type': doc_type, 'name': name}
+            doc_id_str, job_id = queue_document(doc, payload)
+            if slots is not None:
+                slots -= 1
+            results.append({'filename': name, 'status': 'queued', '_id': doc_id_str, 'job_id': job_id})
+
+    queued = sum(1 for result in results if result['status'] == 'queued')
+    return jsonify({
+        'message': f'{queued} of {len(results)} documents queued for processing.',
+        'batch_id': batch_id,
+        'queued': queued,
+        'rejected': len(results) - queued,
+        'files': results,
+    }), 202 if queued else 400
+
+@app.route('/upload/bulk/<batch_id>', methods=['GET'])
+def get_bulk_upload_status(batch_id):
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'detail': 'Authentication required.'}), 401
+    docs = list(db.documents.find(
+        {'user_id': user_id, 'batch_id': batch_id},
+        {'name': 1, 'status': 1, 'progress': 1, 'error': 1, 'job_id': 1}
+    ))
+    if not docs:
+        return jsonify({'detail': 'Batch not found or not authorized.'}), 404
+    counts = {}
+    for doc in docs:
+        counts[doc.get('status')] = counts.get(doc.get('status'), 0) + 1
+        doc['_id'] = str(doc['_id'])
+    return jsonify({'batch_id': batch_id, 'total': len(docs), 'counts': counts, 'files': docs}), 200
+
+@app.route('/documents/<doc_id>', methods=['PUT'])
+def update_document(doc_id):
+    """
+    Re-ingest a document from a new file (multipart) or by re-fetching its
+    URL (JSON, optionally with a new `url`). Chats are kept and only chunks
+    whose text changed are embedded again.
+    """
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'detail': 'Authentication required.'}), 401
+    doc = db.documents.find_one({'_id': ObjectId(doc_id), 'user_id': user_id}, DOC_LIGHT_PROJECTION)
+    if not doc:
+        return jsonify({'detail': 'Document not found or not authorized.'}), 404
+    if ingest_queue.has_pending(['ingest', 'reingest', 'reindex'], doc_id):
+        return jsonify({'detail': 'Document is already being processed.'}), 409
+
+    if request.content_type and request.content_type.startswith('multipart/form-data'):
+        file = request.files.get('file')
+        doc_type = request.form.get('type') or doc.get('type')
+        if not file or doc_type not in ['pdf', 'doc', 'docx']:
+            return jsonify({'detail': 'File and valid type (pdf/doc/docx) are required.'}), 400
+        filename = secure_filename(file.filename)
+        raw_file = save_raw_upload(file, filename)
+        payload = {'source': 'file', 'raw_file': raw_file, 'filename': filename, 'type': doc_type, 'name': doc['name']}
+    else:
+        data = request.get_json(silent=True) or {}
+        try:
+            doc_update = DocumentCreate(name=doc['name'], type='url', url=data.get('url') or doc.get('url'))
+        except ValidationError as e:
+            return jsonify({'detail': e.errors()}), 422
+        if doc_update.url is None:
+            return jsonify({'detail': 'A file or URL is required to update this document.'}), 400
+        payload = {'source': 'url', 'url': str(doc_update.url), 'type': 'url', 'name': doc['name'],
+                   'crawl': bool(data.get('crawl', doc.get('crawl', False)))}
+
+    job_id = ingest_queue.enqueue('reingest', payload, user_id=user_id, doc_id=doc_id)
+    db.documents.update_one({'_id': ObjectId(doc_id)}, {'$set': {'job_id': job_id, 'status': 'queued', 'progress': 0}})
+    return jsonify({
+        "message": f"Document update queued for processing: {doc['name']}",
+        '_id': doc_id,
+        'job_id': job_id
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'detail': 'Authentication required.'}), 401
+    job = ingest_queue.get(job_id, user_id=user_id)
+    if not job:
+        return jsonify({'detail': 'Job not found or not authorized.'}), 404
+    return jsonify(serialize_job(job)), 200
+
 
 @app.route('/documents', methods=['GET'])
 def get_documents():
     user_id = get_current_user_id()
     if not user_id:
         return jsonify({'detail': 'Authentication required.'}), 401
-    docs = list(db.documents.find({'user_id': user_id}))
+    docs = list(db.documents.find({'user_id': user_id}, {**DOC_LIGHT_PROJECTION, 'raw_file': 0, 'bm25': 0, 'summary': 0}))
+    # Documents created before blob storage keep their audio inline
+    legacy_podcasts = set(db.documents.distinct('_id', {'user_id': user_id, 'podcast_audio': {'$exists': True}}))
     for doc in docs:
-        doc['_id'] = str(doc['_id'])
         # Add a flag instead of returning binary data
-        doc['has_podcast'] = 'podcast_audio' in doc
-        if 'podcast_audio' in doc:
-            del doc['podcast_audio']  # Remove binary data from response
+        doc['has_podcast'] = bool(doc.get('podcast_blob_id')) or doc['_id'] in legacy_podcasts
+        doc['_id'] = str(doc['_id'])
     return jsonify(docs), 200
 
 @app.route('/documents/<doc_id>', methods=['DELETE'])
@@ -779,10 +1053,15 @@ def delete_document(doc_id):
     user_id = get_current_user_id()
     if not user_id:
         return jsonify({'detail': 'Authentication required.'}), 401
-    doc = db.documents.find_one({'_id': ObjectId(doc_id), 'user_id': user_id})
+    doc = db.documents.find_one({'_id': ObjectId(doc_id), 'user_id': user_id}, DOC_LIGHT_PROJECTION)
     result = db.documents.delete_one({'_id': ObjectId(doc_id), 'user_id': user_id})
     db.chats.delete_many({'user_id': user_id, 'doc_id': doc_id})
+    conversation_memory.forget(user_id, doc_id)
     if result.deleted_count == 1:
+        db.chunk_terms.delete_many({'doc_id': doc_id})
+        answer_cache.invalidate(doc_id=doc_id)
+        remove_raw_upload(doc)
+        remove_document_blobs(doc)
         # Delete embedding file if it exists
         if doc and doc.get('name'):
             embedding_path = os.path.join(os.path.dirname(__file__), '../embeddings', secure_filename(doc['name']) + '.txt')
@@ -793,7 +1072,7 @@ def delete_document(doc_id):
                 pass
         # Remove all chunks from ChromaDB
         try:
-            doc_collection.delete(where={"doc_id": doc_id, "user_id": user_id})
+            vector_store.delete_document(user_id, doc_id)
         except Exception:
             pass
         return jsonify({'message': 'Document, related chats, and embedding file deleted successfully.'}), 200
@@ -802,8 +1081,106 @@ def delete_document(doc_id):
 
 
 
+# Advanced, multi-step, context-aware, document-only Q&A instructions with greeting handling
+QA_INSTRUCTIONS = (
+    "You are an advanced assistant designed to provide detailed and context-aware answers based solely on the content of the document provided. "
+    "Always answer in the same language as the user's question. "
+    "If the answer is not present in the document, reply: 'The answer is not present in the document.' Do not repeat this message unnecessarily. "
+    "The user will ask a question in their own words. You must perform the following steps:\n\n"
+    "1. **Interpretation**: Analyze the user's question and identify the specific information being requested.\n   "
+    "2. **Content Search**: Carefully search the document for all relevant information. If the document contains multiple sections that are related to the user's query, consider how they relate to each other and use them to build a comprehensive answer.\n   "
+    "3. **Answer Structuring**: Format your answer clearly and concisely. \n   - If the information is available in the document, summarize and present it in an organized way, making sure your answer directly addresses the user's question.\n   - If the question requires multiple steps or a multi-faceted answer, break down the response logically, ensuring clarity in each part of the answer.\n   "
+    "4. **Contextual Awareness**: Use the surrounding context in the document to interpret the meaning of terms and concepts. If a specific term, acronym, or phrase is unclear in the question, use context from the document to define or explain it.\n   "
+    "5. **Fallback for Missing Information**: If the document does not contain sufficient information to provide a definitive answer, respond with the following message: \n   - **'The answer is not present in the document.'**\n   - Avoid speculation or external references, and ensure that the response does not veer off-topic.\n   "
+    "6. **Edge Cases Handling**: \n   - If the question is ambiguous or could be interpreted in multiple ways, provide a clarifying message asking the user to rephrase or specify further details.\n   - If the user asks for an opinion or subjective information that cannot be derived from the document, politely explain that the document only contains factual information, and you cannot provide subjective insights.\n   "
+    "7. **Greetings Handling**: If the user's question is a greeting (such as 'hi', 'hello', etc.), respond in a friendly, conversational manner as a human would, regardless of the document content.\n\n"
+    "8. **Term Variations**: If the user's question uses a term that is a minor variation (such as different capitalization, hyphenation, or spacing) of a term in the document, treat them as referring to the same concept and answer accordingly.\n\n"
+)
+
+def load_history(user_id, doc_id):
+    """Render the conversation so far for the prompt; '' for a first question."""
+    with stage('history_load'):
+        summary, turns = conversation_memory.recall(user_id, doc_id)
+        history, _ = format_history(summary, turns)
+    return history
+
+def build_chat_prompt(doc, doc_id, user_id, question, history, question_embedding=None):
+    """
+    Retrieve context for `question` and build the document Q&A prompt within
+    the token budget, including the conversation so far. Returns
+    (prompt, search_strategy); prompt is None if the question could not be
+    processed.
+    """
+    search_strategy = "hybrid_search"
+
+    # One question embedding (cached) plus one Chroma query and one BM25 lookup
+    if question_embedding is None:
+        with stage('question_embedding'):
+            question_embedding = embed_text(question)
+    try:
+        ranked_chunks = hybrid_search(vector_store.collection(user_id), db.chunk_terms, doc, user_id, question, question_embedding)
+    except Exception as e:
+        logging.error(f"Hybrid search failed: {e}")
+        ranked_chunks = []
+
+    if ranked_chunks:
+        context_chunks = [chunk["text"] for chunk in ranked_chunks]
+        logging.info(f"Hybrid search found {len(ranked_chunks)} chunks")
+    elif question_embedding is None:
+        return None, search_strategy
+    else:
+        search_strategy = "fallback_full_content"
+        # Fallback to document content (cut to the budget) if nothing was indexed
+        with stage('content_load'):
+            context_chunks = [load_document_content(doc)]
+        logging.info("No indexed chunks found, using full document content")
+
+    with stage('prompt_assembly'):
+        prompt, prompt_stats = build_context_prompt(QA_INSTRUCTIONS, question, context_chunks, history=history)
+    set_strategy(search_strategy)
+    logging.info(
+        f"Chat context for doc {doc_id}: strategy={search_strategy}, "
+        f"chunks={prompt_stats['chunks_used']}/{prompt_stats['chunks_available']}, "
+        f"context_tokens={prompt_stats['context_tokens']}, history_tokens={prompt_stats['history_tokens']}, "
+        f"prompt_tokens={prompt_stats['prompt_tokens']}"
+    )
+    return prompt, search_strategy
+
+def find_cached_answer(doc_id, question):
+    """
+    Look for a cached answer, first by normalized question text, then by
+    question embedding similarity. Returns (answer, question_embedding);
+    answer is None on a miss and the embedding is reused for retrieval.
+    """
+    with stage('answer_cache_lookup'):
+        answer = answer_cache.lookup_exact(doc_id, question)
+    if answer is not None:
+        return answer, None
+    with stage('question_embedding'):
+        question_embedding = embed_text(question)
+    with stage('answer_cache_lookup'):
+        answer = answer_cache.lookup_similar(doc_id, question_embedding, get_embedding_provider().model_id)
+    return answer, question_embedding
+
+def save_chat_message(user_id, doc_id, question, answer):
+    chat_msg = ChatMessage(
+        user_id=user_id,
+        doc_id=doc_id,
+        question=question,
+        answer=answer,
+        timestamp=datetime.utcnow().isoformat() + 'Z'
+    )
+    with stage('history_insert'):
+        result = db.chats.insert_one(chat_msg.dict())
+    conversation_memory.record_turn(user_id, doc_id)
+    return str(result.inserted_id)
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.route('/chat', methods=['POST'])
 def chat_with_doc():
+    start_request_trace('chat')
     user_id = get_current_user_id()
     if not user_id:
         return jsonify({'detail': 'Authentication required.'}), 401
@@ -829,178 +1206,181 @@ def chat_with_doc():
     if not doc_id or not question:
         return jsonify({'detail': 'doc_id and question are required.'}), 400
 
-    doc = db.documents.find_one({'_id': ObjectId(doc_id), 'user_id': user_id})
+    with stage('doc_lookup'):
+        doc = db.documents.find_one({'_id': ObjectId(doc_id), 'user_id': user_id}, DOC_LIGHT_PROJECTION)
     if not doc:
         return jsonify({'detail': 'Document not found or not authorized.'}), 404
 
-    # Enhanced search strategy for better coverage
-    selected_context = ""
-    search_strategy = "semantic_search"
-    
-    try:
-        # Get question embedding
-        question_embedding = embed_text(question)
-        if not question_embedding:
-            return jsonify({'detail': 'Failed to process question. Please try again.'}), 500
-        
-        # Strategy 1: Semantic search with more results
-        results = doc_collection.query(
-            query_embeddings=[question_embedding],
-            n_results=10,  # Increased from 5 to 10 for better coverage
-            where={"doc_id": doc_id, "user_id": user_id}
-        )
-        
-        if results and results['documents'] and len(results['documents'][0]) > 0:
-            relevant_chunks = results['documents'][0]
-            selected_context = "\n\n".join(relevant_chunks)
-            logging.info(f"Found {len(relevant_chunks)} relevant chunks via semantic search")
-            
-            # If we found very few chunks, try additional strategies
-            if len(relevant_chunks) < 3:
-                search_strategy = "enhanced_search"
-                # Strategy 2: Try with different question variations
-                question_variations = [
-                    question.lower(),
-                    question.replace("?", "").replace("what", "").replace("how", "").replace("why", "").strip(),
-                    " ".join([word for word in question.lower().split() if len(word) > 3])  # Keep only longer words
-                ]
-                
-                additional_chunks = set()
-                for variation in question_variations:
-                    if len(variation.strip()) > 10:  # Only try meaningful variations
-                        try:
-                            var_embedding = embed_text(variation)
-                            if var_embedding:
-                                var_results = doc_collection.query(
-                                    query_embeddings=[var_embedding],
-                                    n_results=5,
-                                    where={"doc_id": doc_id, "user_id": user_id}
-                                )
-                                if var_results and var_results['documents'] and len(var_results['documents'][0]) > 0:
-                                    additional_chunks.update(var_results['documents'][0])
-                        except Exception as e:
-                            logging.error(f"Variation search failed: {e}")
-                
-                # Combine all found chunks
-                all_chunks = list(set(relevant_chunks + list(additional_chunks)))
-                if len(all_chunks) > len(relevant_chunks):
-                    selected_context = "\n\n".join(all_chunks)
-                    logging.info(f"Enhanced search found {len(all_chunks)} total chunks")
-        else:
-            search_strategy = "fallback_full_content"
-            # Fallback to full document content if no embeddings found
-            selected_context = doc.get('content', '')
-            logging.info("No embeddings found, using full document content")
-            
-    except Exception as e:
-        logging.error(f"Semantic search failed: {e}")
-        search_strategy = "fallback_full_content"
-        # Fallback to full document content
-        selected_context = doc.get('content', '')
-        logging.info("Using fallback to full document content")
+    # Standalone questions use the cache even mid-conversation; answers to follow-ups depend on earlier turns
+    history = load_history(user_id, doc_id)
+    cacheable = not is_follow_up(question)
+    cached_answer, question_embedding = find_cached_answer(doc_id, question) if cacheable else (None, None)
+    if cached_answer is not None:
+        set_strategy('answer_cache')
+        save_chat_message(user_id, doc_id, question, cached_answer)
+        return jsonify({"answer": cached_answer, "cached": True})
+
+    prompt, search_strategy = build_chat_prompt(doc, doc_id, user_id, question, history, question_embedding)
+    if prompt is None:
+        return jsonify({'detail': 'Failed to process question. Please try again.'}), 500
+
+    with stage('llm'):
+        answer = scan_with_gpt(prompt)
+    if cacheable:
+        with stage('answer_cache_store'):
+            answer_cache.store(doc_id, user_id, question, answer, question_embedding, get_embedding_provider().model_id)
+
+    # Store chat history
+    save_chat_message(user_id, doc_id, question, answer)
+    return jsonify({"answer": answer, "cached": False})
+
+@app.route('/chat/stream', methods=['POST'])
+def stream_chat_with_doc():
+    """Answer a question as server-sent events: `token` events, then `done` once the answer is stored."""
+    trace = start_request_trace('chat_stream')
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'detail': 'Authentication required.'}), 401
+
+    data = request.json or {}
+    doc_id = data.get('doc_id')
+    question = data.get('question')
+    if not doc_id or not question:
+        return jsonify({'detail': 'doc_id and question are required.'}), 400
+
+    with stage('doc_lookup'):
+        doc = db.documents.find_one({'_id': ObjectId(doc_id), 'user_id': user_id}, DOC_LIGHT_PROJECTION)
+    if not doc:
+        return jsonify({'detail': 'Document not found or not authorized.'}), 404
 
-    # If we still don't have enough context, try keyword-based approach
-    if len(selected_context.strip()) < 1000 and search_strategy != "fallback_full_content":
-        logging.info("Insufficient context found, trying keyword-based search")
+    history = load_history(user_id, doc_id)
+    cacheable = not is_follow_up(question)
+    cached_answer, question_embedding = find_cached_answer(doc_id, question) if cacheable else (None, None)
+    if cached_answer is not None:
+        set_strategy('answer_cache')
+        chat_id = save_chat_message(user_id, doc_id, question, cached_answer)
+        events = [
+            format_sse('token', {'text': cached_answer}),
+            format_sse('done', {'answer': cached_answer, 'chat_id': chat_id, 'cached': True}),
+        ]
+        return Response(events, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+    prompt, search_strategy = build_chat_prompt(doc, doc_id, user_id, question, history, question_embedding)
+    if prompt is None:
+        return jsonify({'detail': 'Failed to process question. Please try again.'}), 500
+
+    def generate():
+        parts = []
+        start_ns = time.time_ns()
+        started = time.perf_counter()
         try:
-            # Extract key terms from the question
-            key_terms = [word.lower() for word in question.split() if len(word) > 3]
-            
-            # Get all chunks for this document
-            all_chunks_results = doc_collection.get(
-                where={"doc_id": doc_id, "user_id": user_id}
-            )
-            
-            if all_chunks_results and all_chunks_results['documents']:
-                keyword_matched_chunks = []
-                for chunk in all_chunks_results['documents']:
-                    chunk_lower = chunk.lower()
-                    # Check if any key term appears in the chunk
-                    if any(term in chunk_lower for term in key_terms):
-                        keyword_matched_chunks.append(chunk)
-                
-                if keyword_matched_chunks:
-                    selected_context = "\n\n".join(keyword_matched_chunks)
-                    search_strategy = "keyword_search"
-                    logging.info(f"Keyword search found {len(keyword_matched_chunks)} chunks")
-                else:
-                    # Last resort: use full content
-                    selected_context = doc.get('content', '')
-                    search_strategy = "fallback_full_content"
-                    logging.info("No keyword matches, using full content")
+            for token in stream_with_gpt(prompt):
+                if not parts:
+                    trace.record('llm_first_token', start_ns, time.perf_counter() - started)
+                parts.append(token)
+                yield format_sse('token', {'text': token})
         except Exception as e:
-            logging.error(f"Keyword search failed: {e}")
-            selected_context = doc.get('content', '')
-            search_strategy = "fallback_full_content"
-
-    # Truncate content if it's too large for the model
-    selected_context = truncate_content_for_model(selected_context, max_tokens=80000)
-
-    # Log the search strategy and context
-    print("=== SEARCH STRATEGY ===")
-    print(f"Strategy used: {search_strategy}")
-    print(f"Context length: {len(selected_context)} characters")
-    print(f"Estimated tokens: {estimate_tokens(selected_context)}")
-    print("Context preview:", selected_context[:500] + "..." if len(selected_context) > 500 else selected_context)
-
-    # Use the advanced, multi-step, context-aware, document-only Q&A prompt with greeting handling
-    prompt = (
-        "You are an advanced assistant designed to provide detailed and context-aware answers based solely on the content of the document provided. "
-        "Always answer in the same language as the user's question. "
-        "If the answer is not present in the document, reply: 'The answer is not present in the document.' Do not repeat this message unnecessarily. "
-        "The user will ask a question in their own words. You must perform the following steps:\n\n"
-        "1. **Interpretation**: Analyze the user's question and identify the specific information being requested.\n   "
-        "2. **Content Search**: Carefully search the document for all relevant information. If the document contains multiple sections that are related to the user's query, consider how they relate to each other and use them to build a comprehensive answer.\n   "
-        "3. **Answer Structuring**: Format your answer clearly and concisely. \n   - If the information is available in the document, summarize and present it in an organized way, making sure your answer directly addresses the user's question.\n   - If the question requires multiple steps or a multi-faceted answer, break down the response logically, ensuring clarity in each part of the answer.\n   "
-        "4. **Contextual Awareness**: Use the surrounding context in the document to interpret the meaning of terms and concepts. If a specific term, acronym, or phrase is unclear in the question, use context from the document to define or explain it.\n   "
-        "5. **Fallback for Missing Information**: If the document does not contain sufficient information to provide a definitive answer, respond with the following message: \n   - **'The answer is not present in the document.'**\n   - Avoid speculation or external references, and ensure that the response does not veer off-topic.\n   "
-        "6. **Edge Cases Handling**: \n   - If the question is ambiguous or could be interpreted in multiple ways, provide a clarifying message asking the user to rephrase or specify further details.\n   - If the user asks for an opinion or subjective information that cannot be derived from the document, politely explain that the document only contains factual information, and you cannot provide subjective insights.\n   "
-        "7. **Greetings Handling**: If the user's question is a greeting (such as 'hi', 'hello', etc.), respond in a friendly, conversational manner as a human would, regardless of the document content.\n\n"
-        "8. **Term Variations**: If the user's question uses a term that is a minor variation (such as different capitalization, hyphenation, or spacing) of a term in the document, treat them as referring to the same concept and answer accordingly.\n\n"
-        "**Document Content:**\n" + selected_context + "\n\n**User's Question:**\n" + question + "\n\n**Your Answer:**\n"
-    )
-    
-    # Check if the total prompt would exceed token limits
-    total_estimated_tokens = estimate_tokens(prompt)
-    if total_estimated_tokens > 120000:  # Leave some buffer
-        # Further truncate the context
-        selected_context = truncate_content_for_model(selected_context, max_tokens=60000)
-        prompt = (
-            "You are an advanced assistant designed to provide detailed and context-aware answers based solely on the content of the document provided. "
-            "Always answer in the same language as the user's question. "
-            "If the answer is not present in the document, reply: 'The answer is not present in the document.' Do not repeat this message unnecessarily. "
-            "**Document Content:**\n" + selected_context + "\n\n**User's Question:**\n" + question + "\n\n**Your Answer:**\n"
-        )
-        logging.info(f"Prompt truncated to approximately {estimate_tokens(prompt)} tokens")
-    
-    print("=== PROMPT SENT TO MODEL ===")
-    print(f"Total estimated tokens: {estimate_tokens(prompt)}")
-    answer = scan_with_gpt(prompt)
-    print("=== MODEL RESPONSE ===")
-    print(answer)
+            logging.error(f"Streaming completion failed: {e}")
+            set_strategy('error')
+            yield format_sse('error', {'detail': f'Answer generation failed: {str(e)}'})
+            return
+        finally:
+            trace.record('llm', start_ns, time.perf_counter() - started)
+        answer = ''.join(parts)
+        if cacheable:
+            with stage('answer_cache_store'):
+                answer_cache.store(doc_id, user_id, question, answer, question_embedding, get_embedding_provider().model_id)
+        chat_id = save_chat_message(user_id, doc_id, question, answer)
+        yield format_sse('done', {'answer': answer, 'chat_id': chat_id, 'search_strategy': search_strategy, 'cached': False})
 
-    # Store chat history
-    chat_msg = ChatMessage(
-        user_id=user_id,
-        doc_id=doc_id,
-        question=question,
-        answer=answer,
-        timestamp=datetime.utcnow().isoformat() + 'Z'
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
     )
-    db.chats.insert_one(chat_msg.dict())
-    return jsonify({"answer": answer})
+
 @app.route('/chat', methods=['GET'])
 def get_chat_history():
+    """
+    A page of chat messages for `doc_id`, oldest first. By default the newest
+    `limit` messages; `before=<id>` pages back through older ones and
+    `after=<id>` returns only messages newer than the client's watermark.
+    `fields` is a comma-separated projection (default: all message fields).
+    """
     user_id = get_current_user_id()
     if not user_id:
         return jsonify({'detail': 'Authentication required.'}), 401
     doc_id = request.args.get('doc_id')
     if not doc_id:
         return jsonify({'detail': 'doc_id is required as a query parameter.'}), 400
-    chats = list(db.chats.find({'user_id': user_id, 'doc_id': doc_id}))
+    try:
+        limit = min(int(request.args.get('limit', CHAT_HISTORY_PAGE_SIZE)), CHAT_HISTORY_MAX_PAGE_SIZE)
+        after = ObjectId(request.args['after']) if request.args.get('after') else None
+        before = ObjectId(request.args['before']) if request.args.get('before') else None
+    except (ValueError, InvalidId):
+        return jsonify({'detail': 'limit must be an integer and after/before must be chat ids.'}), 400
+    if limit < 1:
+        return jsonify({'detail': 'limit must be at least 1.'}), 400
+    fields = request.args.get('fields')
+    if fields:
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = set(fields) - CHAT_HISTORY_FIELDS
+        if unknown:
+            return jsonify({'detail': f"Unknown fields: {', '.join(sorted(unknown))}."}), 400
+    else:
+        fields = sorted(CHAT_HISTORY_FIELDS)
+
+    # Served by the (user_id, doc_id, _id) index; _id order is insertion order
+    query = {'user_id': user_id, 'doc_id': doc_id}
+    id_range = {}
+    if after:
+        id_range['$gt'] = after
+    if before:
+        id_range['$lt'] = before
+    if id_range:
+        query['_id'] = id_range
+    # `after` pages forward from a watermark; otherwise page backwards from the newest (or `before`)
+    direction = ASCENDING if after else DESCENDING
+    chats = list(
+        db.chats.find(query, {field: 1 for field in fields})
+        .sort('_id', direction)
+        .limit(limit + 1)
+    )
+    has_more = len(chats) > limit
+    chats = chats[:limit]
+    if direction == DESCENDING:
+        chats.reverse()
     for chat in chats:
         chat['_id'] = str(chat['_id'])
-    return jsonify(chats), 200
+    return jsonify({
+        'messages': chats,
+        'has_more': has_more,
+        # Pass as `before` to load older messages, or as `after` to poll for newer ones
+        'oldest_id': chats[0]['_id'] if chats else None,
+        'newest_id': chats[-1]['_id'] if chats else (str(after) if after else None),
+    }), 200
+
+@app.teardown_request
+def finish_request_trace(exc):
+    if exc is not None:
+        set_strategy('error')
+    finish_chat_trace()
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+@app.route('/api/cache_stats', methods=['GET'])
+def get_cache_stats():
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'detail': 'Authentication required.'}), 401
+    return jsonify({
+        'embedding_cache': embedding_cache.stats(),
+        'answer_cache': answer_cache.stats(),
+        'auth_cache': token_verifier.stats(),
+    }), 200
 
 @app.route('/api/convert_to_podcast', methods=['POST'])
 def convert_to_podcast():
@@ -1014,11 +1394,11 @@ def convert_to_podcast():
         return jsonify({'detail': 'Document ID is required.'}), 400
 
     # Retrieve document from DB
-    doc = db.documents.find_one({'_id': ObjectId(doc_id), 'user_id': user_id})
+    doc = db.documents.find_one({'_id': ObjectId(doc_id), 'user_id': user_id}, DOC_LIGHT_PROJECTION)
     if not doc:
         return jsonify({'detail': 'Document not found.'}), 404
 
-    content = doc.get('content', '')
+    content = load_document_content(doc)
     if not content or len(content.strip()) < 50:
         return jsonify({'detail': 'Document content is empty or too short.'}), 400
 
@@ -1031,8 +1411,7 @@ def convert_to_podcast():
             content_to_summarize = ' '.join(words[:max_words_for_summary])
         else:
             content_to_summarize = content
-        user = db.users.find_one({'_id': ObjectId(user_id)})
-        user_name = user.get('username', 'User') if user else 'User'
+        user_name = get_current_username(user_id)
         expert_name = 'Expert'
         summary_prompt = f"""
             Please convert the following document into a 10-minute conversational podcast script between two speakers, {user_name} and {expert_name}. Use ONLY the names {user_name} and {expert_name} as speakers in the script. Do NOT use Alice or Bob. {user_name} should ask insightful questions about the document, and {expert_name} should answer them in detail, explaining the key points, facts, and concepts. Make the conversation natural, engaging, and informative, as if {user_name} is curious and {expert_name} is knowledgeable. Limit the script to about 1400 words.\n\nDocument content:\n{content_to_summarize}
@@ -1062,7 +1441,14 @@ def convert_to_podcast():
         audio_fp = io.BytesIO()
         tts.write_to_fp(audio_fp)
         audio_bytes = audio_fp.getvalue()
-        db.documents.update_one({'_id': ObjectId(doc_id), 'user_id': user_id}, {'$set': {'podcast_audio': audio_bytes}})
+        audio_ref = blob_store.put(audio_bytes, content_type='audio/mpeg', filename=f"podcast_{doc_id}.mp3")
+        db.documents.update_one(
+            {'_id': ObjectId(doc_id), 'user_id': user_id},
+            {'$set': {'podcast_blob_id': audio_ref['blob_id'], 'podcast_size': audio_ref['size']},
+             '$unset': {'podcast_audio': ''}}
+        )
+        if doc.get('podcast_blob_id') and doc['podcast_blob_id'] != audio_ref['blob_id']:
+            blob_store.delete(doc['podcast_blob_id'])
         audio_fp.seek(0)
     except Exception as e:
         import traceback
@@ -1084,24 +1470,51 @@ def get_podcast_audio(doc_id):
     user_id = get_current_user_id()
     if not user_id:
         return jsonify({'detail': 'Authentication required.'}), 401
-    doc = db.documents.find_one({'_id': ObjectId(doc_id), 'user_id': user_id})
-    if not doc or 'podcast_audio' not in doc:
-        return jsonify({'detail': 'Podcast audio not found.'}), 404
-    audio_bytes = doc['podcast_audio']
-    return send_file(
-        io.BytesIO(audio_bytes),
+    doc = db.documents.find_one({'_id': ObjectId(doc_id), 'user_id': user_id}, {'podcast_blob_id': 1})
+    if doc and doc.get('podcast_blob_id'):
+        # Stream straight from GridFS; only the requested byte range is read
+        audio_fp = blob_store.open(doc['podcast_blob_id'])
+        length = audio_fp.length
+        etag = (audio_fp.metadata or {}).get('sha256') or doc['podcast_blob_id']
+        last_modified = audio_fp.upload_date
+    else:
+        # Audio stored inline by older versions
+        doc = db.documents.find_one({'_id': ObjectId(doc_id), 'user_id': user_id}, {'podcast_audio': 1})
+        if not doc or 'podcast_audio' not in doc:
+            return jsonify({'detail': 'Podcast audio not found.'}), 404
+        audio_bytes = bytes(doc['podcast_audio'])
+        audio_fp = io.BytesIO(audio_bytes)
+        length = len(audio_bytes)
+        etag = hashlib.sha256(audio_bytes).hexdigest()
+        last_modified = None
+
+    response = Response(
+        wrap_file(request.environ, audio_fp, buffer_size=PODCAST_STREAM_CHUNK_SIZE),
         mimetype='audio/mpeg',
-        as_attachment=False,
-        download_name=f"podcast_{doc_id}.mp3"
+        direct_passthrough=True
     )
+    response.content_length = length
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Content-Disposition'] = f'inline; filename="podcast_{doc_id}.mp3"'
+    response.cache_control.private = True
+    response.cache_control.max_age = PODCAST_CACHE_MAX_AGE
+    # Handles If-None-Match/If-Modified-Since (304) and Range requests (206)
+    return response.make_conditional(request, accept_ranges=True, complete_length=length)
 
 @app.route('/api/podcast/<doc_id>', methods=['DELETE'])
 def delete_podcast_audio(doc_id):
     user_id = get_current_user_id()
     if not user_id:
         return jsonify({'detail': 'Authentication required.'}), 401
-    result = db.documents.update_one({'_id': ObjectId(doc_id), 'user_id': user_id}, {'$unset': {'podcast_audio': ''}})
-    if result.modified_count == 1:
+    doc = db.documents.find_one_and_update(
+        {'_id': ObjectId(doc_id), 'user_id': user_id},
+        {'$unset': {'podcast_audio': '', 'podcast_blob_id': '', 'podcast_size': ''}},
+        projection={'podcast_blob_id': 1, 'podcast_audio': 1}
+    )
+    if doc and (doc.get('podcast_blob_id') or 'podcast_audio' in doc):
+        blob_store.delete(doc.get('podcast_blob_id'))
         return jsonify({'message': 'Podcast audio deleted successfully.'}), 200
     else:
         return jsonify({'detail': 'Podcast audio not found or not authorized.'}), 404
@@ -1111,19 +1524,18 @@ def get_podcast_script(doc_id):
     user_id = get_current_user_id()
     if not user_id:
         return jsonify({'detail': 'Authentication required.'}), 401
-    doc = db.documents.find_one({'_id': ObjectId(doc_id), 'user_id': user_id})
+    doc = db.documents.find_one({'_id': ObjectId(doc_id), 'user_id': user_id}, DOC_LIGHT_PROJECTION)
     if not doc:
         return jsonify({'detail': 'Document not found.'}), 404
     # Regenerate the script using the same logic as convert_to_podcast
-    content = doc.get('content', '')
+    content = load_document_content(doc)
     if not content or len(content.strip()) < 50:
         return jsonify({'detail': 'Document content is empty or too short.'}), 400
     max_words_for_summary = 20000
     words = content.split()
     if len(words) > 1400:
         # Define user_name and expert_name before using them in the prompt
-        user = db.users.find_one({'_id': ObjectId(user_id)})
-        user_name = user.get('username', 'User') if user else 'User'
+        user_name = get_current_username(user_id)
         expert_name = 'Expert'
         if len(words) > max_words_for_summary:
             content_to_summarize = ' '.join(words[:max_words_for_summary])
@@ -1139,17 +1551,63 @@ def get_podcast_script(doc_id):
     else:
         script = content
     # Return as downloadable text file
-    from flask import Response
     return Response(
         script,
         mimetype='text/plain',
         headers={"Content-Disposition": f"attachment;filename=podcast_script_{doc_id}.txt"}
     )
 
+@app.errorhandler(PasswordServiceBusy)
+def handle_password_service_busy(e):
+    return jsonify({"detail": "The server is busy. Please try again in a moment."}), 429, {"Retry-After": "1"}
+
 @app.errorhandler(Exception)
 def handle_exception(e):
     import traceback
     return jsonify({"detail": str(e), "trace": traceback.format_exc()}), 500
 
+ingest_queue.register('ingest', run_ingest_job)
+ingest_queue.register('reindex', run_reindex_job)
+ingest_queue.register('reingest', run_reingest_job)
+
+_services_started = False
+_services_lock = threading.Lock()
+
+def start_services():
+    """
+    Check the database, ensure indexes and start the ingestion workers and
+    the vector consistency check, once per serving process. Not done at
+    import time: spawned password and PDF workers re-import the main module.
+    """
+    global _services_started
+    with _services_lock:
+        if _services_started:
+            return
+        _services_started = True
+    try:
+        # The ismaster command is cheap and does not require auth.
+        client.admin.command('ismaster')
+        print("[INFO] Database connected successfully.")
+        ensure_indexes(db)
+    except Exception as e:
+        print(f"[ERROR] Database connection failed: {e}")
+    # Set INGEST_WORKERS=0 on web-only instances and run `python -m flask_app.worker` separately
+    ingest_queue.start()
+    if VECTOR_CONSISTENCY_CHECK:
+        threading.Thread(target=reindex_missing_vectors, name="vector-consistency-check", daemon=True).start()
+
+def create_app():
+    """App factory for WSGI servers and `flask --app "flask_app.app:create_app()" run`."""
+    start_services()
+    return app
+
+@app.before_request
+def ensure_services_started():
+    # Covers servers pointed at `flask_app.app:app` instead of the factory
+    start_services()
+
 if __name__ == "__main__":
+    # With the reloader, only the child process that serves requests starts the services
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_services()
     app.run(debug=True) 
\ No newline at end of file
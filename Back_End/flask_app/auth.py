@@ -0,0 +1,98 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from cachetools import TTLCache
+from jose import jwt, JWTError
+
+# Verified tokens are cached by signature for this long (capped by the token's own expiry)
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "300"))
+# How often each process reloads token revocations made by other processes
+REVOCATION_REFRESH_SECONDS = int(os.getenv("REVOCATION_REFRESH_SECONDS", "30"))
+
+
+class TokenVerifier:
+    """
+    Verifies bearer tokens and caches the claims of valid ones in a TTL LRU
+    keyed by the token signature, so a token is only decoded once per TTL.
+    Revoked token ids (the jti, or a hash of the signature for tokens issued
+    without one) live in a Mongo collection, mirrored in memory and reloaded
+    every REVOCATION_REFRESH_SECONDS; revocations made in this process apply
+    immediately.
+    """
+
+    def __init__(self, secret_key, algorithm, revoked=None):
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.revoked = revoked
+        self._cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+        self._revoked_ids = set()
+        self._revoked_loaded = 0.0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "rejected": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    @staticmethod
+    def revocation_id(signature, claims):
+        """The token's jti; tokens issued before jti was added are identified by their signature."""
+        return claims.get("jti") or "sig:" + hashlib.sha256(signature.encode("utf-8")).hexdigest()
+
+    def _is_revoked(self, revocation_id):
+        if self.revoked is None:
+            return False
+        now = time.monotonic()
+        if now - self._revoked_loaded > REVOCATION_REFRESH_SECONDS:
+            try:
+                ids = {entry["_id"] for entry in self.revoked.find({"expires_at": {"$gt": datetime.utcnow()}}, {"_id": 1})}
+                with self._lock:
+                    self._revoked_ids = ids
+                    self._revoked_loaded = now
+            except Exception as e:
+                logging.error(f"Failed to load revoked tokens: {e}")
+        return revocation_id in self._revoked_ids
+
+    def verify(self, token):
+        """Return the token's claims, or None if it is invalid, expired or revoked."""
+        signing_input, _, signature = token.rpartition(".")
+        with self._lock:
+            cached = self._cache.get(signature)
+            hit = bool(cached) and cached[0] == signing_input and cached[1].get("exp", 0) > time.time()
+            self.counters["hits" if hit else "misses"] += 1
+        if hit:
+            claims = cached[1]
+        else:
+            try:
+                claims = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+            except JWTError:
+                self._count("rejected")
+                return None
+            with self._lock:
+                self._cache[signature] = (signing_input, claims)
+        if self._is_revoked(self.revocation_id(signature, claims)):
+            self._count("rejected")
+            return None
+        return claims
+
+    def revoke(self, token, claims):
+        """Revoke a verified token until it would have expired anyway."""
+        signature = token.rpartition(".")[2]
+        revocation_id = self.revocation_id(signature, claims)
+        expires_at = datetime.utcfromtimestamp(claims.get("exp", time.time()))
+        if self.revoked is not None:
+            self.revoked.update_one(
+                {"_id": revocation_id}, {"$set": {"expires_at": expires_at, "sub": claims.get("sub")}}, upsert=True
+            )
+        with self._lock:
+            self._revoked_ids.add(revocation_id)
+            self._cache.pop(signature, None)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, cached=len(self._cache), revoked=len(self._revoked_ids))
@@ -0,0 +1,66 @@
+import hashlib
+import logging
+from datetime import datetime
+
+import gridfs
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+
+class BlobStore:
+    """
+    Content-addressed blob storage on GridFS, for document text and podcast
+    audio that would otherwise bloat (or overflow) Mongo document records.
+    Identical content is stored once and reference counted.
+    """
+
+    def __init__(self, db, bucket_name="blobs"):
+        self.bucket = gridfs.GridFSBucket(db, bucket_name=bucket_name)
+        self.files = db[f"{bucket_name}.files"]
+
+    def put(self, data, content_type="application/octet-stream", filename=None):
+        """Store `data` (bytes) and return a reference {"blob_id", "size", "sha256"}."""
+        digest = hashlib.sha256(data).hexdigest()
+        existing = self.files.find_one_and_update(
+            {"metadata.sha256": digest},
+            {"$inc": {"metadata.refs": 1}}
+        )
+        if existing:
+            blob_id = existing["_id"]
+        else:
+            blob_id = self.bucket.upload_from_stream(
+                filename or digest,
+                data,
+                metadata={"sha256": digest, "content_type": content_type, "refs": 1, "created_at": datetime.utcnow()}
+            )
+        return {"blob_id": str(blob_id), "size": len(data), "sha256": digest}
+
+    def put_text(self, text, filename=None):
+        return self.put(text.encode("utf-8"), content_type="text/plain; charset=utf-8", filename=filename)
+
+    def open(self, blob_id):
+        """Return a seekable GridOut for streaming reads."""
+        return self.bucket.open_download_stream(ObjectId(blob_id))
+
+    def read(self, blob_id):
+        return self.open(blob_id).read()
+
+    def read_text(self, blob_id):
+        return self.read(blob_id).decode("utf-8")
+
+    def delete(self, blob_id):
+        """Drop one reference, deleting the blob when none remain."""
+        if not blob_id:
+            return
+        try:
+            entry = self.files.find_one_and_update(
+                {"_id": ObjectId(blob_id)},
+                {"$inc": {"metadata.refs": -1}},
+                return_document=ReturnDocument.AFTER
+            )
+            if entry and entry.get("metadata", {}).get("refs", 0) <= 0:
+                self.bucket.delete(ObjectId(blob_id))
+        except gridfs.errors.NoFile:
+            pass
+        except Exception as e:
+            logging.error(f"Failed to delete blob {blob_id}: {e}")
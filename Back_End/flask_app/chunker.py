@@ -0,0 +1,162 @@
+import math
+import re
+
+from .tokenizer import count_tokens
+
+# Sentence boundaries as in the original chunker: whitespace after . ! or ?
+SENTENCE_BREAK_RE = re.compile(r'(?<=[.!?])\s+')
+# ... and additionally blank lines, which end a sentence/paragraph outright
+PARAGRAPH_BREAK_RE = re.compile(r'(?<=[.!?])\s+|\s*\n[^\S\n]*\n\s*')
+WORD_RE = re.compile(r'\S+')
+# Chunks this short carry no useful context and are dropped
+MIN_CHUNK_CHARS = 50
+
+
+def iter_sentences(pieces, break_re=PARAGRAPH_BREAK_RE):
+    """
+    Yield (raw_text, start, end) for each sentence in `pieces` (a string or an
+    iterable of strings, e.g. PDF pages as they are extracted). Offsets index
+    into the concatenation of the pieces; sentences may span piece boundaries.
+    """
+    if isinstance(pieces, str):
+        pieces = (pieces,)
+    carry = ''
+    base = 0
+    for piece in pieces:
+        if not piece:
+            continue
+        buffer = carry + piece
+        consumed = 0
+        for match in break_re.finditer(buffer):
+            if match.end() == len(buffer):
+                break  # the break may extend into the next piece
+            yield from _sentence(buffer, consumed, match.start(), base)
+            consumed = match.end()
+        carry = buffer[consumed:]
+        base += consumed
+    yield from _sentence(carry, 0, len(carry), base)
+
+
+def _sentence(buffer, start, end, base):
+    raw = buffer[start:end]
+    stripped = raw.strip()
+    if stripped:
+        offset = start + len(raw) - len(raw.lstrip())
+        yield stripped, base + offset, base + offset + len(stripped)
+
+
+def _words_of(item):
+    """Split an item into per-word items, locating each word inside the item's raw text."""
+    _, _, start, _, raw = item
+    return [[m.group(), 1, start + m.start(), start + m.end(), m.group()] for m in WORD_RE.finditer(raw)]
+
+
+def iter_chunks(pieces, chunk_size=500, overlap=100, unit="words", compat=False, min_chars=MIN_CHUNK_CHARS):
+    """
+    Split text into overlapping chunks of whole sentences, in a single pass.
+
+    Yields {"index", "text", "start", "end", "size"} dicts, where text has its
+    whitespace collapsed, start/end are character offsets of the chunk in the
+    original text and size is measured in `unit` ("words" or "tokens").
+    Each sentence is measured once; overlap carries the trailing sentences of
+    the previous chunk that fit in `overlap` units.
+
+    Blank lines also end sentences, sentences longer than chunk_size are
+    split, and overlap is trimmed so a chunk never exceeds chunk_size.
+    compat=True instead reproduces the legacy chunk_text boundaries exactly
+    (word units only): overlap is re-counted word by word, long sentences are
+    kept whole, and if fewer than two chunks result the whole text becomes a
+    single chunk.
+    """
+    if unit not in ("words", "tokens"):
+        raise ValueError(f"Unknown chunk size unit: {unit}")
+    if compat and unit != "words":
+        raise ValueError("Compatibility mode only supports word-sized chunks")
+
+    # Items are [text, size, start, end, raw]: a sentence, or in compat mode
+    # also single words carried over as overlap
+    items = []
+    current_size = 0
+    ready = []
+    held = []  # compat: the first chunk waits until we know there will be a second
+    seen = [] if compat else None  # compat: sentences kept for the single-chunk fallback
+    emitted = 0
+
+    def emit():
+        nonlocal emitted, held, seen
+        text = ' '.join(item[0] for item in items)
+        if len(text) <= min_chars:
+            return
+        chunk = {"text": text, "start": items[0][2], "end": items[-1][3], "size": current_size}
+        emitted += 1
+        if compat and emitted == 1:
+            held = [chunk]
+            return
+        ready.extend(held)
+        ready.append(chunk)
+        held = []
+        seen = None
+
+    def add(item):
+        nonlocal items, current_size
+        size = item[1]
+        if current_size + size > chunk_size and items:
+            emit()
+            kept = []
+            kept_size = 0
+            for previous in reversed(items):
+                if kept_size + previous[1] > overlap:
+                    break
+                kept.append(previous)
+                kept_size += previous[1]
+            kept.reverse()
+            if compat:
+                kept = [word for previous in kept for word in (_words_of(previous) if previous[1] > 1 else [previous])]
+            else:
+                while kept and kept_size + size > chunk_size:
+                    kept_size -= kept.pop(0)[1]
+            items = kept
+            current_size = kept_size
+        items.append(item)
+        current_size += size
+
+    def measure(text, words):
+        return len(words) if unit == "words" else count_tokens(text)
+
+    index = 0
+    break_re = SENTENCE_BREAK_RE if compat else PARAGRAPH_BREAK_RE
+    for raw, start, end in iter_sentences(pieces, break_re):
+        words = raw.split()
+        text = ' '.join(words)
+        size = measure(text, words)
+        if seen is not None:
+            seen.append((text, start, end))
+        if not compat and size > chunk_size:
+            word_items = _words_of([text, size, start, end, raw])
+            window = math.ceil(len(word_items) / math.ceil(size / chunk_size))
+            for i in range(0, len(word_items), window):
+                part = word_items[i:i + window]
+                part_text = ' '.join(word[0] for word in part)
+                part_raw = raw[part[0][2] - start:part[-1][3] - start]
+                add([part_text, measure(part_text, part), part[0][2], part[-1][3], part_raw])
+        else:
+            add([text, size, start, end, raw])
+        if ready:
+            for chunk in ready:
+                chunk["index"] = index
+                index += 1
+                yield chunk
+            ready.clear()
+
+    if items:
+        emit()
+    if seen is not None:
+        # Fewer than two chunks: the legacy chunker fell back to the whole text
+        ready.clear()
+        text = ' '.join(sentence[0] for sentence in seen)
+        if len(text) > min_chars:
+            ready.append({"text": text, "start": seen[0][1], "end": seen[-1][2], "size": len(text.split())})
+    for chunk in ready:
+        chunk["index"] = index
+        index += 1
+        yield chunk
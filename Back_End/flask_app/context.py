@@ -0,0 +1,56 @@
+import os
+
+from .tokenizer import count_tokens, truncate_to_tokens
+
+# Token budget for the whole Q&A prompt (instructions, document context and question)
+CHAT_PROMPT_BUDGET = int(os.getenv("CHAT_PROMPT_BUDGET", "16000"))
+CHUNK_SEPARATOR = "\n\n"
+
+
+def pack_chunks(chunks, budget):
+    """
+    Greedily pack ranked chunk texts into `budget` tokens, keeping rank order.
+    A chunk that does not fit is skipped so smaller, lower-ranked chunks can
+    still use the space; if not even the first chunk fits, it is truncated.
+    Returns (selected_texts, tokens_used).
+    """
+    separator_tokens = count_tokens(CHUNK_SEPARATOR)
+    selected = []
+    used = 0
+    for text in chunks:
+        cost = count_tokens(text) + (separator_tokens if selected else 0)
+        if used + cost <= budget:
+            selected.append(text)
+            used += cost
+    if not selected and chunks and budget > 0:
+        text = truncate_to_tokens(chunks[0], budget)
+        selected = [text]
+        used = count_tokens(text)
+    return selected, used
+
+
+def assemble_prompt(instructions, context, question, history=""):
+    conversation = "**Conversation So Far:**\n" + history + "\n\n" if history else ""
+    return (
+        instructions +
+        "**Document Content:**\n" + context + "\n\n" + conversation +
+        "**User's Question:**\n" + question + "\n\n**Your Answer:**\n"
+    )
+
+
+def build_context_prompt(instructions, question, chunks, budget=CHAT_PROMPT_BUDGET, history=""):
+    """
+    Build the Q&A prompt in one pass: measure the fixed part (instructions,
+    conversation history and question), then fill the remaining budget with
+    ranked chunks. Returns (prompt, stats).
+    """
+    overhead = count_tokens(assemble_prompt(instructions, "", question, history))
+    selected, used = pack_chunks(chunks, budget - overhead)
+    prompt = assemble_prompt(instructions, CHUNK_SEPARATOR.join(selected), question, history)
+    return prompt, {
+        "prompt_tokens": overhead + used,
+        "context_tokens": used,
+        "history_tokens": count_tokens(history) if history else 0,
+        "chunks_used": len(selected),
+        "chunks_available": len(chunks),
+    }
@@ -0,0 +1,234 @@
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib import robotparser
+from urllib.parse import urldefrag, urljoin, urlparse
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .jobs import JobError
+from .pdf_extract import extract_pdf_text
+
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "50"))
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "2"))
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "4"))
+CRAWL_TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", "30"))
+CRAWL_MAX_HTML_BYTES = int(os.getenv("CRAWL_MAX_HTML_BYTES", str(5 * 1024 * 1024)))
+CRAWL_MAX_PDF_BYTES = int(os.getenv("CRAWL_MAX_PDF_BYTES", str(100 * 1024 * 1024)))
+CRAWL_USER_AGENT = os.getenv("CRAWL_USER_AGENT", "CSMChatBot/1.0 (+document ingestion)")
+# Pages whose text is larger than this are fetched normally but not cached in Mongo
+CRAWL_CACHE_MAX_CHARS = int(os.getenv("CRAWL_CACHE_MAX_CHARS", str(4 * 1024 * 1024)))
+
+SKIPPED_EXTENSIONS = (
+    ".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico", ".css", ".js", ".zip",
+    ".mp3", ".mp4", ".mov", ".avi", ".woff", ".woff2", ".ttf", ".xml", ".json",
+)
+
+
+class CrawlError(JobError):
+    """A URL could not be fetched or turned into text; the message is shown to the user."""
+
+
+def create_session(pool_size=CRAWL_CONCURRENCY):
+    """A pooled session that retries connection errors and 429/5xx responses."""
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=("GET", "HEAD"), respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size * 2, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = CRAWL_USER_AGENT
+    return session
+
+
+def html_to_text(html):
+    """Return (text, soup) for an HTML page, with scripts and styles removed."""
+    soup = BeautifulSoup(html, "html.parser")
+    for element in soup(["script", "style", "noscript"]):
+        element.decompose()
+    lines = (line.strip() for line in soup.get_text().splitlines())
+    phrases = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return " ".join(phrase for phrase in phrases if phrase), soup
+
+
+def same_site_links(soup, page_url, root):
+    """Absolute http(s) links on the page that stay on the root URL's host."""
+    host = urlparse(root).netloc
+    links = []
+    for anchor in soup.find_all("a", href=True):
+        link, _ = urldefrag(urljoin(page_url, anchor["href"]))
+        parsed = urlparse(link)
+        if parsed.scheme not in ("http", "https") or parsed.netloc != host:
+            continue
+        if parsed.path.lower().endswith(SKIPPED_EXTENSIONS):
+            continue
+        links.append(link)
+    return links
+
+
+class Crawler:
+    """
+    Fetches URL documents as text: a single page, or with `crawl` the pages
+    linked from it on the same host, breadth first up to max_depth/max_pages
+    with bounded concurrency. Honours robots.txt, enforces download size
+    limits (PDFs are streamed to a temp file) and revalidates cached pages
+    with ETag / Last-Modified so periodic refreshes skip unchanged pages.
+    """
+
+    def __init__(self, cache=None, session=None, concurrency=CRAWL_CONCURRENCY):
+        self.cache = cache
+        self.session = session or create_session(concurrency)
+        self.concurrency = concurrency
+        self._robots = {}
+        self._lock = threading.Lock()
+
+    def allowed(self, url):
+        parsed = urlparse(url)
+        origin = f"{parsed.scheme}://{parsed.netloc}"
+        with self._lock:
+            parser = self._robots.get(origin)
+        if parser is None:
+            parser = robotparser.RobotFileParser()
+            try:
+                resp = self.session.get(f"{origin}/robots.txt", timeout=CRAWL_TIMEOUT)
+                parser.parse(resp.text.splitlines() if resp.status_code == 200 else [])
+            except requests.RequestException as e:
+                logging.warning(f"Could not fetch robots.txt for {origin}: {e}")
+                parser.parse([])
+            with self._lock:
+                self._robots[origin] = parser
+        return parser.can_fetch(CRAWL_USER_AGENT, url)
+
+    def _cached(self, url):
+        if self.cache is None:
+            return None
+        try:
+            return self.cache.find_one({"_id": url})
+        except Exception as e:
+            logging.error(f"URL cache lookup failed: {e}")
+            return None
+
+    def _store(self, url, resp, text, links):
+        if self.cache is None or len(text) > CRAWL_CACHE_MAX_CHARS:
+            return
+        etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        try:
+            self.cache.replace_one({"_id": url}, {
+                "etag": etag,
+                "last_modified": last_modified,
+                "text": text,
+                "links": links,
+                "fetched_at": datetime.utcnow(),
+            }, upsert=True)
+        except Exception as e:
+            logging.error(f"URL cache write failed: {e}")
+
+    def _read_limited(self, resp, limit, out):
+        """Copy the response body into `out`, failing once it exceeds `limit` bytes."""
+        size = 0
+        for block in resp.iter_content(64 * 1024):
+            size += len(block)
+            if size > limit:
+                raise CrawlError(f"{resp.url} is larger than the {limit // (1024 * 1024)} MB limit.")
+            out(block)
+
+    def fetch(self, url, root=None):
+        """Return (text, links, page_offsets) for one URL; links are only collected from HTML pages."""
+        headers = {}
+        cached = self._cached(url)
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        try:
+            with self.session.get(url, headers=headers, timeout=CRAWL_TIMEOUT, stream=True) as resp:
+                if resp.status_code == 304 and cached:
+                    return cached["text"], cached.get("links", []), None
+                if resp.status_code >= 400:
+                    raise CrawlError(f"Could not fetch {url}: HTTP {resp.status_code}.")
+                content_type = resp.headers.get("content-type", "")
+                declared = int(resp.headers.get("content-length") or 0)
+                if content_type.startswith("application/pdf"):
+                    if declared > CRAWL_MAX_PDF_BYTES:
+                        raise CrawlError(f"{url} is larger than the {CRAWL_MAX_PDF_BYTES // (1024 * 1024)} MB limit.")
+                    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+                        self._read_limited(resp, CRAWL_MAX_PDF_BYTES, tmp.write)
+                        tmp.flush()
+                        text, page_offsets = extract_pdf_text(tmp.name)
+                    self._store(url, resp, text, [])
+                    return text, [], page_offsets
+                if content_type and not content_type.startswith(("text/", "application/xhtml")):
+                    raise CrawlError(f"{url} has unsupported content type {content_type.split(';')[0]}.")
+                if declared > CRAWL_MAX_HTML_BYTES:
+                    raise CrawlError(f"{url} is larger than the {CRAWL_MAX_HTML_BYTES // (1024 * 1024)} MB limit.")
+                body = bytearray()
+                self._read_limited(resp, CRAWL_MAX_HTML_BYTES, body.extend)
+                text, soup = html_to_text(bytes(body))
+                links = same_site_links(soup, resp.url, root or url)
+                self._store(url, resp, text, links)
+                return text, links, None
+        except requests.RequestException as e:
+            raise CrawlError(f"Could not fetch {url}: {e}") from e
+
+    def extract(self, url, crawl=False, max_pages=CRAWL_MAX_PAGES, max_depth=CRAWL_MAX_DEPTH):
+        """
+        Return (text, page_offsets) for a URL document. When crawling, each
+        fetched page is one entry of page_offsets ({"page", "url", "start", "end"}).
+        Raises CrawlError if the starting URL cannot be used; failures on
+        linked pages are logged and skipped.
+        """
+        if not self.allowed(url):
+            raise CrawlError(f"Fetching {url} is disallowed by the site's robots.txt.")
+        text, links, page_offsets = self.fetch(url)
+        if not crawl:
+            return text, page_offsets
+
+        pages = [(url, text)]
+        seen = {url}
+        frontier = links
+        depth = 1
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="crawler") as pool:
+            while frontier and depth <= max_depth and len(pages) < max_pages:
+                batch = []
+                for link in frontier:
+                    if link not in seen and len(pages) + len(batch) < max_pages:
+                        seen.add(link)
+                        if self.allowed(link):
+                            batch.append(link)
+                frontier = []
+                for link, result in zip(batch, pool.map(self._fetch_linked, batch, [url] * len(batch))):
+                    if result is None:
+                        continue
+                    page_text, page_links, _ = result
+                    if page_text:
+                        pages.append((link, page_text))
+                    frontier.extend(page_links)
+                depth += 1
+        if frontier and len(pages) >= max_pages:
+            logging.warning(f"Crawl of {url} stopped at the {max_pages}-page limit")
+
+        parts = []
+        page_offsets = []
+        position = 0
+        for number, (page_url, page_text) in enumerate(pages, start=1):
+            page_offsets.append({"page": number, "url": page_url, "start": position, "end": position + len(page_text)})
+            parts.append(page_text)
+            position += len(page_text) + 2
+        logging.info(f"Crawled {len(pages)} pages from {url}")
+        return "\n\n".join(parts), page_offsets
+
+    def _fetch_linked(self, url, root):
+        try:
+            return self.fetch(url, root)
+        except CrawlError as e:
+            logging.warning(f"Skipping linked page: {e}")
+            return None
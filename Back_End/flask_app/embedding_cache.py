@@ -0,0 +1,170 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import unicodedata
+from array import array
+from datetime import datetime
+
+from bson.binary import Binary
+from cachetools import LRUCache
+from pymongo import UpdateOne
+
+# The in-process tier is bounded in bytes of float32 data (a 1536-dim embedding is 6 KB)
+EMBED_CACHE_MEMORY_MB = int(os.getenv("EMBED_CACHE_MEMORY_MB", "32"))
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "500000"))
+# Check the persistent tier's size every N inserts rather than on every write
+EMBED_CACHE_EVICT_EVERY = int(os.getenv("EMBED_CACHE_EVICT_EVERY", "1000"))
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def text_hash(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def pack_embedding(embedding):
+    # Embeddings are float32 on the wire, so storing them as float32 is lossless
+    return Binary(array("f", embedding).tobytes())
+
+
+def unpack_embedding(data):
+    values = array("f")
+    values.frombytes(bytes(data))
+    return values
+
+
+def _embedding_bytes(values):
+    return values.itemsize * len(values)
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (sha256 of normalized text, model).
+    An in-process LRU of packed float32 arrays sits in front of a Mongo
+    collection shared by all workers; both tiers are bounded and evict least
+    recently used entries. Callers get plain lists of floats.
+    """
+
+    def __init__(self, collection, memory_mb=EMBED_CACHE_MEMORY_MB, max_entries=EMBED_CACHE_MAX_ENTRIES):
+        self.collection = collection
+        self.max_entries = max_entries
+        self._memory = LRUCache(maxsize=memory_mb * 1024 * 1024, getsizeof=_embedding_bytes)
+        self._lock = threading.Lock()
+        self._inserts_since_evict = 0
+        self.counters = {"memory_hits": 0, "store_hits": 0, "misses": 0, "evictions": 0,
+                         "store_writes": 0, "store_errors": 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def get_many(self, texts, model):
+        """Return a list aligned with `texts` holding cached embeddings or None."""
+        keys = [f"{model}:{text_hash(text)}" for text in texts]
+        results = [None] * len(texts)
+        missing = {}
+        with self._lock:
+            for idx, key in enumerate(keys):
+                embedding = self._memory.get(key)
+                if embedding is not None:
+                    results[idx] = embedding.tolist()
+                    self.counters["memory_hits"] += 1
+                else:
+                    missing.setdefault(key, []).append(idx)
+
+        if missing and self.collection is not None:
+            try:
+                found = list(self.collection.find({"_id": {"$in": list(missing)}}, {"embedding": 1}))
+                if found:
+                    self.collection.update_many(
+                        {"_id": {"$in": [entry["_id"] for entry in found]}},
+                        {"$set": {"last_used": datetime.utcnow()}}
+                    )
+            except Exception as e:
+                logging.error(f"Embedding cache lookup failed: {e}")
+                self._count("store_errors")
+                found = []
+            with self._lock:
+                for entry in found:
+                    packed = unpack_embedding(entry["embedding"])
+                    self._memory[entry["_id"]] = packed
+                    embedding = packed.tolist()
+                    for idx in missing.pop(entry["_id"]):
+                        results[idx] = embedding
+                        self.counters["store_hits"] += 1
+
+        self._count("misses", sum(len(positions) for positions in missing.values()))
+        return results
+
+    def put_many(self, texts, embeddings, model):
+        now = datetime.utcnow()
+        entries = {}
+        for text, embedding in zip(texts, embeddings):
+            if embedding is None:
+                continue
+            digest = text_hash(text)
+            entries[f"{model}:{digest}"] = (digest, array("f", embedding))
+        if not entries:
+            return
+
+        with self._lock:
+            for key, (_, embedding) in entries.items():
+                self._memory[key] = embedding
+
+        if self.collection is None:
+            return
+        try:
+            self.collection.bulk_write([
+                UpdateOne(
+                    {"_id": key},
+                    {
+                        "$set": {"last_used": now},
+                        "$setOnInsert": {"hash": digest, "model": model, "embedding": Binary(embedding.tobytes()), "created_at": now},
+                    },
+                    upsert=True
+                )
+                for key, (digest, embedding) in entries.items()
+            ], ordered=False)
+        except Exception as e:
+            logging.error(f"Embedding cache write failed: {e}")
+            self._count("store_errors")
+            return
+
+        with self._lock:
+            self.counters["store_writes"] += len(entries)
+            self._inserts_since_evict += len(entries)
+            should_evict = self._inserts_since_evict >= EMBED_CACHE_EVICT_EVERY
+            if should_evict:
+                self._inserts_since_evict = 0
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """Trim the persistent tier back to `max_entries`, dropping the least recently used."""
+        try:
+            excess = self.collection.estimated_document_count() - self.max_entries
+            if excess <= 0:
+                return
+            # Trim a little below the bound so eviction does not run on every check
+            excess += self.max_entries // 20
+            stale = [entry["_id"] for entry in
+                     self.collection.find({}, {"_id": 1}).sort("last_used", 1).limit(excess)]
+            result = self.collection.delete_many({"_id": {"$in": stale}})
+            self._count("evictions", result.deleted_count)
+            logging.info(f"Evicted {result.deleted_count} entries from the embedding cache")
+        except Exception as e:
+            logging.error(f"Embedding cache eviction failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory.currsize
+        lookups = stats["memory_hits"] + stats["store_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["store_hits"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,152 @@
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .llm import llm
+
+# "openai" calls the embeddings API; "local" runs an ONNX sentence-embedding model on the CPU
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+
+OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+OPENAI_EMBEDDING_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+# A Hugging Face repo with an ONNX export and tokenizer.json, or LOCAL_EMBEDDING_MODEL_DIR for an offline copy
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_MODEL_DIR = os.getenv("LOCAL_EMBEDDING_MODEL_DIR", "")
+LOCAL_EMBEDDING_ONNX_FILE = os.getenv("LOCAL_EMBEDDING_ONNX_FILE", "onnx/model.onnx")
+LOCAL_EMBEDDING_MAX_LENGTH = int(os.getenv("LOCAL_EMBEDDING_MAX_LENGTH", "256"))
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "32"))
+LOCAL_EMBEDDING_WORKERS = int(os.getenv("LOCAL_EMBEDDING_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+class OpenAIEmbeddingProvider:
+    """Embeddings from the OpenAI API, through the rate-limited LLM gateway."""
+
+    def __init__(self, model=OPENAI_EMBEDDING_MODEL):
+        self.model = model
+        # Kept as the bare model name so existing embedding cache entries stay valid
+        self.model_id = model
+        self._dimension = OPENAI_EMBEDDING_DIMENSIONS.get(model)
+
+    @property
+    def dimension(self):
+        if self._dimension is None:
+            self._dimension = len(self.embed(["dimension probe"])[0])
+        return self._dimension
+
+    def embed(self, texts):
+        return llm.embed(texts, model=self.model)
+
+
+class LocalEmbeddingProvider:
+    """
+    Sentence embeddings computed in-process with ONNX Runtime: texts are
+    tokenized in length-sorted micro-batches (to keep padding small), run on a
+    thread pool (ONNX Runtime releases the GIL), then mean-pooled over the
+    attention mask and L2-normalized with NumPy.
+    """
+
+    def __init__(self, model=LOCAL_EMBEDDING_MODEL, model_dir=LOCAL_EMBEDDING_MODEL_DIR,
+                 batch_size=LOCAL_EMBEDDING_BATCH_SIZE, workers=LOCAL_EMBEDDING_WORKERS):
+        self.model = model
+        self.model_id = f"local/{model}"
+        self.model_dir = model_dir
+        self.batch_size = batch_size
+        self.workers = max(1, workers)
+        self._session = None
+        self._tokenizer = None
+        self._input_names = ()
+        self._dimension = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._session is not None:
+                return
+            import onnxruntime
+            from tokenizers import Tokenizer
+
+            model_dir = self.model_dir
+            if not model_dir:
+                from huggingface_hub import snapshot_download
+                model_dir = snapshot_download(self.model, allow_patterns=[LOCAL_EMBEDDING_ONNX_FILE, "tokenizer.json"])
+            tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+            tokenizer.enable_truncation(max_length=LOCAL_EMBEDDING_MAX_LENGTH)
+            tokenizer.enable_padding()
+
+            options = onnxruntime.SessionOptions()
+            # Split the cores between the concurrent micro-batches
+            options.intra_op_num_threads = max(1, (os.cpu_count() or 1) // self.workers)
+            session = onnxruntime.InferenceSession(
+                os.path.join(model_dir, LOCAL_EMBEDDING_ONNX_FILE), options, providers=["CPUExecutionProvider"]
+            )
+            self._tokenizer = tokenizer
+            self._input_names = {model_input.name for model_input in session.get_inputs()}
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="local-embed")
+            self._session = session
+            logging.info(f"Loaded local embedding model {self.model} from {model_dir}")
+
+    @property
+    def dimension(self):
+        if self._dimension is None:
+            self._dimension = len(self.embed(["dimension probe"])[0])
+        return self._dimension
+
+    def _embed_batch(self, texts):
+        encodings = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = self._session.run(None, inputs)[0]
+        if hidden.ndim == 2:
+            # Model already returns pooled sentence embeddings
+            pooled = hidden
+        else:
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+    def embed(self, texts):
+        if not texts:
+            return []
+        self._load()
+        order = sorted(range(len(texts)), key=lambda idx: len(texts[idx]))
+        batches = [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+        results = [None] * len(texts)
+        for batch, vectors in zip(batches, self._pool.map(lambda batch: self._embed_batch([texts[idx] for idx in batch]), batches)):
+            for idx, vector in zip(batch, vectors):
+                results[idx] = vector.tolist()
+        return results
+
+
+def collection_tag(provider):
+    """Short name for the model and dimension, used to keep vectors of different models apart."""
+    slug = re.sub(r"[^a-zA-Z0-9]+", "-", provider.model_id).strip("-").lower()
+    return f"{slug}-{provider.dimension}"
+
+
+_provider = None
+
+
+def get_embedding_provider():
+    global _provider
+    if _provider is None:
+        if EMBEDDING_PROVIDER == "local":
+            _provider = LocalEmbeddingProvider()
+        elif EMBEDDING_PROVIDER == "openai":
+            _provider = OpenAIEmbeddingProvider()
+        else:
+            raise ValueError(f"Unknown EMBEDDING_PROVIDER: {EMBEDDING_PROVIDER}")
+    return _provider
@@ -0,0 +1,207 @@
+import hashlib
+import logging
+import os
+
+from .embedding_providers import get_embedding_provider
+from .utils import estimate_tokens
+
+# The embeddings endpoint accepts a list `input` (up to 2048 items / 300k tokens),
+# so chunks are sent in batches bounded by both item count and estimated tokens.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "128"))
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "100000"))
+
+embedding_cache = None
+
+
+def iter_batches(texts, max_items=EMBED_BATCH_SIZE, max_tokens=EMBED_BATCH_TOKENS):
+    """
+    Yield (start_index, batch) pairs covering `texts` in order.
+    A batch is closed when adding the next text would exceed either limit;
+    a single oversized text still gets a batch of its own.
+    """
+    batch = []
+    batch_tokens = 0
+    start = 0
+    for idx, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if batch and (len(batch) >= max_items or batch_tokens + tokens > max_tokens):
+            yield start, batch
+            batch = []
+            batch_tokens = 0
+            start = idx
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        yield start, batch
+
+
+def embed_batch(batch):
+    """
+    Embed one batch, returning a list aligned with `batch` (None for failures).
+    Transient API errors are retried by the LLM gateway; if the batch still
+    fails it is split in half so only the failing sub-batch is sent again.
+    """
+    if not batch:
+        return []
+    try:
+        return get_embedding_provider().embed(batch)
+    except Exception as e:
+        if len(batch) == 1:
+            logging.error(f"Embedding error: {e}")
+            return [None]
+        logging.warning(f"Embedding batch of {len(batch)} failed, splitting it: {e}")
+    mid = len(batch) // 2
+    return embed_batch(batch[:mid]) + embed_batch(batch[mid:])
+
+
+def set_embedding_cache(cache):
+    """Install an EmbeddingCache consulted before any texts are embedded."""
+    global embedding_cache
+    embedding_cache = cache
+
+
+def embed_texts(texts):
+    """
+    Embed a list of texts in bounded batches. Empty texts map to None.
+    Cached embeddings are reused; only cache misses are sent to the provider.
+    """
+    model_id = get_embedding_provider().model_id
+    results = [None] * len(texts)
+    positions = [idx for idx, text in enumerate(texts) if text and text.strip()]
+    if embedding_cache is not None and positions:
+        cached = embedding_cache.get_many([texts[idx] for idx in positions], model_id)
+        for idx, embedding in zip(positions, cached):
+            results[idx] = embedding
+        positions = [idx for idx in positions if results[idx] is None]
+
+    # Identical texts (e.g. repeated boilerplate) are only sent once
+    pending = list(dict.fromkeys(texts[idx] for idx in positions))
+    embedded = {}
+    for start, batch in iter_batches(pending):
+        embeddings = embed_batch(batch)
+        embedded.update(zip(batch, embeddings))
+        if embedding_cache is not None:
+            embedding_cache.put_many(batch, embeddings, model_id)
+    for idx in positions:
+        results[idx] = embedded.get(texts[idx])
+    return results
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _chunk_metadata(doc_id, user_id, name, idx, chunk_metadata):
+    metadata = {"doc_id": doc_id, "user_id": user_id, "name": name, "chunk_index": idx}
+    if chunk_metadata:
+        metadata.update(chunk_metadata[idx])
+    return metadata
+
+
+def index_chunks(collection, doc_id, user_id, name, chunks, on_progress=None, chunk_metadata=None):
+    """
+    Embed document chunks batch-wise and write every batch to Chroma with a
+    single `upsert` call. Returns the number of chunks stored.
+    `on_progress(done, total)` reports how many chunks have been processed;
+    `chunk_metadata` optionally holds extra metadata per chunk (e.g. pages).
+    """
+    stored = 0
+    for start, batch in iter_batches(chunks):
+        if on_progress:
+            on_progress(start, len(chunks))
+        embeddings = embed_texts(batch)
+        ids, vectors, documents, metadatas = [], [], [], []
+        for offset, (chunk, embedding) in enumerate(zip(batch, embeddings)):
+            if embedding is None:
+                continue
+            idx = start + offset
+            ids.append(f"{doc_id}_chunk_{idx}")
+            vectors.append(embedding)
+            documents.append(chunk)
+            metadatas.append(_chunk_metadata(doc_id, user_id, name, idx, chunk_metadata))
+        if not ids:
+            continue
+        try:
+            # Upsert so re-indexing a document overwrites its existing chunk ids
+            collection.upsert(
+                ids=ids,
+                embeddings=vectors,
+                documents=documents,
+                metadatas=metadatas
+            )
+            stored += len(ids)
+        except Exception as e:
+            logging.error(f"Failed to add chunks {start}-{start + len(batch) - 1} to ChromaDB: {e}")
+    if on_progress:
+        on_progress(len(chunks), len(chunks))
+    return stored
+
+
+def update_chunks(collection, doc_id, user_id, name, chunks, on_progress=None, chunk_metadata=None):
+    """
+    Bring a document's stored chunks in line with `chunks` (its re-chunked
+    new content) while embedding as little as possible: chunks identical to
+    what is stored at the same index are left alone, text already stored at
+    another index is moved together with its embedding, and only new text is
+    embedded. Stored chunks past the end of `chunks` are deleted.
+    Returns counts of unchanged, moved, embedded, failed and deleted chunks.
+    """
+    existing = collection.get(where={"doc_id": doc_id}, include=["documents", "metadatas"])
+    stored = {}
+    id_by_hash = {}
+    for chunk_id, text, metadata in zip(existing["ids"], existing["documents"], existing["metadatas"]):
+        stored[chunk_id] = (text, metadata)
+        id_by_hash.setdefault(chunk_hash(text), chunk_id)
+
+    counts = {"unchanged": 0, "moved": 0, "embedded": 0, "failed": 0, "deleted": 0}
+    moves, fresh = [], []
+    for idx, chunk in enumerate(chunks):
+        chunk_id = f"{doc_id}_chunk_{idx}"
+        metadata = _chunk_metadata(doc_id, user_id, name, idx, chunk_metadata)
+        if stored.get(chunk_id) == (chunk, metadata):
+            counts["unchanged"] += 1
+            continue
+        source = id_by_hash.get(chunk_hash(chunk))
+        if source:
+            moves.append((chunk_id, chunk, metadata, source))
+        else:
+            fresh.append((chunk_id, chunk, metadata))
+
+    # Read the embeddings being moved before any of their ids are overwritten
+    if moves:
+        sources = list(dict.fromkeys(source for _, _, _, source in moves))
+        found = collection.get(ids=sources, include=["embeddings"])
+        vectors = dict(zip(found["ids"], found["embeddings"]))
+        collection.upsert(
+            ids=[chunk_id for chunk_id, _, _, _ in moves],
+            embeddings=[vectors[source] for _, _, _, source in moves],
+            documents=[chunk for _, chunk, _, _ in moves],
+            metadatas=[metadata for _, _, metadata, _ in moves]
+        )
+        counts["moved"] = len(moves)
+
+    stale = [chunk_id for chunk_id, (_, metadata) in stored.items() if metadata["chunk_index"] >= len(chunks)]
+    for start, batch in iter_batches([chunk for _, chunk, _ in fresh]):
+        if on_progress:
+            on_progress(start, len(fresh))
+        entries = fresh[start:start + len(batch)]
+        embeddings = embed_texts(batch)
+        written = [(entry, embedding) for entry, embedding in zip(entries, embeddings) if embedding is not None]
+        # A chunk that could not be embedded must not keep the old text's vector
+        stale.extend(chunk_id for (chunk_id, _, _), embedding in zip(entries, embeddings)
+                     if embedding is None and chunk_id in stored)
+        counts["failed"] += len(entries) - len(written)
+        if written:
+            collection.upsert(
+                ids=[chunk_id for (chunk_id, _, _), _ in written],
+                embeddings=[embedding for _, embedding in written],
+                documents=[chunk for (_, chunk, _), _ in written],
+                metadatas=[metadata for (_, _, metadata), _ in written]
+            )
+            counts["embedded"] += len(written)
+    if stale:
+        collection.delete(ids=stale)
+        counts["deleted"] = len(stale)
+    if on_progress and fresh:
+        on_progress(len(fresh), len(fresh))
+    return counts
@@ -0,0 +1,179 @@
+import logging
+import os
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+# A running job whose heartbeat is older than this is assumed to belong to a dead worker
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", "600"))
+
+
+class JobError(Exception):
+    """Raised by job handlers for expected failures; the message is shown to the user."""
+
+
+def _isoformat(value):
+    return value.isoformat() + 'Z' if value else None
+
+
+def serialize_job(job):
+    return {
+        "job_id": str(job["_id"]),
+        "kind": job.get("kind"),
+        "doc_id": job.get("doc_id"),
+        "status": job.get("status"),
+        "stage": job.get("stage"),
+        "progress": job.get("progress", 0),
+        "error": job.get("error"),
+        "result": job.get("result"),
+        "created_at": _isoformat(job.get("created_at")),
+        "started_at": _isoformat(job.get("started_at")),
+        "finished_at": _isoformat(job.get("finished_at")),
+    }
+
+
+class JobQueue:
+    """
+    Job queue persisted in a Mongo collection. Any process sharing the database
+    can enqueue jobs or run workers; jobs are claimed atomically with
+    find_one_and_update so each one runs exactly once.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.handlers = {}
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def register(self, kind, handler):
+        """Register `handler(job, report)` for jobs of `kind`."""
+        self.handlers[kind] = handler
+
+    def enqueue(self, kind, payload, user_id=None, doc_id=None):
+        now = datetime.utcnow()
+        job = {
+            "kind": kind,
+            "payload": payload,
+            "user_id": user_id,
+            "doc_id": doc_id,
+            "status": JOB_QUEUED,
+            "stage": JOB_QUEUED,
+            "progress": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        result = self.collection.insert_one(job)
+        self._wakeup.set()
+        return str(result.inserted_id)
+
+    def get(self, job_id, user_id=None):
+        """Return the job, or None if it does not exist (or `job_id` is not a valid id)."""
+        try:
+            query = {"_id": ObjectId(job_id)}
+        except (InvalidId, TypeError):
+            return None
+        if user_id is not None:
+            query["user_id"] = user_id
+        return self.collection.find_one(query)
+
+    def has_pending(self, kinds, doc_id):
+        """Whether a job of `kinds` (one kind or a list) for `doc_id` is queued or running."""
+        if isinstance(kinds, str):
+            kinds = [kinds]
+        return self.collection.find_one(
+            {"kind": {"$in": list(kinds)}, "doc_id": doc_id, "status": {"$in": [JOB_QUEUED, JOB_RUNNING]}}, {"_id": 1}
+        ) is not None
+
+    def claim(self):
+        now = datetime.utcnow()
+        return self.collection.find_one_and_update(
+            {"status": JOB_QUEUED, "kind": {"$in": list(self.handlers)}},
+            {"$set": {"status": JOB_RUNNING, "started_at": now, "updated_at": now}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = datetime.utcnow()
+        self.collection.update_one({"_id": job_id}, {"$set": fields})
+
+    def requeue_stale(self):
+        """Put jobs left running by a crashed worker back on the queue."""
+        cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_AFTER)
+        result = self.collection.update_many(
+            {"status": JOB_RUNNING, "updated_at": {"$lt": cutoff}},
+            {"$set": {"status": JOB_QUEUED, "stage": JOB_QUEUED, "updated_at": datetime.utcnow()}},
+        )
+        if result.modified_count:
+            logging.info(f"Requeued {result.modified_count} stale ingestion jobs")
+
+    def run_job(self, job):
+        job_id = job["_id"]
+        handler = self.handlers[job["kind"]]
+
+        def report(stage, progress):
+            self.update(job_id, stage=stage, progress=int(progress))
+
+        try:
+            result = handler(job, report)
+            self.update(job_id, status=JOB_SUCCEEDED, stage="done", progress=100,
+                        result=result, finished_at=datetime.utcnow())
+        except JobError as e:
+            self.update(job_id, status=JOB_FAILED, error=str(e), finished_at=datetime.utcnow())
+        except Exception as e:
+            logging.error(f"Job {job_id} ({job['kind']}) failed: {e}\n{traceback.format_exc()}")
+            self.update(job_id, status=JOB_FAILED, error=f"Internal error: {e}", finished_at=datetime.utcnow())
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                job = self.claim()
+            except Exception as e:
+                logging.error(f"Failed to claim job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(JOB_POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self.run_job(job)
+
+    def start(self, workers=INGEST_WORKERS):
+        if workers <= 0 or self._threads:
+            return
+        try:
+            self.requeue_stale()
+        except Exception as e:
+            logging.error(f"Failed to requeue stale jobs: {e}")
+        for idx in range(workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"ingest-worker-{idx}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logging.info(f"Started {workers} ingestion workers")
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_forever(self, workers=INGEST_WORKERS):
+        self.start(workers)
+        try:
+            while any(thread.is_alive() for thread in self._threads):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stop()
@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import openai
+
+from .tokenizer import CHAT_MODEL, count_tokens
+from .utils import estimate_tokens
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Combined prompt + completion token budget per minute for this process; 0 disables the limit
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class TokenBucket:
+    """
+    Tokens-per-minute limiter. Callers reserve their estimated usage up front
+    and are told how long to wait; reservations may drive the bucket negative,
+    so concurrent callers queue in arrival order instead of spinning.
+    """
+
+    def __init__(self, tokens_per_minute):
+        self.capacity = tokens_per_minute
+        self.rate = tokens_per_minute / 60.0
+        self.tokens = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens):
+        """Take `tokens` and return the number of seconds to wait before using them."""
+        if self.capacity <= 0:
+            return 0.0
+        tokens = min(tokens, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def adjust(self, tokens):
+        """Correct an earlier reservation by `tokens` (positive charges more, negative refunds)."""
+        if self.capacity <= 0 or not tokens:
+            return
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens - tokens)
+
+
+def backoff_delay(attempt, error=None):
+    """Full-jitter exponential backoff, honouring a server-provided Retry-After."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_BACKOFF_MAX) + random.uniform(0, LLM_BACKOFF_BASE)
+        except ValueError:
+            pass
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+
+def estimate_chat_tokens(messages, max_tokens):
+    return sum(count_tokens(message["content"]) for message in messages) + (max_tokens or 1024)
+
+
+class LLMGateway:
+    """
+    Single entry point for model traffic. Owns pooled HTTP clients and bounds
+    every call by a per-process concurrency cap and tokens-per-minute budget,
+    retrying rate limits, timeouts and 5xx errors with jittered exponential
+    backoff so bursts queue up instead of failing. Sync methods are safe to
+    call from any thread; the a* methods are their asyncio counterparts.
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, tokens_per_minute=LLM_TOKENS_PER_MINUTE):
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.bucket = TokenBucket(tokens_per_minute)
+        # Async callers wait for a slot in these threads, never more of them than there are slots
+        self._slot_waiters = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm-slot")
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._loop = None
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "retries": 0, "failures": 0, "throttled_seconds": 0.0}
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+    # Clients are created lazily so OPENAI_API_KEY / OPENAI_BASE_URL from .env are picked up
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = openai.OpenAI(
+                    http_client=httpx.Client(
+                        limits=httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE),
+                        timeout=LLM_TIMEOUT
+                    ),
+                    max_retries=0
+                )
+            return self._client
+
+    def async_client(self):
+        # httpx async pools are bound to the event loop that created them
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = openai.AsyncOpenAI(
+                    http_client=httpx.AsyncClient(
+                        limits=httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE),
+                        timeout=LLM_TIMEOUT
+                    ),
+                    max_retries=0
+                )
+                self._async_clients[loop] = client
+            return client
+
+    def run(self, coro):
+        """
+        Run a coroutine on the gateway's event loop thread and return its
+        result. One long-lived loop lets every caller share one async client
+        and its connection pool instead of building one per asyncio.run.
+        """
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="llm-async", daemon=True).start()
+            loop = self._loop
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def _throttle(self, tokens):
+        delay = self.bucket.reserve(tokens)
+        if delay:
+            self._count("throttled_seconds", delay)
+            time.sleep(delay)
+
+    async def _athrottle(self, tokens):
+        delay = self.bucket.reserve(tokens)
+        if delay:
+            self._count("throttled_seconds", delay)
+            await asyncio.sleep(delay)
+
+    async def _aacquire_slot(self):
+        """Take one of the slots shared with sync callers without blocking the event loop."""
+        if self.slots.acquire(blocking=False):
+            return
+        waiter = asyncio.get_running_loop().run_in_executor(self._slot_waiters, self.slots.acquire)
+        try:
+            await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            # The acquire still completes in its thread; hand the slot straight back
+            waiter.add_done_callback(lambda _: self.slots.release())
+            raise
+
+    def _call(self, request, tokens):
+        """Run `request()` under the concurrency and rate limits, retrying transient errors."""
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            # Every attempt counts against the tokens-per-minute budget, retries included
+            self._throttle(tokens)
+            with self.slots:
+                self._count("requests")
+                try:
+                    return request()
+                except RETRYABLE_ERRORS as e:
+                    error = e
+            if attempt == LLM_MAX_RETRIES:
+                break
+            delay = backoff_delay(attempt, error)
+            self._count("retries")
+            logging.warning(f"LLM request failed ({type(error).__name__}), retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.2f}s")
+            time.sleep(delay)
+        self._count("failures")
+        raise error
+
+    async def _acall(self, request, tokens):
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            await self._athrottle(tokens)
+            await self._aacquire_slot()
+            try:
+                self._count("requests")
+                return await request()
+            except RETRYABLE_ERRORS as e:
+                error = e
+            finally:
+                self.slots.release()
+            if attempt == LLM_MAX_RETRIES:
+                break
+            delay = backoff_delay(attempt, error)
+            self._count("retries")
+            logging.warning(f"LLM request failed ({type(error).__name__}), retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        self._count("failures")
+        raise error
+
+    def _settle(self, estimated, usage):
+        if usage is not None and getattr(usage, "total_tokens", None):
+            self.bucket.adjust(usage.total_tokens - estimated)
+
+    def chat(self, messages, model=CHAT_MODEL, max_tokens=1024, **kwargs):
+        """Return the completion text for `messages`."""
+        estimated = estimate_chat_tokens(messages, max_tokens)
+        response = self._call(
+            lambda: self.client.chat.completions.create(model=model, messages=messages, max_tokens=max_tokens, **kwargs),
+            estimated
+        )
+        self._settle(estimated, response.usage)
+        return response.choices[0].message.content
+
+    async def achat(self, messages, model=CHAT_MODEL, max_tokens=1024, **kwargs):
+        estimated = estimate_chat_tokens(messages, max_tokens)
+        response = await self._acall(
+            lambda: self.async_client().chat.completions.create(model=model, messages=messages, max_tokens=max_tokens, **kwargs),
+            estimated
+        )
+        self._settle(estimated, response.usage)
+        return response.choices[0].message.content
+
+    def chat_stream(self, messages, model=CHAT_MODEL, max_tokens=1024, **kwargs):
+        """
+        Yield completion text as it is generated. Only opening the stream is
+        retried; the concurrency slot is held until the stream is consumed.
+        """
+        estimated = estimate_chat_tokens(messages, max_tokens)
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            self._throttle(estimated)
+            self.slots.acquire()
+            try:
+                self._count("requests")
+                stream = self.client.chat.completions.create(
+                    model=model, messages=messages, max_tokens=max_tokens, stream=True, **kwargs
+                )
+                break
+            except RETRYABLE_ERRORS as e:
+                self.slots.release()
+                if attempt == LLM_MAX_RETRIES:
+                    self._count("failures")
+                    raise
+                delay = backoff_delay(attempt, e)
+                self._count("retries")
+                logging.warning(f"LLM stream failed to open ({type(e).__name__}), retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.2f}s")
+                time.sleep(delay)
+            except Exception:
+                self.slots.release()
+                raise
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
+            self.slots.release()
+
+    def embed(self, texts, model):
+        """Return one embedding per text, in input order."""
+        estimated = sum(estimate_tokens(text) for text in texts)
+        response = self._call(lambda: self.client.embeddings.create(input=texts, model=model), estimated)
+        self._settle(estimated, response.usage)
+        # The API returns one item per input with its position in `index`
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def aembed(self, texts, model):
+        estimated = sum(estimate_tokens(text) for text in texts)
+        response = await self._acall(lambda: self.async_client().embeddings.create(input=texts, model=model), estimated)
+        self._settle(estimated, response.usage)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+llm = LLMGateway()
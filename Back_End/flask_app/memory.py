@@ -0,0 +1,206 @@
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from .tokenizer import count_tokens, truncate_to_tokens
+
+CHAT_MEMORY_ENABLED = os.getenv("CHAT_MEMORY_ENABLED", "true").lower() == "true"
+# Most recent turns (question + answer) included verbatim; older ones only through the summary
+CHAT_MEMORY_TURNS = int(os.getenv("CHAT_MEMORY_TURNS", "4"))
+# Tokens of CHAT_PROMPT_BUDGET the conversation may take; the rest is left for document context
+CHAT_MEMORY_BUDGET = int(os.getenv("CHAT_MEMORY_BUDGET", "2000"))
+CHAT_MEMORY_SUMMARY_TOKENS = int(os.getenv("CHAT_MEMORY_SUMMARY_TOKENS", "400"))
+# Turns folded into the summary per update, so a backlog after LLM failures stays one bounded call
+CHAT_MEMORY_FOLD_MAX = int(os.getenv("CHAT_MEMORY_FOLD_MAX", "20"))
+CHAT_MEMORY_TURN_TOKENS = int(os.getenv("CHAT_MEMORY_TURN_TOKENS", "600"))
+CHAT_MEMORY_WORKERS = int(os.getenv("CHAT_MEMORY_WORKERS", "2"))
+
+# Words that point back at earlier turns; a question using them is answered from the conversation
+FOLLOW_UP_REFERENCES = re.compile(
+    r"\b(it|its|itself|this|these|those|they|them|their|he|him|his|she|her|"
+    r"above|previous|previously|earlier|former|latter|same|again|also|else|more)\b"
+)
+FOLLOW_UP_OPENERS = ("and ", "but ", "so ", "what about", "how about", "why not")
+# Questions this short ("why?", "go on") only make sense after an earlier turn
+FOLLOW_UP_MAX_WORDS = 2
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a conversation between a user and an assistant
+about a document. Update the summary with the new exchanges below. Keep the facts,
+names, numbers and open questions the user may refer back to, drop pleasantries,
+and write at most {words} words.
+
+Current summary:
+{summary}
+
+New exchanges:
+{turns}
+"""
+
+
+def is_follow_up(question):
+    """Whether `question` refers back to earlier turns and cannot be answered on its own."""
+    text = re.sub(r"[^\w\s]", " ", question.lower()).strip()
+    if len(text.split()) <= FOLLOW_UP_MAX_WORDS or text.startswith(FOLLOW_UP_OPENERS):
+        return True
+    return bool(FOLLOW_UP_REFERENCES.search(text))
+
+
+def format_turn(turn, max_tokens=CHAT_MEMORY_TURN_TOKENS):
+    question = truncate_to_tokens(turn.get("question") or "", max_tokens // 3)
+    answer = truncate_to_tokens(turn.get("answer") or "", max_tokens - count_tokens(question))
+    return f"User: {question}\nAssistant: {answer}"
+
+
+def format_history(summary, turns, budget=CHAT_MEMORY_BUDGET):
+    """
+    Render the summary and recent turns into at most `budget` tokens. The
+    newest turns are kept first; the summary gets what is left.
+    Returns (text, tokens).
+    """
+    if budget <= 0 or (not summary and not turns):
+        return "", 0
+    kept = []
+    used = 0
+    for turn in reversed(turns):
+        text = format_turn(turn)
+        cost = count_tokens(text) + 1
+        if used + cost > budget:
+            break
+        kept.insert(0, text)
+        used += cost
+    parts = []
+    if summary and budget - used > 20:
+        parts.append("Summary of earlier conversation: " + truncate_to_tokens(summary, budget - used - 10))
+    parts.extend(kept)
+    text = "\n".join(parts)
+    return text, count_tokens(text)
+
+
+class ConversationMemory:
+    """
+    Conversation state per (user, document): the last CHAT_MEMORY_TURNS chats
+    verbatim plus a rolling summary of everything before them. The summary is
+    stored in `sessions` with the id of the last chat folded into it and is
+    extended incrementally in the background after each answer, so an update
+    only summarizes the turns that just left the verbatim window.
+    `complete(prompt)` returns the model's reply.
+    """
+
+    def __init__(self, chats, sessions, complete, turns=CHAT_MEMORY_TURNS, workers=CHAT_MEMORY_WORKERS):
+        self.chats = chats
+        self.sessions = sessions
+        self.complete = complete
+        self.turns = turns
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def session_id(user_id, doc_id):
+        return f"{user_id}:{doc_id}"
+
+    def recall(self, user_id, doc_id):
+        """Return (summary, recent_turns) for the conversation, oldest turn first."""
+        if not CHAT_MEMORY_ENABLED:
+            return "", []
+        try:
+            session = self.sessions.find_one({"_id": self.session_id(user_id, doc_id)}, {"summary": 1})
+            recent = list(
+                self.chats.find({"user_id": user_id, "doc_id": doc_id}, {"question": 1, "answer": 1})
+                .sort("_id", DESCENDING)
+                .limit(self.turns)
+            )
+        except Exception as e:
+            logging.error(f"Loading conversation memory failed: {e}")
+            return "", []
+        recent.reverse()
+        return (session or {}).get("summary", ""), recent
+
+    def record_turn(self, user_id, doc_id):
+        """Schedule folding turns that left the verbatim window into the summary."""
+        if not CHAT_MEMORY_ENABLED:
+            return
+        if self.workers <= 0:
+            self.update_summary(user_id, doc_id)
+            return
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="chat-memory")
+        self._pool.submit(self.update_summary, user_id, doc_id)
+
+    def update_summary(self, user_id, doc_id):
+        """Fold unsummarized turns older than the verbatim window into the summary; returns turns folded."""
+        session_id = self.session_id(user_id, doc_id)
+        try:
+            session = self.sessions.find_one({"_id": session_id}) or {}
+            query = {"user_id": user_id, "doc_id": doc_id}
+            # The oldest turn still shown verbatim bounds what may be summarized
+            window = list(
+                self.chats.find(query, {"_id": 1}).sort("_id", DESCENDING).skip(self.turns - 1).limit(1)
+            ) if self.turns > 0 else []
+            if self.turns > 0 and not window:
+                return 0
+            id_range = {}
+            if window:
+                id_range["$lt"] = window[0]["_id"]
+            if session.get("summarized_through"):
+                id_range["$gt"] = session["summarized_through"]
+            if id_range:
+                query["_id"] = id_range
+            pending = list(
+                self.chats.find(query, {"question": 1, "answer": 1})
+                .sort("_id", ASCENDING)
+                .limit(CHAT_MEMORY_FOLD_MAX)
+            )
+        except Exception as e:
+            logging.error(f"Loading conversation memory failed: {e}")
+            return 0
+        if not pending:
+            return 0
+
+        prompt = SUMMARY_PROMPT.format(
+            words=int(CHAT_MEMORY_SUMMARY_TOKENS * 0.75),
+            summary=session.get("summary") or "(none yet)",
+            turns="\n\n".join(format_turn(turn) for turn in pending),
+        )
+        try:
+            summary = truncate_to_tokens(self.complete(prompt).strip(), CHAT_MEMORY_SUMMARY_TOKENS)
+        except Exception as e:
+            # The turns stay unsummarized and are folded in on the next update
+            logging.error(f"Summarizing conversation {session_id} failed: {e}")
+            return 0
+
+        # Only apply the update if no concurrent one moved the session on meanwhile
+        try:
+            self.sessions.update_one(
+                {"_id": session_id, "summarized_through": session.get("summarized_through")},
+                {"$set": {
+                    "user_id": user_id,
+                    "doc_id": doc_id,
+                    "summary": summary,
+                    "summarized_through": pending[-1]["_id"],
+                    "updated_at": datetime.utcnow(),
+                }},
+                upsert=not session,
+            )
+        except DuplicateKeyError:
+            # A concurrent update created the session first; the next update folds these turns
+            return 0
+        except Exception as e:
+            logging.error(f"Saving conversation memory {session_id} failed: {e}")
+            return 0
+        return len(pending)
+
+    def forget(self, user_id, doc_id=None):
+        """Drop the conversation state for one document, or for all of the user's documents."""
+        if doc_id is None:
+            self.sessions.delete_many({"user_id": user_id})
+        else:
+            self.sessions.delete_one({"_id": self.session_id(user_id, doc_id)})
@@ -0,0 +1,168 @@
+import contextlib
+import contextvars
+import logging
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+# Export each chat request as an OpenTelemetry trace (one span per stage) when enabled
+OTEL_TRACES_ENABLED = os.getenv("OTEL_TRACES_ENABLED", "false").lower() == "true"
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+REQUEST_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+CHAT_STAGE_SECONDS = Histogram(
+    "chat_stage_seconds",
+    "Time spent in each stage of the chat pipeline.",
+    ["endpoint", "stage", "strategy"],
+    buckets=STAGE_BUCKETS
+)
+CHAT_REQUEST_SECONDS = Histogram(
+    "chat_request_seconds",
+    "End-to-end chat request time.",
+    ["endpoint", "strategy"],
+    buckets=REQUEST_BUCKETS
+)
+
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_seconds",
+    "CPU time of one bcrypt hash or verify in the password worker pool.",
+    ["operation"],
+    buckets=STAGE_BUCKETS
+)
+PASSWORD_WAIT_SECONDS = Histogram(
+    "password_wait_seconds",
+    "Time a password operation waited for a pool worker.",
+    ["operation"],
+    buckets=STAGE_BUCKETS
+)
+PASSWORD_REJECTED = Counter(
+    "password_rejected",
+    "Password operations refused because too many were pending.",
+    ["operation"]
+)
+
+ANSWER_CACHE_LOOKUPS = Counter(
+    "answer_cache_lookups",
+    "Answer cache lookups by result (exact_hit, similar_hit or miss).",
+    ["result"]
+)
+
+_current_trace = contextvars.ContextVar("chat_trace", default=None)
+_tracer = None
+
+
+def _get_tracer():
+    """Return an OpenTelemetry tracer, configuring an OTLP exporter if the SDK is installed."""
+    global _tracer
+    if _tracer is None:
+        from opentelemetry import trace
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "csm-chat-backend")}))
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            trace.set_tracer_provider(provider)
+        except ImportError:
+            # Fall back to whatever provider the deployment installed (e.g. opentelemetry-instrument)
+            logging.warning("OpenTelemetry SDK/OTLP exporter not installed; using the global tracer provider")
+        _tracer = trace.get_tracer("csm_chat.chat")
+    return _tracer
+
+
+class ChatTrace:
+    """
+    Timing spans for one chat request. Stages are recorded as they run; the
+    search strategy is only known part-way through, so everything is exported
+    (labelled with the final strategy) when the trace finishes.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.strategy = "unknown"
+        self.spans = []  # (stage, start_time_ns, seconds)
+        self.start_ns = time.time_ns()
+        self.started = time.perf_counter()
+        self.finished = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start_ns = time.time_ns()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((name, start_ns, time.perf_counter() - started))
+
+    def record(self, name, start_ns, seconds):
+        """Record a stage timed by the caller (e.g. time to first streamed token)."""
+        self.spans.append((name, start_ns, seconds))
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        total = time.perf_counter() - self.started
+        for name, _, seconds in self.spans:
+            CHAT_STAGE_SECONDS.labels(self.endpoint, name, self.strategy).observe(seconds)
+        CHAT_REQUEST_SECONDS.labels(self.endpoint, self.strategy).observe(total)
+        if OTEL_TRACES_ENABLED:
+            try:
+                self._export_otel(total)
+            except Exception as e:
+                logging.error(f"Failed to export chat trace: {e}")
+
+    def _export_otel(self, total):
+        from opentelemetry import trace
+        tracer = _get_tracer()
+        attributes = {"chat.endpoint": self.endpoint, "chat.search_strategy": self.strategy}
+        root = tracer.start_span(f"chat {self.endpoint}", start_time=self.start_ns, attributes=attributes)
+        context = trace.set_span_in_context(root)
+        for name, start_ns, seconds in self.spans:
+            span = tracer.start_span(name, context=context, start_time=start_ns, attributes=attributes)
+            span.end(end_time=start_ns + int(seconds * 1e9))
+        root.end(end_time=self.start_ns + int(total * 1e9))
+
+
+def start_chat_trace(endpoint):
+    trace = ChatTrace(endpoint)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def finish_chat_trace():
+    """Export and clear the current request's trace, if any (called on request teardown)."""
+    trace = _current_trace.get()
+    if trace is not None:
+        _current_trace.set(None)
+        trace.finish()
+
+
+def set_strategy(strategy):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.strategy = strategy
+
+
+def stage(name):
+    """Time a block as a stage of the current chat trace; a no-op outside chat requests."""
+    trace = _current_trace.get()
+    if trace is None:
+        return contextlib.nullcontext()
+    return trace.stage(name)
+
+
+def render_metrics():
+    """Return (body, content_type) for the /metrics endpoint, aggregating workers in multiprocess mode."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,107 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from .metrics import PASSWORD_HASH_SECONDS, PASSWORD_REJECTED, PASSWORD_WAIT_SECONDS
+from .utils import pwd_context
+
+# bcrypt runs in its own processes so a login spike cannot starve request threads
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+# Hash/verify calls allowed in flight (running + queued); beyond this callers get a 429
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", str(PASSWORD_WORKERS * 8)))
+PASSWORD_TIMEOUT = float(os.getenv("PASSWORD_TIMEOUT", "10"))
+
+
+class PasswordServiceBusy(Exception):
+    """Too many password operations are pending; the client should retry later."""
+
+
+def _timed_hash(password):
+    started = time.perf_counter()
+    hashed = pwd_context.hash(password)
+    return hashed, time.perf_counter() - started
+
+
+def _timed_verify_and_update(password, hashed):
+    started = time.perf_counter()
+    if not hashed:
+        return (False, None), time.perf_counter() - started
+    # Returns a new hash when the stored one uses outdated settings (e.g. fewer BCRYPT_ROUNDS)
+    return pwd_context.verify_and_update(password, hashed), time.perf_counter() - started
+
+
+class PasswordHasher:
+    """
+    bcrypt hashing and verification on a spawn-based process pool with a
+    bounded number of pending calls. When the bound is reached calls fail
+    fast with PasswordServiceBusy instead of queueing behind a login storm.
+    With workers=0 the work runs on the calling thread.
+    """
+
+    def __init__(self, workers=PASSWORD_WORKERS, max_pending=PASSWORD_MAX_PENDING):
+        self.workers = workers
+        self.slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn, not fork: the web process is multi-threaded
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def _reset_pool(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, operation, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            PASSWORD_REJECTED.labels(operation).inc()
+            raise PasswordServiceBusy(f"Too many pending password {operation} requests")
+        started = time.perf_counter()
+        acquired = True
+        try:
+            if self.workers <= 0:
+                result, seconds = fn(*args)
+            else:
+                pool = self._get_pool()
+                future = pool.submit(fn, *args)
+                try:
+                    result, seconds = future.result(timeout=PASSWORD_TIMEOUT)
+                except FutureTimeoutError:
+                    if not future.cancel():
+                        # Already running: keep its slot until the worker is done with it
+                        future.add_done_callback(lambda _: self.slots.release())
+                        acquired = False
+                    PASSWORD_REJECTED.labels(operation).inc()
+                    raise PasswordServiceBusy(f"Password {operation} timed out after {PASSWORD_TIMEOUT}s")
+                except BrokenProcessPool:
+                    logging.error("Password worker pool broke; restarting it")
+                    self._reset_pool(pool)
+                    raise
+        finally:
+            if acquired:
+                self.slots.release()
+        PASSWORD_HASH_SECONDS.labels(operation).observe(seconds)
+        PASSWORD_WAIT_SECONDS.labels(operation).observe(max(0.0, time.perf_counter() - started - seconds))
+        return result
+
+    def hash(self, password):
+        return self._run("hash", _timed_hash, password)
+
+    def verify_and_update(self, password, hashed):
+        """Return (verified, new_hash); new_hash is set when the stored hash should be replaced."""
+        return self._run("verify", _timed_verify_and_update, password, hashed)
+
+
+password_hasher = PasswordHasher()
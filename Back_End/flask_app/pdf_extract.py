@@ -0,0 +1,119 @@
+import bisect
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import PyPDF2
+
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_SHARD = int(os.getenv("PDF_PAGES_PER_SHARD", "25"))
+# Small PDFs are cheaper to extract in-process than to ship to the pool
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the web/ingestion process is multi-threaded
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def clean_page_text(text):
+    return re.sub(r'\s+', ' ', text or '').strip()
+
+
+def extract_page_range(path, start, end):
+    """Extract pages [start, end) of the PDF at `path`; runs inside pool workers."""
+    reader = PyPDF2.PdfReader(path)
+    return [(idx, clean_page_text(reader.pages[idx].extract_text())) for idx in range(start, end)]
+
+
+def iter_pdf_pages(path, workers=PDF_EXTRACT_WORKERS, shard_size=PDF_PAGES_PER_SHARD):
+    """
+    Yield (page_index, cleaned_text) for every page of the PDF at `path`, in
+    page order. Large PDFs are split into page-range shards extracted in a
+    process pool; shards are yielded as soon as they (and all earlier ones)
+    are done, so consumers can start before extraction finishes.
+    """
+    reader = PyPDF2.PdfReader(path)
+    page_count = len(reader.pages)
+    if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+        for idx, page in enumerate(reader.pages):
+            yield idx, clean_page_text(page.extract_text())
+        return
+
+    shards = [(start, min(start + shard_size, page_count)) for start in range(0, page_count, shard_size)]
+    pool = _get_pool()
+    futures = [pool.submit(extract_page_range, path, start, end) for start, end in shards]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def iter_pdf_text(path, page_offsets, workers=PDF_EXTRACT_WORKERS):
+    """
+    Yield the text of the PDF at `path` in pieces as pages are extracted:
+    each non-empty page, with a blank line between pages. Each page's
+    {"page", "start", "end"} character range (1-based page numbers) is
+    appended to `page_offsets` before the page is yielded, so a consumer
+    such as the chunker can map spans to pages while extraction continues.
+    """
+    position = 0
+    for idx, page_text in iter_pdf_pages(path, workers=workers):
+        if not page_text:
+            continue
+        if position:
+            yield "\n\n"
+            position += 2
+        page_offsets.append({"page": idx + 1, "start": position, "end": position + len(page_text)})
+        yield page_text
+        position += len(page_text)
+
+
+def extract_pdf_text(path, workers=PDF_EXTRACT_WORKERS):
+    """
+    Return (text, page_offsets) for the PDF at `path`. Non-empty pages are
+    joined with blank lines; page_offsets lists {"page", "start", "end"}
+    character ranges (1-based page numbers) within the returned text.
+    """
+    page_offsets = []
+    text = "".join(iter_pdf_text(path, page_offsets, workers=workers))
+    return text, page_offsets
+
+
+def extract_pdf_text_from_stream(file_stream, workers=PDF_EXTRACT_WORKERS):
+    """Like extract_pdf_text for file-like objects; spills to a temp file so pool workers can read it."""
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+        shutil.copyfileobj(file_stream, tmp)
+        tmp.flush()
+        return extract_pdf_text(tmp.name, workers=workers)
+
+
+def pages_for_span(page_offsets, start, end):
+    """Return the 1-based page numbers overlapping characters [start, end) of the extracted text."""
+    if not page_offsets:
+        return []
+    starts = [offset["start"] for offset in page_offsets]
+    first = max(bisect.bisect_right(starts, start) - 1, 0)
+    pages = []
+    for offset in page_offsets[first:]:
+        if offset["start"] >= end:
+            break
+        if offset["end"] > start:
+            pages.append(offset["page"])
+    return pages
@@ -0,0 +1,52 @@
+import json
+import logging
+import os
+
+from bson import ObjectId
+
+# Defaults for every user; the user's plan and then the user record's `quotas`
+# field may override any of them. A limit of 0 means unlimited.
+QUOTA_DEFAULTS = {
+    "max_documents": int(os.getenv("QUOTA_MAX_DOCUMENTS", "3")),
+    "max_bulk_files": int(os.getenv("QUOTA_MAX_BULK_FILES", "3")),
+    "max_document_chunks": int(os.getenv("QUOTA_MAX_DOCUMENT_CHUNKS", "20000")),
+}
+
+DEFAULT_PLAN = os.getenv("DEFAULT_PLAN", "free")
+PLAN_QUOTAS = {
+    "free": {},
+    "pro": {"max_documents": 100, "max_bulk_files": 50},
+    "enterprise": {"max_documents": 0, "max_bulk_files": 500},
+}
+# e.g. QUOTA_PLANS='{"pro": {"max_documents": 250}, "team": {"max_documents": 1000}}'
+try:
+    for _plan, _quotas in json.loads(os.getenv("QUOTA_PLANS", "{}")).items():
+        PLAN_QUOTAS.setdefault(_plan, {}).update(_quotas)
+except (ValueError, AttributeError) as e:
+    logging.error(f"Ignoring invalid QUOTA_PLANS: {e}")
+
+
+def get_quotas(users, user_id):
+    """Return the effective quotas for `user_id`."""
+    try:
+        user = users.find_one({"_id": ObjectId(user_id)}, {"plan": 1, "quotas": 1})
+    except Exception:
+        user = None
+    user = user or {}
+    quotas = dict(QUOTA_DEFAULTS)
+    plan = user.get("plan") or DEFAULT_PLAN
+    if plan not in PLAN_QUOTAS:
+        logging.warning(f"User {user_id} has unknown plan {plan!r}; using the defaults")
+    quotas.update(PLAN_QUOTAS.get(plan, {}))
+    if user.get("quotas"):
+        quotas.update(user["quotas"])
+    quotas["plan"] = plan
+    return quotas
+
+
+def remaining(quotas, key, used):
+    """How many more of `key` may be used, or None if unlimited."""
+    limit = quotas.get(key) or 0
+    if limit <= 0:
+        return None
+    return max(0, limit - used)
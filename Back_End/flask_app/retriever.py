@@ -0,0 +1,143 @@
+import logging
+import math
+import os
+import re
+from collections import Counter
+
+from pymongo import InsertOne
+
+from .metrics import stage
+
+# Number of candidates taken from each ranker before fusion, and chunks returned
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "10"))
+# Standard constants for BM25 and reciprocal rank fusion
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from had has have how i if in into is it its
+me my no not of on or our so than that the their them then there these they this to too
+us was we were what when where which who why will with you your
+""".split())
+
+
+def tokenize(text):
+    return [term for term in re.findall(r"\w+", text.lower()) if term not in STOPWORDS]
+
+
+def index_chunk_terms(terms_collection, doc_id, user_id, chunks):
+    """
+    Build the BM25 inverted index for a document's chunks: one record per chunk
+    holding its term frequencies, with `terms` indexed for posting lookups.
+    Returns the corpus stats to store on the document record.
+    """
+    records = []
+    total_length = 0
+    for idx, chunk in enumerate(chunks):
+        terms = tokenize(chunk)
+        if not terms:
+            continue
+        tf = Counter(terms)
+        total_length += len(terms)
+        records.append(InsertOne({
+            "doc_id": doc_id,
+            "user_id": user_id,
+            "chunk_index": idx,
+            "length": len(terms),
+            "terms": list(tf),
+            "tf": dict(tf),
+        }))
+    if records:
+        terms_collection.bulk_write(records, ordered=False)
+    return {
+        "chunk_count": len(records),
+        "avg_length": total_length / len(records) if records else 0.0,
+    }
+
+
+def bm25_search(terms_collection, doc_id, question, stats, limit=RETRIEVAL_CANDIDATES):
+    """Return [(chunk_index, score)] for the best BM25 matches, best first."""
+    query_terms = list(dict.fromkeys(tokenize(question)))
+    if not query_terms or not stats or not stats.get("chunk_count"):
+        return []
+    postings = list(terms_collection.find(
+        {"doc_id": doc_id, "terms": {"$in": query_terms}},
+        {"chunk_index": 1, "length": 1, **{f"tf.{term}": 1 for term in query_terms}}
+    ))
+    n_chunks = stats["chunk_count"]
+    avg_length = stats["avg_length"] or 1.0
+    df = Counter(term for posting in postings for term in posting.get("tf", {}))
+
+    scored = []
+    for posting in postings:
+        tf = posting.get("tf", {})
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * posting["length"] / avg_length)
+        score = 0.0
+        for term, freq in tf.items():
+            idf = math.log(1 + (n_chunks - df[term] + 0.5) / (df[term] + 0.5))
+            score += idf * freq * (BM25_K1 + 1) / (freq + norm)
+        scored.append((posting["chunk_index"], score))
+    scored.sort(key=lambda item: (-item[1], item[0]))
+    return scored[:limit]
+
+
+def vector_search(collection, question_embedding, doc_id, user_id, limit=RETRIEVAL_CANDIDATES):
+    """Return [(chunk_index, text)] for the nearest chunks, best first."""
+    results = collection.query(
+        query_embeddings=[question_embedding],
+        n_results=limit,
+        where={"$and": [{"doc_id": doc_id}, {"user_id": user_id}]}
+    )
+    if not results or not results["documents"] or not results["documents"][0]:
+        return []
+    return [
+        (metadata["chunk_index"], text)
+        for metadata, text in zip(results["metadatas"][0], results["documents"][0])
+    ]
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuse ranked lists of chunk indices; ties keep document order."""
+    scores = Counter()
+    for ranking in rankings:
+        for rank, chunk_index in enumerate(ranking):
+            scores[chunk_index] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda chunk_index: (-scores[chunk_index], chunk_index))
+
+
+def hybrid_search(collection, terms_collection, doc, user_id, question, question_embedding, top_k=RETRIEVAL_TOP_K):
+    """
+    Rank a document's chunks for `question` by fusing vector similarity and
+    BM25 with reciprocal rank fusion. Returns [{"chunk_index", "text"}] in
+    rank order, without duplicates.
+    """
+    doc_id = str(doc["_id"])
+    texts = {}
+    rankings = []
+
+    if question_embedding is not None:
+        try:
+            with stage("chroma_query"):
+                vector_hits = vector_search(collection, question_embedding, doc_id, user_id)
+            texts.update(vector_hits)
+            rankings.append([chunk_index for chunk_index, _ in vector_hits])
+        except Exception as e:
+            logging.error(f"Vector search failed: {e}")
+    try:
+        with stage("keyword_scan"):
+            keyword_hits = bm25_search(terms_collection, doc_id, question, doc.get("bm25"))
+        rankings.append([chunk_index for chunk_index, _ in keyword_hits])
+    except Exception as e:
+        logging.error(f"BM25 search failed: {e}")
+
+    ranked = reciprocal_rank_fusion(rankings)[:top_k]
+    missing = [chunk_index for chunk_index in ranked if chunk_index not in texts]
+    if missing:
+        # Keyword-only hits: fetch their text by id in one call
+        with stage("chroma_get"):
+            fetched = collection.get(ids=[f"{doc_id}_chunk_{chunk_index}" for chunk_index in missing])
+        for metadata, text in zip(fetched["metadatas"], fetched["documents"]):
+            texts[metadata["chunk_index"]] = text
+    return [{"chunk_index": chunk_index, "text": texts[chunk_index]} for chunk_index in ranked if chunk_index in texts]
@@ -0,0 +1,163 @@
+"""
+Mongo indexes for every collection the app queries, and a query-plan audit:
+
+    python -m flask_app.schema --ensure     # create missing indexes
+    python -m flask_app.schema --explain    # explain each query shape, flag COLLSCANs
+
+The audit exits non-zero if any query shape needs a collection scan.
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+MONGODB_DB = os.getenv("MONGODB_DB", "customer_bot_db")
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("username", ASCENDING)], unique=True),
+    ],
+    "documents": [
+        IndexModel([("user_id", ASCENDING), ("batch_id", ASCENDING)]),
+        IndexModel([("processed", ASCENDING)]),
+    ],
+    "chats": [
+        IndexModel([("user_id", ASCENDING), ("doc_id", ASCENDING), ("_id", ASCENDING)]),
+    ],
+    "chat_memory": [
+        IndexModel([("user_id", ASCENDING)]),
+    ],
+    "password_resets": [
+        IndexModel([("email", ASCENDING)], unique=True),
+        # Mongo deletes OTPs once expires_at has passed
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "chunk_terms": [
+        IndexModel([("doc_id", ASCENDING), ("terms", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING)]),
+    ],
+    "ingest_jobs": [
+        IndexModel([("status", ASCENDING), ("kind", ASCENDING), ("created_at", ASCENDING)]),
+        IndexModel([("kind", ASCENDING), ("doc_id", ASCENDING), ("status", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING)]),
+    ],
+    "answer_cache": [
+        IndexModel([("doc_id", ASCENDING), ("question_key", ASCENDING)]),
+        IndexModel([("doc_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("user_id", ASCENDING)]),
+    ],
+    "embedding_cache": [
+        # Eviction scans by recency
+        IndexModel([("last_used", ASCENDING)]),
+    ],
+    "revoked_tokens": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "blobs.files": [
+        IndexModel([("metadata.sha256", ASCENDING)]),
+    ],
+}
+
+_user_id = str(ObjectId())
+_doc_id = str(ObjectId())
+# (collection, filter, sort) for every query shape in app.py and the modules it uses
+QUERY_SHAPES = [
+    ("users", {"_id": ObjectId()}, None),
+    ("users", {"email": "user@example.com"}, None),
+    ("users", {"$or": [{"email": "user@example.com"}, {"username": "user"}]}, None),
+    ("documents", {"_id": ObjectId(), "user_id": _user_id}, None),
+    ("documents", {"user_id": _user_id}, None),
+    ("documents", {"user_id": _user_id, "podcast_audio": {"$exists": True}}, None),
+    ("documents", {"user_id": _user_id, "batch_id": str(ObjectId())}, None),
+    ("documents", {"processed": True}, None),
+    ("chats", {"user_id": _user_id, "doc_id": _doc_id}, [("_id", DESCENDING)]),
+    ("chats", {"user_id": _user_id, "doc_id": _doc_id, "_id": {"$lt": ObjectId()}}, [("_id", DESCENDING)]),
+    ("chats", {"user_id": _user_id, "doc_id": _doc_id, "_id": {"$gt": ObjectId()}}, [("_id", ASCENDING)]),
+    ("chats", {"user_id": _user_id}, None),
+    ("chat_memory", {"_id": f"{_user_id}:{_doc_id}"}, None),
+    ("chat_memory", {"user_id": _user_id}, None),
+    ("password_resets", {"email": "user@example.com", "expires_at": {"$gt": datetime.utcnow()}}, None),
+    ("chunk_terms", {"doc_id": _doc_id, "terms": {"$in": ["refund", "policy"]}}, None),
+    ("chunk_terms", {"doc_id": _doc_id}, None),
+    ("chunk_terms", {"user_id": _user_id}, None),
+    ("ingest_jobs", {"status": "queued", "kind": {"$in": ["ingest", "reindex"]}}, [("created_at", ASCENDING)]),
+    ("ingest_jobs", {"status": "running", "updated_at": {"$lt": datetime.utcnow()}}, None),
+    ("ingest_jobs", {"kind": {"$in": ["ingest", "reingest", "reindex"]}, "doc_id": _doc_id, "status": {"$in": ["queued", "running"]}}, None),
+    ("ingest_jobs", {"_id": ObjectId(), "user_id": _user_id}, None),
+    ("ingest_jobs", {"user_id": _user_id}, None),
+    ("answer_cache", {"doc_id": _doc_id, "question_key": "0" * 64, "created_at": {"$gte": datetime.utcnow()}}, None),
+    ("answer_cache", {"doc_id": _doc_id, "model": "model", "created_at": {"$gte": datetime.utcnow()}}, [("created_at", DESCENDING)]),
+    ("answer_cache", {"user_id": _user_id}, None),
+    ("embedding_cache", {"_id": {"$in": ["model:hash"]}}, None),
+    ("embedding_cache", {}, [("last_used", ASCENDING)]),
+    ("url_cache", {"_id": "https://example.com/"}, None),
+    ("revoked_tokens", {"expires_at": {"$gt": datetime.utcnow()}}, None),
+    ("blobs.files", {"metadata.sha256": "0" * 64}, None),
+]
+
+
+def ensure_indexes(db):
+    """Create any missing indexes; failures (e.g. duplicate emails blocking a unique index) are logged."""
+    for collection, models in INDEXES.items():
+        for model in models:
+            try:
+                db[collection].create_indexes([model])
+            except Exception as e:
+                logging.error(f"Could not create index {model.document['key']} on {collection}: {e}")
+
+
+def _plan_stages(plan):
+    yield plan.get("stage")
+    if "inputStage" in plan:
+        yield from _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+def explain_query_shapes(db):
+    """Return [(collection, filter, sort, stages)] with the winning plan's stages for each query shape."""
+    results = []
+    for collection, query, sort in QUERY_SHAPES:
+        command = {"find": collection, "filter": query}
+        if sort:
+            command["sort"] = dict(sort)
+        explained = db.command("explain", command, verbosity="queryPlanner")
+        stages = list(_plan_stages(explained["queryPlanner"]["winningPlan"]))
+        results.append((collection, query, sort, stages))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ensure", action="store_true", help="Create missing indexes first.")
+    parser.add_argument("--explain", action="store_true", help="Explain every query shape and flag COLLSCANs.")
+    args = parser.parse_args()
+
+    import certifi
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    client = MongoClient(os.getenv("MONGODB_URL", "mongodb://localhost:27017"), tlsCAFile=certifi.where())
+    db = client[os.getenv("MONGODB_DB", MONGODB_DB)]
+
+    if args.ensure:
+        ensure_indexes(db)
+    if not args.explain:
+        return 0
+    scans = 0
+    for collection, query, sort, stages in explain_query_shapes(db):
+        flagged = "COLLSCAN" in stages
+        scans += flagged
+        print(f"{'COLLSCAN' if flagged else 'ok':8} {collection:16} {' <- '.join(stages):40} {query}{f' sort={sort}' if sort else ''}")
+    print(f"{scans} of {len(QUERY_SHAPES)} query shapes need a collection scan")
+    return 1 if scans else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,9 +15,14 @@ class DocumentCreate(BaseModel):
     name: str
     type: Literal['pdf', 'doc', 'url']
     url: Optional[HttpUrl] = None
+    # Also ingest same-site pages linked from `url` (e.g. a help center)
+    crawl: Optional[bool] = False
     content: Optional[str] = None
     uploaded_at: Optional[str] = None
     processed: Optional[bool] = False
+    progress: Optional[int] = 0
+    status: Optional[str] = None
+    job_id: Optional[str] = None
 
 class ChatMessage(BaseModel):
     user_id: str
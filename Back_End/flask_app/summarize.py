@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import os
+
+from .chunker import iter_chunks
+from .llm import llm
+
+# Documents above this many words also get a map-reduce summary indexed alongside their chunks
+SUMMARY_MIN_WORDS = int(os.getenv("SUMMARY_MIN_WORDS", "10000"))
+SUMMARY_GROUP_WORDS = int(os.getenv("SUMMARY_GROUP_WORDS", "3000"))
+SUMMARY_REDUCE_FAN_IN = int(os.getenv("SUMMARY_REDUCE_FAN_IN", "6"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+# Re-ingestion keeps the stored summary until this share of sentences changed since it was written
+SUMMARY_REFRESH_RATIO = float(os.getenv("SUMMARY_REFRESH_RATIO", "0.2"))
+
+MAP_PROMPT = """
+Please provide a comprehensive summary of the following section of a larger document,
+preserving all important information, key points, and details that would be needed
+to answer questions about the content.
+Focus on factual information, procedures, definitions, and important concepts.
+Make the summary detailed but concise.
+
+Section content:
+"""
+
+REDUCE_PROMPT = """
+The following are summaries of consecutive sections of one document.
+Combine them into a single comprehensive summary of the whole document, preserving
+the important information, key points, procedures and definitions, and removing repetition.
+
+Section summaries:
+"""
+
+
+async def _summarize_all(texts, prompt, complete, limit):
+    """Summarize each text concurrently, dropping the ones that fail."""
+    async def summarize(text):
+        async with limit:
+            try:
+                return await complete(prompt + text)
+            except Exception as e:
+                logging.error(f"Summarizing a {len(text.split())}-word section failed: {e}")
+                return None
+
+    summaries = await asyncio.gather(*(summarize(text) for text in texts))
+    return [summary for summary in summaries if summary]
+
+
+async def amap_reduce_summary(content, complete, group_words=SUMMARY_GROUP_WORDS,
+                              fan_in=SUMMARY_REDUCE_FAN_IN, concurrency=SUMMARY_CONCURRENCY):
+    """
+    Summarize a document of any length: split it into ~group_words sections,
+    summarize them concurrently (at most `concurrency` requests in flight),
+    then merge summaries `fan_in` at a time until one remains.
+    `complete(prompt)` is a coroutine returning the model's reply.
+    Returns "" if nothing could be summarized.
+    """
+    sections = [chunk["text"] for chunk in iter_chunks(content, chunk_size=group_words, overlap=0, min_chars=0)]
+    limit = asyncio.Semaphore(concurrency)
+    summaries = await _summarize_all(sections, MAP_PROMPT, complete, limit)
+    level = 1
+    while len(summaries) > 1:
+        logging.info(f"Reducing {len(summaries)} summaries (level {level})")
+        groups = ["\n\n".join(summaries[i:i + fan_in]) for i in range(0, len(summaries), fan_in)]
+        summaries = await _summarize_all(groups, REDUCE_PROMPT, complete, limit)
+        level += 1
+    return summaries[0] if summaries else ""
+
+
+def map_reduce_summary(content, complete, **kwargs):
+    """Blocking wrapper around amap_reduce_summary, run on the LLM gateway's event loop."""
+    return llm.run(amap_reduce_summary(content, complete, **kwargs))
@@ -0,0 +1,53 @@
+import functools
+import logging
+
+import tiktoken
+
+from .utils import estimate_tokens
+
+CHAT_MODEL = "gpt-4o-mini"
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoder(model=CHAT_MODEL):
+    """
+    Return the (cached) BPE encoder for `model`, or None if it cannot be loaded
+    (tiktoken fetches encoding files on first use, which can fail offline).
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logging.error(f"Could not load tokenizer for {model}, falling back to estimates: {e}")
+        return None
+
+
+def count_tokens(text, model=CHAT_MODEL):
+    encoder = get_encoder(model)
+    if encoder is None:
+        return estimate_tokens(text)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens, model=CHAT_MODEL):
+    """Cut `text` to at most `max_tokens` tokens, preferring to end on a sentence or word."""
+    if max_tokens <= 0:
+        return ""
+    encoder = get_encoder(model)
+    if encoder is None:
+        max_chars = max_tokens * 4
+        if len(text) <= max_chars:
+            return text
+        truncated = text[:max_chars]
+    else:
+        tokens = encoder.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        truncated = encoder.decode(tokens[:max_tokens])
+    for boundary in ('\n\n', '. ', ' '):
+        cut = truncated.rfind(boundary)
+        # Only back off to a boundary if it keeps most of the text
+        if cut > len(truncated) * 0.8:
+            return truncated[:cut + len(boundary)].rstrip()
+    return truncated
@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+
+import chromadb
+from chromadb.config import Settings
+
+from .embedding_providers import collection_tag, get_embedding_provider
+
+# "persistent" keeps vectors on local disk; use "http" (a Chroma server) when several
+# processes (web tier + ingestion workers) share the store. "memory" is for tests.
+CHROMA_MODE = os.getenv("CHROMA_MODE", "persistent")
+CHROMA_PATH = os.getenv("CHROMA_PATH", os.path.join(os.path.dirname(__file__), '../chroma_db'))
+CHROMA_HOST = os.getenv("CHROMA_HOST", "localhost")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+CHROMA_SSL = os.getenv("CHROMA_SSL", "false").lower() == "true"
+CHROMA_COLLECTION_PREFIX = os.getenv("CHROMA_COLLECTION_PREFIX", "documents")
+
+# HNSW index parameters, applied when a tenant's collection is created
+CHROMA_HNSW_SPACE = os.getenv("CHROMA_HNSW_SPACE", "l2")
+CHROMA_HNSW_M = int(os.getenv("CHROMA_HNSW_M", "16"))
+CHROMA_HNSW_CONSTRUCTION_EF = int(os.getenv("CHROMA_HNSW_CONSTRUCTION_EF", "100"))
+CHROMA_HNSW_SEARCH_EF = int(os.getenv("CHROMA_HNSW_SEARCH_EF", "100"))
+
+
+def create_chroma_client(mode=CHROMA_MODE):
+    settings = Settings(anonymized_telemetry=False)
+    if mode == "http":
+        return chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT, ssl=CHROMA_SSL, settings=settings)
+    if mode == "memory":
+        return chromadb.EphemeralClient(settings=settings)
+    return chromadb.PersistentClient(path=CHROMA_PATH, settings=settings)
+
+
+def collection_metadata(embedder):
+    return {
+        "embedding_model": embedder.model_id,
+        "embedding_dimension": embedder.dimension,
+        "hnsw:space": CHROMA_HNSW_SPACE,
+        "hnsw:M": CHROMA_HNSW_M,
+        "hnsw:construction_ef": CHROMA_HNSW_CONSTRUCTION_EF,
+        "hnsw:search_ef": CHROMA_HNSW_SEARCH_EF,
+    }
+
+
+class VectorStore:
+    """
+    Chunk vectors sharded into one Chroma collection per user, so queries
+    only search that tenant's HNSW index instead of filtering one global
+    collection, and deleting an account drops a whole collection.
+    Collection names include the embedding model and dimension, so switching
+    models starts fresh collections (filled by the startup re-index) instead
+    of mixing incompatible vectors.
+    """
+
+    def __init__(self, client=None, embedder=None):
+        self._client = client
+        self._embedder = embedder
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = create_chroma_client()
+            return self._client
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._embedder = get_embedding_provider()
+        return self._embedder
+
+    def collection_name(self, user_id):
+        return f"{CHROMA_COLLECTION_PREFIX}_{collection_tag(self.embedder)}_{user_id}"
+
+    def collection(self, user_id):
+        """Return (creating if needed) the collection holding `user_id`'s chunks."""
+        collection = self._collections.get(user_id)
+        if collection is None:
+            collection = self.client.get_or_create_collection(
+                self.collection_name(user_id), metadata=collection_metadata(self.embedder)
+            )
+            self._collections[user_id] = collection
+        return collection
+
+    def has_document(self, user_id, doc_id):
+        result = self.collection(user_id).get(where={"doc_id": doc_id}, limit=1, include=[])
+        return bool(result["ids"])
+
+    def delete_document(self, user_id, doc_id):
+        self.collection(user_id).delete(where={"doc_id": doc_id})
+
+    def delete_user(self, user_id):
+        """Drop the user's collections for every embedding model."""
+        self._collections.pop(user_id, None)
+        for collection in self.client.list_collections():
+            name = getattr(collection, "name", collection)
+            if name.startswith(f"{CHROMA_COLLECTION_PREFIX}_") and name.endswith(f"_{user_id}"):
+                self.client.delete_collection(name)
+                logging.info(f"Dropped vector collection {name}")
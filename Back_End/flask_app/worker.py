@@ -0,0 +1,21 @@
+"""
+Standalone ingestion worker, so ingestion can be scaled separately from the
+web tier (run the web tier with INGEST_WORKERS=0):
+
+    python -m flask_app.worker --workers 4
+"""
+import argparse
+
+# Importing the app does not start its workers or background services (see app.start_services)
+from .app import ingest_queue
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run document ingestion workers.")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    ingest_queue.run_forever(workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Runs the Flask app in-process on mongomock with an in-memory Chroma store,
+so the tests need neither MongoDB nor the OpenAI API:
+
+    cd Back_End && python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ.update(
+    CHROMA_MODE="memory",
+    VECTOR_CONSISTENCY_CHECK="false",
+    INGEST_WORKERS="0",
+    PASSWORD_WORKERS="0",
+    CHAT_MEMORY_WORKERS="0",
+    BCRYPT_ROUNDS="4",
+    OPENAI_API_KEY="test",
+)
+os.environ.pop("MONGODB_URL", None)
+
+import mongomock  # noqa: E402
+import mongomock.gridfs  # noqa: E402
+import pymongo  # noqa: E402
+
+from bench.loadtest import MemoryGridFSBucket, patch_mongomock_bulk_updates  # noqa: E402
+
+pymongo.MongoClient = mongomock.MongoClient
+mongomock.gridfs.enable_gridfs_integration()
+patch_mongomock_bulk_updates()
+
+from flask_app import app as appmod  # noqa: E402
+
+appmod.blob_store.bucket = MemoryGridFSBucket(appmod.blob_store.files)
+
+
+@pytest.fixture
+def app_module(monkeypatch, tmp_path):
+    """The app module with empty collections and the model calls replaced by stand-ins."""
+    for name in appmod.db.list_collection_names():
+        appmod.db.drop_collection(name)
+    appmod.blob_store.bucket = MemoryGridFSBucket(appmod.blob_store.files)
+    monkeypatch.setattr(appmod, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(appmod.answer_cache, "counters", {"exact_hits": 0, "similar_hits": 0, "misses": 0})
+    monkeypatch.setattr(appmod.llm, "embed", lambda texts, model: [[float(len(text)), 1.0, 0.0] for text in texts])
+    monkeypatch.setattr(appmod, "scan_with_gpt", lambda prompt: f"answer {len(prompt)}")
+    monkeypatch.setattr(appmod.conversation_memory, "complete", lambda prompt: "summary")
+    return appmod
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def auth_headers(client):
+    response = client.post("/register", json={"username": "alice", "email": "alice@example.com", "password": "secret"})
+    return {"Authorization": f"Bearer {response.json['access_token']}"}
+
+
+@pytest.fixture
+def doc_id(app_module, auth_headers):
+    user_id = str(app_module.db.users.find_one({"username": "alice"})["_id"])
+    content = "Refunds are paid within five days of the return arriving. " * 40
+    return str(app_module.db.documents.insert_one(
+        {"user_id": user_id, "name": "policy.txt", "content": content, "processed": True}
+    ).inserted_id)
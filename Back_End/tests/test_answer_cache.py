@@ -0,0 +1,28 @@
+import mongomock
+from prometheus_client import REGISTRY
+
+from flask_app.answer_cache import AnswerCache
+
+
+def lookups(result):
+    return REGISTRY.get_sample_value("answer_cache_lookups_total", {"result": result}) or 0.0
+
+
+def test_similar_lookup_only_matches_the_same_embedding_model():
+    cache = AnswerCache(mongomock.MongoClient().db.answer_cache)
+    cache.store("doc", "user", "How long do refunds take?", "Five days.", [0.6, 0.8, 0.0], "model-a")
+
+    assert cache.lookup_similar("doc", [0.6, 0.8, 0.0], "model-b") is None
+    assert cache.lookup_similar("doc", [0.6, 0.8, 0.0], "model-a") == "Five days."
+
+
+def test_lookups_are_exported_to_prometheus():
+    cache = AnswerCache(mongomock.MongoClient().db.answer_cache)
+    cache.store("doc", "user", "How long do refunds take?", "Five days.")
+    exact_hits, misses = lookups("exact_hit"), lookups("miss")
+
+    cache.lookup_exact("doc", "how long do refunds take")
+    cache.lookup_exact("doc", "Is shipping free?") or cache.lookup_similar("doc", None, "model-a")
+
+    assert lookups("exact_hit") == exact_hits + 1
+    assert lookups("miss") == misses + 1
@@ -0,0 +1,25 @@
+from datetime import datetime, timedelta
+
+from jose import jwt
+
+
+def test_logout_revokes_token(client, auth_headers):
+    assert client.post("/logout", headers=auth_headers).status_code == 200
+
+    assert client.get("/documents", headers=auth_headers).status_code == 401
+
+
+def test_logout_revokes_token_without_jti(app_module, client, auth_headers):
+    user_id = str(app_module.db.users.find_one({"username": "alice"})["_id"])
+    # Tokens issued before jti was added carry only sub, username and exp
+    legacy_token = jwt.encode(
+        {"sub": user_id, "username": "alice", "exp": datetime.utcnow() + timedelta(hours=1)},
+        app_module.SECRET_KEY, algorithm=app_module.ALGORITHM
+    )
+    legacy_headers = {"Authorization": f"Bearer {legacy_token}"}
+    assert client.get("/documents", headers=legacy_headers).status_code == 200
+
+    assert client.post("/logout", headers=legacy_headers).status_code == 200
+
+    assert client.get("/documents", headers=legacy_headers).status_code == 401
+    assert client.get("/documents", headers=auth_headers).status_code == 200
@@ -0,0 +1,30 @@
+from flask_app.memory import is_follow_up
+
+
+def test_repeated_question_is_served_from_cache_mid_conversation(app_module, client, auth_headers, doc_id):
+    question = {"doc_id": doc_id, "question": "How long do refunds take?"}
+    first = client.post("/chat", json=question, headers=auth_headers)
+    second = client.post("/chat", json=question, headers=auth_headers)
+
+    assert first.status_code == 200 and first.json["cached"] is False
+    assert second.status_code == 200 and second.json["cached"] is True
+    assert second.json["answer"] == first.json["answer"]
+    assert app_module.answer_cache.stats()["exact_hits"] == 1
+
+
+def test_follow_up_is_never_cached(app_module, client, auth_headers, doc_id):
+    follow_up = {"doc_id": doc_id, "question": "Does it include shipping costs?"}
+    client.post("/chat", json=follow_up, headers=auth_headers)
+    client.post("/chat", json={"doc_id": doc_id, "question": "How long do refunds take?"}, headers=auth_headers)
+    again = client.post("/chat", json=follow_up, headers=auth_headers)
+
+    assert again.json["cached"] is False
+    assert app_module.db.answer_cache.count_documents({"question": follow_up["question"]}) == 0
+
+
+def test_is_follow_up():
+    assert is_follow_up("Why?")
+    assert is_follow_up("And what about returns by mail")
+    assert is_follow_up("Can you explain it in more detail?")
+    assert not is_follow_up("How long do refunds take?")
+    assert not is_follow_up("What is the refund policy for damaged items?")
@@ -0,0 +1,45 @@
+import io
+import os
+
+from bson import ObjectId
+
+
+def test_malformed_job_id_is_not_found(client, auth_headers):
+    response = client.get("/jobs/not-an-id", headers=auth_headers)
+
+    assert response.status_code == 404
+    assert response.json == {"detail": "Job not found or not authorized."}
+
+
+def upload(client, auth_headers, text):
+    response = client.post("/upload", headers=auth_headers, content_type="multipart/form-data",
+                           data={"file": (io.BytesIO(text.encode()), "notes.txt"), "type": "doc"})
+    assert response.status_code in (200, 201, 202)
+    return response.json["_id"]
+
+
+def run_queued_jobs(app_module):
+    while (job := app_module.ingest_queue.claim()) is not None:
+        app_module.ingest_queue.run_job(job)
+
+
+def test_raw_upload_is_removed_once_ingested(app_module, client, auth_headers, tmp_path):
+    doc_id = upload(client, auth_headers, "Refunds are paid within five days of the return arriving. " * 40)
+    assert len(os.listdir(tmp_path)) == 1
+
+    run_queued_jobs(app_module)
+
+    doc = app_module.db.documents.find_one({"_id": ObjectId(doc_id)})
+    assert doc["status"] == "ready"
+    assert "raw_file" not in doc
+    assert os.listdir(tmp_path) == []
+
+
+def test_raw_upload_is_kept_when_ingestion_fails(app_module, client, auth_headers, tmp_path):
+    doc_id = upload(client, auth_headers, "Too short.")
+
+    run_queued_jobs(app_module)
+
+    doc = app_module.db.documents.find_one({"_id": ObjectId(doc_id)})
+    assert doc["status"] == "failed"
+    assert os.listdir(tmp_path) == [doc["raw_file"]]
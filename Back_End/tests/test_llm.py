@@ -0,0 +1,44 @@
+import asyncio
+
+import httpx
+import openai
+
+from flask_app import llm as llm_module
+from flask_app.llm import LLMGateway
+
+
+def test_async_calls_share_the_concurrency_slots():
+    gateway = LLMGateway(max_concurrency=2, tokens_per_minute=0)
+    running = []
+    peak = []
+
+    async def request():
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.02)
+        running.pop()
+        return "ok"
+
+    async def burst():
+        return await asyncio.gather(*(gateway._acall(request, 10) for _ in range(8)))
+
+    assert gateway.run(burst()) == ["ok"] * 8
+    assert max(peak) == 2
+
+
+def test_retries_are_charged_to_the_token_bucket(monkeypatch):
+    monkeypatch.setattr(llm_module, "LLM_BACKOFF_BASE", 0.0)
+    gateway = LLMGateway(max_concurrency=2, tokens_per_minute=60000)
+    reserved = []
+    reserve = gateway.bucket.reserve
+    monkeypatch.setattr(gateway.bucket, "reserve", lambda tokens: reserved.append(tokens) or reserve(tokens))
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise openai.APITimeoutError(request=httpx.Request("POST", "http://test/v1/chat/completions"))
+        return "ok"
+
+    assert gateway.run(gateway._acall(request, 100)) == "ok"
+    assert reserved == [100, 100, 100]
@@ -116,6 +116,8 @@ function AppContent() {
                 onSelectSession={chat.selectSession}
                 onDeleteSession={chat.deleteSession}
                 selectedDocId={selectedDocument.id}
+                hasOlderMessages={chat.hasOlderMessages}
+                onLoadOlder={chat.loadOlderMessages}
               />
             ) : (
               <div className="sticky top-[100px]  bg-white dark:bg-gray-800 rounded-xl shadow-sm border border-gray-200 dark:border-gray-700 p-12 text-center h-[530px] flex items-center justify-center transition-colors duration-200">
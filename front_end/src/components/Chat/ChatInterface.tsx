@@ -14,6 +14,8 @@ interface ChatInterfaceProps {
   onSelectSession: (sessionId: string) => void;
   onDeleteSession: (sessionId: string) => void;
   selectedDocId?: string;
+  hasOlderMessages?: boolean;
+  onLoadOlder?: () => void;
 }
 
 export const ChatInterface: React.FC<ChatInterfaceProps> = ({
@@ -25,7 +27,9 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({
   currentSessionId,
   onSelectSession,
   onDeleteSession,
-  selectedDocId
+  selectedDocId,
+  hasOlderMessages,
+  onLoadOlder
 }) => {
   const [inputMessage, setInputMessage] = useState('');
   const [showHistory, setShowHistory] = useState(false);
@@ -368,6 +372,16 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({
 
       {/* Messages */}
       <div className="flex-1 overflow-y-auto p-4 space-y-4">
+          {hasOlderMessages && onLoadOlder && (
+            <div className="text-center">
+              <button
+                onClick={onLoadOlder}
+                className="text-sm text-blue-600 dark:text-blue-400 hover:text-blue-700 dark:hover:text-blue-300 font-medium transition-colors duration-200"
+              >
+                Load earlier messages
+              </button>
+            </div>
+          )}
           {localMessages.length === 0 ? (
           <div className="text-center py-8">
             <Bot className="w-12 h-12 text-gray-400 dark:text-gray-500 mx-auto mb-4" />
@@ -77,6 +77,13 @@ export const useAuth = () => {
   };
 
   const logout = () => {
+    if (token) {
+      // Revoke the token server-side; the local session is cleared regardless
+      fetch(`${API_URL}/logout`, {
+        method: 'POST',
+        headers: { Authorization: `Bearer ${token}` },
+      }).catch(() => {});
+    }
     setUser(null);
     setToken(null);
     localStorage.removeItem('user');
@@ -1,88 +1,216 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { ChatSession, Message, Document } from '../types';
 
 const API_URL = 'http://localhost:5000';
 
+interface ChatRecord {
+  _id: string;
+  question: string;
+  answer: string;
+  timestamp: string;
+}
+
+interface HistoryPage {
+  messages: ChatRecord[];
+  has_more: boolean;
+  oldest_id: string | null;
+  newest_id: string | null;
+}
+
+interface HistoryState {
+  messages: Message[];
+  oldestId: string | null;
+  newestId: string | null;
+  hasOlder: boolean;
+}
+
+// Each stored chat is a question and its answer
+const chatsToMessages = (chats: ChatRecord[], documentId: string): Message[] =>
+  chats.flatMap((chat) => [
+    { id: chat._id, type: 'user' as const, content: chat.question, timestamp: chat.timestamp, documentId },
+    { id: `${chat._id}-bot`, type: 'bot' as const, content: chat.answer, timestamp: chat.timestamp, documentId },
+  ]);
+
 export const useChat = (userId: string, token?: string) => {
   const [chatSessions, setChatSessions] = useState<ChatSession[]>([]);
   const [currentSession, setCurrentSession] = useState<ChatSession | null>(null);
   const [isTyping, setIsTyping] = useState(false);
 
-  // Fetch chat history for a document
+  // Paging cursors and messages already loaded, per document
+  const historyRef = useRef<Record<string, HistoryState>>({});
+  const [hasOlderMessages, setHasOlderMessages] = useState(false);
+
+  useEffect(() => {
+    if (currentSession && historyRef.current[currentSession.documentId]) {
+      historyRef.current[currentSession.documentId].messages = currentSession.messages;
+    }
+  }, [currentSession]);
+
+  // Fetch one page of chat history; see GET /chat for the cursor parameters
+  const fetchHistoryPage = async (documentId: string, cursor: { after?: string; before?: string }) => {
+    const params = new URLSearchParams({ doc_id: documentId, fields: 'question,answer,timestamp' });
+    if (cursor.after) params.set('after', cursor.after);
+    if (cursor.before) params.set('before', cursor.before);
+    const response = await fetch(`${API_URL}/chat?${params}`, {
+      headers: { Authorization: `Bearer ${token}` },
+      cache: 'no-store'
+    });
+    if (!response.ok) return null;
+    return (await response.json()) as HistoryPage;
+  };
+
+  const showHistory = (document: Document, history: HistoryState) => {
+    historyRef.current[document.id] = history;
+    setHasOlderMessages(history.hasOlder);
+    setCurrentSession((session) =>
+      session && session.documentId === document.id
+        ? { ...session, messages: history.messages, updatedAt: new Date().toISOString() }
+        : session
+    );
+  };
+
+  // Load the latest messages for a document, or only the ones newer than what is already loaded
   const fetchChatHistory = async (document: Document) => {
     if (!token) return;
-    const response = await fetch(`${API_URL}/chat?doc_id=${document.id}&t=${Date.now()}`, {
-      headers: { Authorization: `Bearer ${token}` }
-    });
-    if (response.ok) {
-      const chats = await response.json();
-      console.log('Fetched chats from backend:', chats);
-      const messages: Message[] = chats.map((chat: any) => ({
-        id: chat._id,
-        type: 'user', // We'll add bot messages below
-        content: chat.question,
-        timestamp: chat.timestamp,
-        documentId: chat.doc_id
-      })).flatMap((chat: any, idx: number, arr: any[]) => [
-        chat,
-        {
-          id: ((arr[idx]._id || `bot-${idx}`) + '-bot'),
-          type: 'bot',
-          content: chats[idx].answer,
-          timestamp: chats[idx].timestamp,
-          documentId: chats[idx].doc_id
-        }
-      ]);
-      const session: ChatSession = {
-        id: document.id,
-        userId,
-        documentId: document.id,
-        messages,
-        createdAt: document.uploadedAt,
-        updatedAt: new Date().toISOString()
-      };
-      setCurrentSession({
-        ...session,
-        messages: [...session.messages], // force new array reference
+    const loaded = historyRef.current[document.id];
+    if (loaded && loaded.newestId) {
+      const page = await fetchHistoryPage(document.id, { after: loaded.newestId });
+      if (!page) return;
+      const known = new Set(loaded.messages.map((m) => m.id));
+      const added = chatsToMessages(page.messages, document.id).filter((m) => !known.has(m.id));
+      showHistory(document, {
+        ...loaded,
+        messages: [...loaded.messages, ...added],
+        newestId: page.newest_id || loaded.newestId
       });
-      console.log('setCurrentSession called with:', session);
-      setTimeout(() => {
-        console.log('After setCurrentSession, currentSession:', session);
-      }, 0);
+      // More than a page arrived since the watermark: keep appending
+      if (page.has_more) await fetchChatHistory(document);
+      return;
     }
+    const page = await fetchHistoryPage(document.id, {});
+    if (!page) return;
+    showHistory(document, {
+      messages: chatsToMessages(page.messages, document.id),
+      oldestId: page.oldest_id,
+      newestId: page.newest_id,
+      hasOlder: page.has_more
+    });
+  };
+
+  // Prepend the page of messages before the oldest one loaded
+  const loadOlderMessages = async () => {
+    if (!currentSession || !token) return;
+    const documentId = currentSession.documentId;
+    const loaded = historyRef.current[documentId];
+    if (!loaded || !loaded.hasOlder || !loaded.oldestId) return;
+    const page = await fetchHistoryPage(documentId, { before: loaded.oldestId });
+    if (!page) return;
+    const history = {
+      ...loaded,
+      messages: [...chatsToMessages(page.messages, documentId), ...loaded.messages],
+      oldestId: page.oldest_id || loaded.oldestId,
+      hasOlder: page.has_more
+    };
+    historyRef.current[documentId] = history;
+    setHasOlderMessages(history.hasOlder);
+    setCurrentSession((session) =>
+      session && session.documentId === documentId ? { ...session, messages: history.messages } : session
+    );
   };
 
   const createSession = (document: Document): ChatSession => {
-    fetchChatHistory(document);
+    const loaded = historyRef.current[document.id];
     const session: ChatSession = {
       id: document.id,
       userId,
       documentId: document.id,
-      messages: [],
+      messages: loaded ? loaded.messages : [],
       createdAt: document.uploadedAt,
       updatedAt: new Date().toISOString()
     };
     setCurrentSession(session);
+    setHasOlderMessages(loaded ? loaded.hasOlder : false);
+    fetchChatHistory(document);
     return session;
   };
 
+  // Apply an update to the messages of the current session
+  const updateMessages = (update: (messages: Message[]) => Message[]) => {
+    setCurrentSession((session) =>
+      session ? { ...session, messages: update(session.messages), updatedAt: new Date().toISOString() } : session
+    );
+  };
+
   const sendMessage = async (content: string, document: Document) => {
     if (!currentSession || !token) return;
     setIsTyping(true);
-    // Send to backend
-    const response = await fetch(`${API_URL}/chat`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-        Authorization: `Bearer ${token}`
-      },
-      body: JSON.stringify({ doc_id: document.id, question: content })
-    });
-    if (response.ok) {
-      await fetchChatHistory(document);
-      console.log('After fetchChatHistory, currentSession:', currentSession);
+    const now = new Date().toISOString();
+    const userMessageId = `user-${Date.now()}`;
+    const botMessageId = `${userMessageId}-bot`;
+    updateMessages((messages) => [
+      ...messages,
+      { id: userMessageId, type: 'user', content, timestamp: now, documentId: document.id },
+      { id: botMessageId, type: 'bot', content: '', timestamp: now, documentId: document.id },
+    ]);
+    const setBotContent = (text: string) =>
+      updateMessages((messages) => messages.map((m) => (m.id === botMessageId ? { ...m, content: text } : m)));
+
+    try {
+      // Stream the answer as server-sent events and render tokens as they arrive
+      const response = await fetch(`${API_URL}/chat/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          Accept: 'text/event-stream',
+          Authorization: `Bearer ${token}`
+        },
+        body: JSON.stringify({ doc_id: document.id, question: content })
+      });
+      if (!response.ok || !response.body) {
+        const data = await response.json().catch(() => ({}));
+        setBotContent(data.detail || 'Failed to get an answer. Please try again.');
+        return;
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let answer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop() || '';
+        for (const raw of events) {
+          const eventLine = raw.split('\n').find((line) => line.startsWith('event: '));
+          const dataLine = raw.split('\n').find((line) => line.startsWith('data: '));
+          if (!eventLine || !dataLine) continue;
+          const event = eventLine.slice('event: '.length);
+          const data = JSON.parse(dataLine.slice('data: '.length));
+          if (event === 'token') {
+            answer += data.text;
+            setBotContent(answer);
+          } else if (event === 'done') {
+            answer = data.answer;
+            // Use the stored chat id so a later incremental fetch does not add the message again
+            updateMessages((messages) =>
+              messages.map((m) =>
+                m.id === userMessageId
+                  ? { ...m, id: data.chat_id }
+                  : m.id === botMessageId
+                    ? { ...m, id: `${data.chat_id}-bot`, content: answer }
+                    : m
+              )
+            );
+          } else if (event === 'error') {
+            setBotContent(data.detail || 'Failed to get an answer. Please try again.');
+          }
+        }
+      }
+    } finally {
+      setIsTyping(false);
     }
-    setIsTyping(false);
   };
 
   const selectSession = (sessionId: string) => {
@@ -95,6 +223,8 @@ export const useChat = (userId: string, token?: string) => {
 
   const clearChat = () => {
     setCurrentSession(null);
+    historyRef.current = {};
+    setHasOlderMessages(false);
     // Add any other chat-related state resets here if needed
   };
 
@@ -102,6 +232,8 @@ export const useChat = (userId: string, token?: string) => {
     chatSessions: [], // Not used with backend
     currentSession,
     isTyping,
+    hasOlderMessages,
+    loadOlderMessages,
     createSession,
     sendMessage,
     selectSession,
@@ -24,10 +24,44 @@ const SAMPLE_DOCUMENTS: Document[] = [
   }
 ];
 
+const JOB_POLL_INTERVAL_MS = 2000;
+
 export const useDocuments = (token?: string) => {
   const [documents, setDocuments] = useState<Document[]>([]);
   const [processingDocuments, setProcessingDocuments] = useState<Set<string>>(new Set());
 
+  // Poll the ingestion job until it finishes, then mark the document processed
+  const waitForJob = async (jobId: string, docId: string) => {
+    if (!token) return;
+    setProcessingDocuments((ids) => new Set(ids).add(docId));
+    try {
+      while (true) {
+        const response = await fetch(`${API_URL}/jobs/${jobId}`, {
+          headers: { Authorization: `Bearer ${token}` }
+        });
+        if (!response.ok) break;
+        const job = await response.json();
+        if (job.status === 'succeeded' || job.status === 'failed') {
+          setDocuments((docs) =>
+            docs.map((doc) =>
+              doc.id === docId
+                ? { ...doc, processed: job.status === 'succeeded', message: job.error || doc.message }
+                : doc
+            )
+          );
+          break;
+        }
+        await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+      }
+    } finally {
+      setProcessingDocuments((ids) => {
+        const next = new Set(ids);
+        next.delete(docId);
+        return next;
+      });
+    }
+  };
+
   useEffect(() => {
     const fetchDocuments = async () => {
       if (!token) {
@@ -50,6 +84,10 @@ export const useDocuments = (token?: string) => {
             processed: doc.processed,
           }))
         );
+        // Resume tracking uploads that are still being ingested
+        docs
+          .filter((doc: any) => !doc.processed && doc.job_id && doc.status !== 'failed')
+          .forEach((doc: any) => waitForJob(doc.job_id, doc._id));
       } else {
         setDocuments([]);
       }
@@ -85,6 +123,7 @@ export const useDocuments = (token?: string) => {
       processed: data.processed ?? true,
     };
     setDocuments((docs) => [...docs, newDoc]);
+    if (data.job_id) waitForJob(data.job_id, newDoc.id);
     return { ...newDoc, message: data.message };
   };
 